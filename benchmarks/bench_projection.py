@@ -0,0 +1,74 @@
+"""
+Per 100-row page: full Form rows vs the slim FormQuerySet/AddressQuerySet
+projections used by the read endpoints.
+
+    python -m benchmarks.bench_projection
+"""
+from benchmarks.utils import benchmark_database, measure, report
+
+from django.contrib.auth.hashers import make_password
+
+from form.models import Form, Address
+from form.serializers import FormSerializer, AddressSerializer
+from form.views import serialize_referral_row
+
+PAGE = 100
+
+
+def seed():
+    password = make_password('benchmark-password')
+    referrer = Form.objects.create(
+        full_name='Referrer', last_name='Bench', email='referrer@example.com',
+        phone_number='9000000000', password=password,
+        qr_code_image='qr_codes/referrer.png',
+    )
+    Form.objects.bulk_create([
+        Form(
+            full_name=f'Bench{n}', last_name='User', email=f'bench{n}@example.com',
+            phone_number=f'8{n:09d}', password=password, referral_code=f'BENC{n:03d}',
+            qr_code_image=f'qr_codes/BENC{n:03d}_qr.png', referred_by=referrer,
+        )
+        for n in range(PAGE)
+    ])
+    Address.objects.bulk_create([
+        Address(
+            user=user, house_name='House', street_name='Street', country='India',
+            state='Kerala', pin='682001', city='Kochi',
+        )
+        for user in Form.objects.filter(referred_by=referrer)
+    ])
+    return referrer
+
+
+def main():
+    with benchmark_database():
+        referrer = seed()
+
+        report('FormListView page (FormSerializer)', [
+            ('full rows', measure(lambda: FormSerializer(
+                Form.objects.order_by('-created_at')[:PAGE], many=True).data)),
+            ('for_listing()', measure(lambda: FormSerializer(
+                Form.objects.for_listing().order_by('-created_at')[:PAGE], many=True).data)),
+        ])
+
+        report('Referral list page', [
+            ('model instances', measure(lambda: [
+                serialize_referral_row(vars(user), referrer.full_name)
+                for user in referrer.referrals.order_by('-created_at')[:PAGE]
+            ])),
+            ('referral_rows()', measure(lambda: [
+                serialize_referral_row(row, referrer.full_name)
+                for row in referrer.referrals.referral_rows().order_by('-created_at')[:PAGE]
+            ])),
+        ])
+
+        report('AddressListCreateView page (AddressSerializer)', [
+            ('select_related full rows', measure(lambda: AddressSerializer(
+                Address.objects.select_related('user').order_by('-id')[:PAGE], many=True).data)),
+            ('for_listing()', measure(lambda: AddressSerializer(
+                Address.objects.for_listing().order_by('-id')[:PAGE], many=True).data)),
+        ])
+
+
+if __name__ == '__main__':
+    main()
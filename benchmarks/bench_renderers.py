@@ -0,0 +1,62 @@
+"""
+JSONRenderer vs ORJSONRenderer on a full list page and an unpaginated
+category list, plus peak memory of a buffered vs JSON Lines streamed export.
+
+    python -m benchmarks.bench_renderers
+"""
+from benchmarks.utils import benchmark_database, measure, report
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from cards.renderers import ORJSONRenderer, iter_json_lines
+from form.models import Form
+from form.serializers import FastFormSerializer
+from user.models import Category
+from benchmarks.bench_projection import seed, PAGE
+
+CATEGORIES = 10000
+
+
+def main():
+    with benchmark_database():
+        seed()
+        Category.objects.bulk_create(Category(name=f'Category {n:05d}') for n in range(CATEGORIES))
+
+        context = {'request': APIRequestFactory().get('/api/users/')}
+        rows = Form.objects.order_by('-created_at').values_list(*FastFormSerializer.columns)[:PAGE]
+        page = {
+            'code': 200,
+            'message': 'Data fetched successfully',
+            'data': FastFormSerializer(rows, many=True, context=context).data,
+        }
+        # Add the UUID/datetime payload the referral endpoints carry
+        for item, created_at in zip(page['data'], Form.objects.values_list('created_at', flat=True)):
+            item['created_at'] = created_at
+
+        report(f'{PAGE}-row user page', [
+            ('JSONRenderer', measure(lambda: JSONRenderer().render(page))),
+            ('ORJSONRenderer', measure(lambda: ORJSONRenderer().render(page))),
+        ])
+
+        categories = {'data': list(Category.objects.order_by('name').values('id', 'name'))}
+        report(f'{CATEGORIES} categories', [
+            ('JSONRenderer', measure(lambda: JSONRenderer().render(categories), repeat=10)),
+            ('ORJSONRenderer', measure(lambda: ORJSONRenderer().render(categories), repeat=10)),
+        ])
+
+        def buffered():
+            ORJSONRenderer().render({'data': list(Category.objects.order_by('name').values('id', 'name'))})
+
+        def streamed():
+            for _ in iter_json_lines(Category.objects.order_by('name').values('id', 'name').iterator(chunk_size=2000)):
+                pass
+
+        report(f'{CATEGORIES} categories incl. query', [
+            ('buffered response', measure(buffered, repeat=5)),
+            ('JSON Lines stream', measure(streamed, repeat=5)),
+        ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+ModelSerializer vs fast-path serializer for one 100-row list page.
+
+    python -m benchmarks.bench_serializers
+"""
+from benchmarks.utils import benchmark_database, measure, report
+
+from rest_framework.test import APIRequestFactory
+
+from form.models import Form, Address
+from form.serializers import (
+    FormSerializer, AddressSerializer, FastFormSerializer, FastAddressSerializer,
+)
+from benchmarks.bench_projection import seed, PAGE
+
+
+def main():
+    with benchmark_database():
+        seed()
+        context = {'request': APIRequestFactory().get('/api/users/')}
+
+        users = list(Form.objects.for_listing().order_by('-created_at')[:PAGE])
+        user_rows = list(Form.objects.order_by('-created_at').values_list(*FastFormSerializer.columns)[:PAGE])
+        report('Form page, serialization only', [
+            ('FormSerializer', measure(lambda: FormSerializer(users, many=True, context=context).data)),
+            ('FastFormSerializer', measure(lambda: FastFormSerializer(user_rows, many=True, context=context).data)),
+        ])
+
+        addresses = list(Address.objects.for_listing().order_by('-id')[:PAGE])
+        address_rows = list(Address.objects.order_by('-id').values_list(*FastAddressSerializer.columns)[:PAGE])
+        report('Address page, serialization only', [
+            ('AddressSerializer', measure(lambda: AddressSerializer(addresses, many=True, context=context).data)),
+            ('FastAddressSerializer', measure(lambda: FastAddressSerializer(address_rows, many=True, context=context).data)),
+        ])
+
+        report('Form page, query + serialization', [
+            ('FormSerializer', measure(lambda: FormSerializer(
+                Form.objects.for_listing().order_by('-created_at')[:PAGE], many=True, context=context).data)),
+            ('FastFormSerializer', measure(lambda: FastFormSerializer(
+                Form.objects.order_by('-created_at').values_list(*FastFormSerializer.columns)[:PAGE],
+                many=True, context=context).data)),
+        ])
+
+
+if __name__ == '__main__':
+    main()
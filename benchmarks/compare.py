@@ -0,0 +1,50 @@
+"""
+Compare two benchmark JSON reports (pytest-benchmark --benchmark-json output
+or benchmarks/load.py output) and exit non-zero on regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as fh:
+        report = json.load(fh)
+    return {item['name']: item['stats'] for item in report['benchmarks']}
+
+
+def compare(baseline, current, metric='mean', threshold=10.0):
+    """Yield (name, old, new, change %, regressed) for benchmarks in both reports."""
+    for name in sorted(baseline.keys() & current.keys()):
+        old = baseline[name].get(metric)
+        new = current[name].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) * 100 / old
+        yield name, old, new, change, change > threshold
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', default='mean', help="Stat to compare, e.g. mean, median, p95")
+    parser.add_argument('--threshold', type=float, default=10.0, help="Allowed slowdown in percent")
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    regressions = 0
+    for name, old, new, change, regressed in compare(baseline, current, args.metric, args.threshold):
+        regressions += regressed
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{name:<40} {old * 1000:10.3f} ms -> {new * 1000:10.3f} ms  {change:+7.1f}%  {flag}")
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:<40} missing from {args.current}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Synthetic dataset for benchmarks and load tests.
+
+seed_dataset() inserts users with random referral trees, addresses,
+categories and sellers through bulk_create. Names come from a small pool so
+many users share a referral-code prefix, which is the worst case for
+generate_referral_code(). QR rendering is skipped by pre-filling
+qr_code_image.
+"""
+import random
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+
+from form.models import Form, Address
+from user.models import Category, SellerDetailsForm
+
+FIRST_NAMES = ['John', 'Johnny', 'Jonathan', 'Maria', 'Mariam', 'Arjun', 'Anna', 'Annie', 'Li', 'Sam']
+CITIES = [('Kochi', 'Kerala'), ('Chennai', 'Tamil Nadu'), ('Mumbai', 'Maharashtra'), ('Pune', 'Maharashtra')]
+BATCH_SIZE = 1000
+
+
+def referral_prefix(full_name):
+    # Same rule as form.models.generate_referral_code
+    letters = ''.join(ch for ch in full_name.upper() if 'A' <= ch <= 'Z')
+    return letters[:4].ljust(4, 'X')
+
+
+def seed_dataset(users=1000, categories=50, seller_ratio=0.1, referral_ratio=0.8, seed=42):
+    """
+    Insert `users` users and their related rows; returns a summary dict.
+    Each user after the first is referred by a random earlier user with
+    probability `referral_ratio`.
+    """
+    rng = random.Random(seed)
+    password = make_password('benchmark-password')
+    counters = defaultdict(int)
+
+    forms = []
+    for n in range(users):
+        full_name = f"{rng.choice(FIRST_NAMES)} {n}"
+        prefix = referral_prefix(full_name)
+        code = f"{prefix}{counters[prefix]:03d}" if counters[prefix] < 1000 else f"{prefix}{counters[prefix]}"
+        counters[prefix] += 1
+        forms.append(Form(
+            full_name=full_name, last_name='Bench', email=f'bench{n}@example.com',
+            phone_number=f'7{n:09d}', password=password, referral_code=code,
+            gender=rng.choice(['Male', 'Female', None]),
+            qr_code_image=f'qr_codes/{code}_qr.png',
+        ))
+    Form.objects.bulk_create(forms, batch_size=BATCH_SIZE)
+    ids = list(Form.objects.filter(email__startswith='bench').order_by('id').values_list('id', flat=True))
+
+    referred = []
+    for position, user_id in enumerate(ids[1:], start=1):
+        if rng.random() < referral_ratio:
+            referred.append(Form(id=user_id, referred_by_id=ids[rng.randrange(position)]))
+    Form.objects.bulk_update(referred, ['referred_by'], batch_size=BATCH_SIZE)
+
+    addresses = []
+    for user_id in ids:
+        for _ in range(rng.randint(0, 3)):
+            city, state = rng.choice(CITIES)
+            address = Address(
+                user_id=user_id, house_name=f'House {rng.randint(1, 999)}',
+                street_name='Main Street', country='India', state=state, city=city,
+                pin=f'{rng.randint(100000, 999999)}',
+            )
+            address.normalize()  # bulk_create skips save(), which fills the keys
+            addresses.append(address)
+    # ignore_conflicts: the rare repeated address of one user is dropped
+    Address.objects.bulk_create(addresses, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    Category.objects.bulk_create(
+        [Category(name=f'Bench category {n}') for n in range(categories)], ignore_conflicts=True,
+    )
+    category_ids = list(Category.objects.values_list('id', flat=True))
+
+    sellers = [
+        SellerDetailsForm(
+            user_id=user_id, store_name=f'Store {user_id}',
+            inventory_estimate=rng.choice(['<1000', '1000-5000', '5000+']),
+        )
+        for user_id in rng.sample(ids, int(len(ids) * seller_ratio))
+    ]
+    SellerDetailsForm.objects.bulk_create(sellers, batch_size=BATCH_SIZE)
+    through = SellerDetailsForm.categories.through
+    through.objects.bulk_create([
+        through(sellerdetailsform_id=seller.id, category_id=category_id)
+        for seller in SellerDetailsForm.objects.filter(store_name__startswith='Store ')
+        for category_id in rng.sample(category_ids, min(len(category_ids), rng.randint(1, 8)))
+    ], batch_size=BATCH_SIZE)
+
+    return {
+        'users': len(ids),
+        'referrals': len(referred),
+        'addresses': len(addresses),
+        'sellers': len(sellers),
+        'categories': len(category_ids),
+    }
@@ -0,0 +1,174 @@
+"""
+Locust-style load generator for a running cards API (stdlib only).
+
+Simulated clients loop over weighted tasks - registration, unique-link
+clicks, referral dashboards/analytics and referral search - for a fixed
+duration, then a JSON report with per-task latency percentiles is written
+in the same shape as pytest-benchmark output, so runs can be compared with
+benchmarks/compare.py.
+
+    python manage.py runserver --noreload &
+    python -m benchmarks.load --host http://127.0.0.1:8000 --clients 20 --duration 60 --output load.json
+
+Seed the target database first (see benchmarks/data.py); the script picks
+users, tokens and referral codes from /api/users/.
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Client:
+    def __init__(self, host, timeout=30):
+        self.host = host.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(
+            self.host + path, data=data, method=method,
+            headers={'Content-Type': 'application/json', 'Accept': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class LoadTest:
+
+    def __init__(self, client, users):
+        self.client = client
+        self.users = users
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.tasks = [
+            (self.register, 1),
+            (self.click_unique_link, 4),
+            (self.dashboard, 3),
+            (self.analytics, 2),
+            (self.referral_list, 2),
+            (self.search, 2),
+        ]
+
+    # -- tasks ---------------------------------------------------------
+
+    def register(self):
+        suffix = uuid.uuid4().hex[:12]
+        referrer = random.choice(self.users)
+        return 'register', 'POST', '/api/register/', {
+            'full_name': random.choice(['John', 'Maria', 'Arjun']) + ' Load',
+            'last_name': 'Test',
+            'email': f'load-{suffix}@example.com',
+            'phone_number': str(int(suffix, 16))[:12],
+            'password': 'load-test-password',
+            'reenter_password': 'load-test-password',
+            'referred_by_code': referrer['referral_code'],
+        }
+
+    def click_unique_link(self):
+        return 'unique_link', 'GET', f"/api/user/{random.choice(self.users)['unique_link_token']}/", None
+
+    def dashboard(self):
+        return 'dashboard', 'GET', f"/api/dashboard/{random.choice(self.users)['uuid']}/", None
+
+    def analytics(self):
+        return 'analytics', 'GET', f"/api/dashboard/{random.choice(self.users)['uuid']}/analytics/", None
+
+    def referral_list(self):
+        return 'referral_list', 'GET', f"/api/dashboard/{random.choice(self.users)['uuid']}/referrals/", None
+
+    def search(self):
+        return 'search', 'GET', f"/api/dashboard/{random.choice(self.users)['uuid']}/search/?q=jo", None
+
+    # -- runner --------------------------------------------------------
+
+    def run_client(self, deadline):
+        tasks, weights = zip(*self.tasks)
+        while time.monotonic() < deadline:
+            name, method, path, payload = random.choices(tasks, weights)[0]()
+            start = time.perf_counter()
+            try:
+                status, _ = self.client.request(method, path, payload)
+            except OSError:
+                status = None
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.timings[name].append(elapsed)
+                if status is None or status >= 500:
+                    self.errors[name] += 1
+
+    def run(self, clients, duration):
+        deadline = time.monotonic() + duration
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            for _ in range(clients):
+                pool.submit(self.run_client, deadline)
+
+    def report(self, duration):
+        benchmarks = []
+        for name, samples in sorted(self.timings.items()):
+            samples.sort()
+            benchmarks.append({
+                'name': name,
+                'stats': {
+                    'rounds': len(samples),
+                    'mean': statistics.fmean(samples),
+                    'min': samples[0],
+                    'max': samples[-1],
+                    'median': samples[len(samples) // 2],
+                    'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                    'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+                    'ops': len(samples) / duration,
+                    'errors': self.errors[name],
+                },
+            })
+        return {'kind': 'load', 'duration': duration, 'benchmarks': benchmarks}
+
+
+def fetch_users(client, limit):
+    status, body = client.request('GET', f'/api/users/?limit={limit}')
+    if status != 200:
+        raise SystemExit(f"Could not list users ({status}); is the server up and seeded?")
+    users = json.loads(body)['data']
+    if not users:
+        raise SystemExit("No users found; seed the database first.")
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='http://127.0.0.1:8000')
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--output', default='load.json')
+    args = parser.parse_args()
+
+    client = Client(args.host)
+    test = LoadTest(client, fetch_users(client, 100))
+    test.run(args.clients, args.duration)
+    report = test.report(args.duration)
+
+    with open(args.output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    for item in report['benchmarks']:
+        stats = item['stats']
+        print(
+            f"{item['name']:<14} {stats['rounds']:6d} req  {stats['ops']:7.1f}/s  "
+            f"p50 {stats['median'] * 1000:7.1f} ms  p95 {stats['p95'] * 1000:7.1f} ms  "
+            f"errors {stats['errors']}"
+        )
+    print(f"Report written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
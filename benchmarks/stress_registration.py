@@ -0,0 +1,70 @@
+"""
+Fire many concurrent same-prefix registrations at a running server and
+report failures and throughput. Every request uses a name starting with
+the same four letters, so all of them compete for the next referral code.
+
+    python manage.py runserver --noreload &
+    python -m benchmarks.stress_registration --requests 500 --concurrency 50
+
+Exits non-zero if any registration fails.
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load import Client
+
+
+def register(client, name):
+    suffix = uuid.uuid4().hex[:12]
+    start = time.perf_counter()
+    try:
+        status, body = client.request('POST', '/api/register/', {
+            'full_name': name,
+            'last_name': 'Stress',
+            'email': f'stress-{suffix}@example.com',
+            'phone_number': str(int(suffix, 16))[:12],
+            'password': 'stress-test-password',
+            'reenter_password': 'stress-test-password',
+        })
+    except OSError:  # connection refused / reset by an overloaded server
+        status, body = None, b''
+    elapsed = time.perf_counter() - start
+    code = json.loads(body)['data']['referral_code'] if status == 201 else None
+    return status, code, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent same-prefix registration stress test")
+    parser.add_argument('--host', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--name', default='Stress Tester')
+    args = parser.parse_args()
+
+    client = Client(args.host, timeout=120)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda _: register(client, args.name), range(args.requests)))
+    wall = time.perf_counter() - started
+
+    statuses = Counter(status for status, _, _ in results)
+    codes = [code for _, code, _ in results if code]
+    latencies = sorted(elapsed for _, _, elapsed in results)
+    failures = args.requests - statuses[201]
+
+    print(f"requests:    {args.requests} ({args.concurrency} concurrent)")
+    print(f"statuses:    {dict(statuses)}")
+    print(f"codes:       {len(codes)} issued, {len(set(codes))} unique")
+    print(f"throughput:  {args.requests / wall:.1f} registrations/s")
+    print(f"latency:     p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+    sys.exit(1 if failures or len(codes) != len(set(codes)) else 0)
+
+
+if __name__ == '__main__':
+    main()
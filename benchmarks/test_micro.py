@@ -0,0 +1,82 @@
+"""
+pytest-benchmark microbenchmarks for the registration and read hot paths.
+
+Benchmarks are disabled by default (pytest.ini) so the regular test run only
+smoke-tests them. To measure and keep a JSON report for later comparison:
+
+    python -m pytest benchmarks --benchmark-enable --benchmark-json=micro.json
+    python -m benchmarks.compare old.json micro.json
+"""
+from itertools import count
+
+import pytest
+from rest_framework.test import APIRequestFactory
+
+from benchmarks.data import seed_dataset
+from form.models import Form, Address, generate_referral_code
+from form.serializers import (
+    FormSerializer, AddressSerializer, FastFormSerializer, FastAddressSerializer,
+)
+
+PAGE = 100
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def dataset():
+    return seed_dataset(users=500, categories=20)
+
+
+@pytest.fixture
+def context():
+    return {'request': APIRequestFactory().get('/api/users/')}
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def test_generate_referral_code(benchmark, dataset):
+    # Names in the dataset share a handful of prefixes, so this scans
+    # every existing JOHN* code
+    benchmark(generate_referral_code, 'John Smith')
+
+
+def _new_user(sequence, **kwargs):
+    n = next(sequence)
+    return Form(
+        full_name='John Smith', last_name='Bench', email=f'save{n}@example.com',
+        phone_number=f'6{n:09d}', password='x', **kwargs,
+    )
+
+
+def test_form_save(benchmark, dataset, media_root):
+    sequence = count()
+    benchmark(lambda: _new_user(sequence).save())
+
+
+def test_form_save_without_qr(benchmark, dataset):
+    sequence = count()
+    benchmark(lambda: _new_user(sequence, qr_code_image='qr_codes/skip.png').save())
+
+
+def test_form_serializer_page(benchmark, dataset, context):
+    users = list(Form.objects.for_listing().order_by('-created_at')[:PAGE])
+    benchmark(lambda: FormSerializer(users, many=True, context=context).data)
+
+
+def test_fast_form_serializer_page(benchmark, dataset, context):
+    rows = list(Form.objects.order_by('-created_at').values_list(*FastFormSerializer.columns)[:PAGE])
+    benchmark(lambda: FastFormSerializer(rows, many=True, context=context).data)
+
+
+def test_address_serializer_page(benchmark, dataset, context):
+    addresses = list(Address.objects.for_listing().order_by('-id')[:PAGE])
+    benchmark(lambda: AddressSerializer(addresses, many=True, context=context).data)
+
+
+def test_fast_address_serializer_page(benchmark, dataset, context):
+    rows = list(Address.objects.order_by('-id').values_list(*FastAddressSerializer.columns)[:PAGE])
+    benchmark(lambda: FastAddressSerializer(rows, many=True, context=context).data)
@@ -0,0 +1,63 @@
+"""
+Shared helpers for the standalone benchmark scripts in this directory.
+
+Every script boots Django against a throwaway test database, so they can be
+run from the project root without touching db.sqlite3:
+
+    python -m benchmarks.<script>
+"""
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cards.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def benchmark_database():
+    """Create a fresh test database for the duration of the block."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(fn, repeat=50):
+    """
+    Return (mean seconds per call, peak bytes allocated by one call).
+    One warm-up call runs first so caches don't skew the numbers.
+    """
+    fn()
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed, peak
+
+
+def report(title, results):
+    """Print a baseline-vs-candidate table; results is [(label, (secs, bytes))]."""
+    print(f"\n{title}")
+    base_secs, base_bytes = results[0][1]
+    for label, (secs, peak) in results:
+        print(
+            f"  {label:<28} {secs * 1000:8.2f} ms  {peak / 1024:9.1f} KiB"
+            f"  ({base_secs / secs:4.1f}x time, {base_bytes / max(peak, 1):4.1f}x memory)"
+        )
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cards.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Live dashboard streams (SSE / WebSocket) are served outside Django's
+# request cycle; import after setup so the app registry is ready
+from form.live import with_live_routes  # noqa: E402
+
+application = with_live_routes(django_application)
@@ -0,0 +1,45 @@
+"""
+Conditional GET (ETag / Last-Modified) for polled read endpoints.
+
+A view decorated with conditional(version) answers a repeated GET carrying
+If-None-Match or If-Modified-Since with 304 Not Modified as soon as one
+cheap version query says nothing changed, before any serializer or
+related-object query runs. Fresh responses get both validators set.
+
+`version(request, *args, **kwargs)` receives the view's URL kwargs and
+returns a tuple whose first item is the resource's last-modified datetime
+(or None when nothing has a timestamp yet) and whose other items are
+anything else that changes the representation without bumping a timestamp,
+such as a row count. It returns None when the resource does not exist, so
+the view runs and produces its usual 404.
+
+The ETag is a hash of that version, the full path (so ?fields= or page
+variants get their own tag) and the Accept header. It is computed once per
+request and shared by the ETag and Last-Modified checks.
+"""
+import hashlib
+
+from django.views.decorators.http import condition
+
+ATTRIBUTE = '_resource_version'
+
+
+def conditional(version):
+    """Decorator factory; apply to a function view or via method_decorator(..., name='get')."""
+    def current(request, *args, **kwargs):
+        if not hasattr(request, ATTRIBUTE):
+            setattr(request, ATTRIBUTE, version(request, *args, **kwargs))
+        return getattr(request, ATTRIBUTE)
+
+    def etag(request, *args, **kwargs):
+        value = current(request, *args, **kwargs)
+        if value is None:
+            return None
+        key = f"{value!r}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+    def last_modified(request, *args, **kwargs):
+        value = current(request, *args, **kwargs)
+        return value[0] if value else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,120 @@
+"""
+Idempotency keys for retried POSTs.
+
+A client that sends `Idempotency-Key: <random value>` with a POST gets the
+first response for that key replayed on every retry, without the view
+running again. Records live in the Django cache, so TTL eviction is the
+cache's job and a shared backend (Redis, Memcached) dedupes across
+workers:
+
+    pending   claimed with cache.add() while the first request runs; a
+              duplicate waits up to IDEMPOTENCY_WAIT_SECONDS for it to
+              finish, then gets 409
+    done      status, body and content type of the first response; replayed
+              with an `Idempotent-Replayed: true` header
+
+Keys are scoped to method + path, and reusing a key with a different body is
+rejected with 422. 5xx responses, exceptions and transient refusals (409,
+423, 429 and the like, which a later attempt may get past) release the key
+so the client can retry for real.
+
+Settings:
+    IDEMPOTENCY_TTL            seconds a finished response is kept
+    IDEMPOTENCY_LOCK_SECONDS   how long a pending claim survives a crashed worker
+    IDEMPOTENCY_WAIT_SECONDS   how long a duplicate waits for the first request
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, HttpResponse
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+PENDING = 'pending'
+# Refusals that say "not now" rather than answer the request; never replayed
+TRANSIENT_STATUSES = {408, 409, 423, 425, 429}
+
+
+def cache_key(request, key):
+    scope = f"{request.method}:{request.path}:{key}"
+    return 'idempotency:' + hashlib.sha256(scope.encode()).hexdigest()
+
+
+def fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _error(code, message):
+    return JsonResponse({"code": code, "message": message}, status=code)
+
+
+def replay(record):
+    response = HttpResponse(record['content'], status=record['status'], content_type=record['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def wait_for(store_key):
+    """Poll a pending record until it finishes or the wait runs out."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = cache.get(store_key)
+        if record != PENDING:
+            return record
+    return PENDING
+
+
+def idempotent(view):
+    """
+    Decorate a view (function, or a class-based view's dispatch via
+    method_decorator) so POSTs carrying an Idempotency-Key run at most once.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(400, f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+        store_key = cache_key(request, key)
+        body_hash = fingerprint(request)
+
+        if not cache.add(store_key, PENDING, settings.IDEMPOTENCY_LOCK_SECONDS):
+            record = cache.get(store_key)
+            if record == PENDING:
+                record = wait_for(store_key)
+            if record == PENDING:
+                return _error(409, "A request with this Idempotency-Key is still in progress")
+            if record is None:
+                # The first request failed and released the key; run again
+                return wrapper(request, *args, **kwargs)
+            if record['fingerprint'] != body_hash:
+                return _error(422, f"{HEADER} was already used with a different request body")
+            return replay(record)
+
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        except BaseException:
+            cache.delete(store_key)
+            raise
+
+        if response.status_code >= 500 or response.status_code in TRANSIENT_STATUSES or response.streaming:
+            cache.delete(store_key)
+        else:
+            cache.set(store_key, {
+                'fingerprint': body_hash,
+                'status': response.status_code,
+                'content': response.content,
+                'content_type': response.get('Content-Type'),
+            }, settings.IDEMPOTENCY_TTL)
+        return response
+
+    return wrapper
@@ -0,0 +1,221 @@
+"""
+Request-level performance instrumentation.
+
+PerformanceMiddleware records, per URL name, wall time, response size and -
+for a sampled fraction of requests - DB time, query count and repeated
+queries (the N+1 signature). Stats live in this process and are exported in
+Prometheus text format by metrics_view; each request also gets a
+Server-Timing header. Background jobs running in the same process add their
+own counters with registry.incr().
+
+Settings:
+    PERF_SAMPLE_RATE      fraction of requests whose queries are captured (0-1)
+    PERF_DUPLICATE_WARN   log a warning when a request repeats this many queries
+    METRICS_ALLOWED_IPS   client addresses allowed to read /metrics
+"""
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, Http404
+
+logger = logging.getLogger(__name__)
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() hook that times and fingerprints queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.exact = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+            if not many:
+                try:
+                    self.exact[(sql, tuple(params or ()))] += 1
+                except TypeError:  # unhashable params
+                    pass
+
+    @property
+    def repeated(self):
+        """Queries that re-ran an already seen statement (N+1 pattern)."""
+        return sum(n - 1 for n in self.statements.values())
+
+    @property
+    def duplicates(self):
+        """Queries identical to an earlier one, parameters included."""
+        return sum(n - 1 for n in self.exact.values())
+
+
+class EndpointStats:
+    __slots__ = (
+        'requests', 'wall_seconds', 'buckets', 'response_bytes',
+        'sampled', 'db_seconds', 'queries', 'repeated_queries', 'duplicate_queries',
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.wall_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.response_bytes = 0
+        self.sampled = 0
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.repeated_queries = 0
+        self.duplicate_queries = 0
+
+
+class MetricsRegistry:
+    """Thread-safe per-endpoint counters for this worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._counters = {}  # background job counters: name -> [help, value]
+
+    def incr(self, name, amount=1, help_text=''):
+        """Bump a job counter, exported as cards_<name>_total."""
+        with self._lock:
+            counter = self._counters.setdefault(name, [help_text, 0])
+            counter[1] += amount
+
+    def counters(self):
+        with self._lock:
+            return {name: value for name, (_, value) in self._counters.items()}
+
+    def record(self, endpoint, wall, size, recorder=None):
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.wall_seconds += wall
+            stats.buckets[bisect_left(LATENCY_BUCKETS, wall)] += 1
+            stats.response_bytes += size
+            if recorder is not None:
+                stats.sampled += 1
+                stats.db_seconds += recorder.duration
+                stats.queries += recorder.count
+                stats.repeated_queries += recorder.repeated
+                stats.duplicate_queries += recorder.duplicates
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {name: getattr(stats, name) for name in EndpointStats.__slots__}
+                for endpoint, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._counters.clear()
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        with self._lock:
+            counters = sorted((name, help_text, value) for name, (help_text, value) in self._counters.items())
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        def per_view(name, field):
+            return [f'{name}{{view="{view}"}} {stats[field]}' for view, stats in sorted(snapshot.items())]
+
+        histogram = []
+        for view, stats in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+                cumulative += count
+                histogram.append(f'cards_request_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            histogram.append(f'cards_request_seconds_bucket{{view="{view}",le="+Inf"}} {stats["requests"]}')
+            histogram.append(f'cards_request_seconds_sum{{view="{view}"}} {stats["wall_seconds"]}')
+            histogram.append(f'cards_request_seconds_count{{view="{view}"}} {stats["requests"]}')
+
+        metric('cards_request_seconds', 'histogram', 'Wall time per request.', histogram)
+        metric('cards_response_bytes_total', 'counter', 'Response body bytes sent.',
+               per_view('cards_response_bytes_total', 'response_bytes'))
+        metric('cards_sampled_requests_total', 'counter', 'Requests with DB instrumentation.',
+               per_view('cards_sampled_requests_total', 'sampled'))
+        metric('cards_db_seconds_total', 'counter', 'DB time in sampled requests.',
+               per_view('cards_db_seconds_total', 'db_seconds'))
+        metric('cards_db_queries_total', 'counter', 'Queries run by sampled requests.',
+               per_view('cards_db_queries_total', 'queries'))
+        metric('cards_db_repeated_queries_total', 'counter', 'Queries repeating an earlier statement (N+1).',
+               per_view('cards_db_repeated_queries_total', 'repeated_queries'))
+        metric('cards_db_duplicate_queries_total', 'counter', 'Queries identical to an earlier one.',
+               per_view('cards_db_duplicate_queries_total', 'duplicate_queries'))
+        for name, help_text, value in counters:
+            metric(f'cards_{name}_total', 'counter', help_text or 'Background job counter.',
+                   [f'cards_{name}_total {value}'])
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class PerformanceMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 1.0)
+        self.duplicate_warn = getattr(settings, 'PERF_DUPLICATE_WARN', 10)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        recorder = None
+
+        if random.random() < self.sample_rate:
+            recorder = QueryRecorder()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        wall = time.perf_counter() - start
+        match = request.resolver_match
+        endpoint = (match.url_name or match.view_name) if match else 'unresolved'
+        size = 0 if response.streaming else len(response.content)
+        registry.record(endpoint, wall, size, recorder)
+
+        timing = [f'app;dur={wall * 1000:.1f}']
+        if recorder is not None:
+            timing.append(f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"')
+            if recorder.repeated >= self.duplicate_warn:
+                logger.warning(
+                    "%s ran %d queries, %d of them repeated statements (possible N+1)",
+                    endpoint, recorder.count, recorder.repeated,
+                )
+        response['Server-Timing'] = ', '.join(timing)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; only served to METRICS_ALLOWED_IPS."""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(registry.to_prometheus(), content_type='text/plain; version=0.0.4')
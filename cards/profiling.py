@@ -0,0 +1,185 @@
+"""
+Statistical stack sampling for finding where request time goes.
+
+Two modes, both writing collapsed stacks ("frame;frame;frame count" lines,
+loadable by flamegraph.pl and speedscope) into PROFILE_DIR:
+
+* Always-on: a daemon thread samples every in-flight request thread every
+  PROFILE_SAMPLE_INTERVAL seconds and flushes per-view files every
+  PROFILE_FLUSH_SECONDS. Set the interval to 0 to disable.
+* Per request: send `X-Profile: 1` or `?profile=1` from PROFILE_ALLOWED_IPS
+  and that request is sampled every millisecond into its own file, named in
+  the X-Profile-File response header.
+
+`python manage.py aggregate_profiles` merges the files per view name.
+Files older than PROFILE_RETENTION_DAYS are removed by the always-on
+sampler's flushes.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+PER_REQUEST_INTERVAL = 0.001
+
+
+def frame_name(code):
+    filename = code.co_filename.replace('\\', '/')
+    short = '/'.join(filename.rsplit('/', 2)[-2:])
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{short}:{name}".replace(';', ':')
+
+
+def collapse(frame):
+    """Root-first collapsed stack for `frame`."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name or 'unresolved'
+
+
+def write_collapsed(path, stacks):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as fh:
+        for stack, count in stacks.most_common():
+            fh.write(f"{stack} {count}\n")
+
+
+def prune(directory, max_age):
+    """Delete the collapsed files in `directory` older than `max_age` seconds."""
+    cutoff = time.time() - max_age
+    for path in Path(directory).glob('*.collapsed'):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass  # pruned by another worker
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the threads registered in `active` (thread id -> request) and
+    accumulates collapsed stacks per view name, flushing them to `directory`
+    every `flush_seconds` (never, if None). Each flush also deletes files
+    older than `retention_seconds`, if given.
+    """
+
+    def __init__(self, interval, directory, flush_seconds=None, retention_seconds=None):
+        super().__init__(name='cards-stack-sampler', daemon=True)
+        self.interval = interval
+        self.directory = Path(directory)
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_seconds
+        self.active = {}
+        self.samples = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_flush = time.monotonic()
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+            if self.flush_seconds and time.monotonic() - last_flush >= self.flush_seconds:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def sample(self):
+        if not self.active:
+            return
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, request in list(self.active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[endpoint_name(request)][collapse(frame)] += 1
+
+    def flush(self):
+        with self._lock:
+            samples, self.samples = self.samples, defaultdict(Counter)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        for endpoint, stacks in samples.items():
+            write_collapsed(self.directory / f"{endpoint}.{os.getpid()}.{stamp}.collapsed", stacks)
+        if self.retention_seconds and self.directory.is_dir():
+            prune(self.directory, self.retention_seconds)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def get_background_sampler():
+    """Start the process-wide low-rate sampler on first use."""
+    global _background
+    interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0)
+    if not interval:
+        return None
+    with _background_lock:
+        if _background is None:
+            _background = StackSampler(
+                interval, settings.PROFILE_DIR,
+                getattr(settings, 'PROFILE_FLUSH_SECONDS', 60),
+                getattr(settings, 'PROFILE_RETENTION_DAYS', 7) * 24 * 60 * 60,
+            )
+            _background.start()
+            atexit.register(_background.flush)
+    return _background
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.background = get_background_sampler()
+        self.allowed_ips = getattr(settings, 'PROFILE_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
+    def wants_profile(self, request):
+        if request.META.get('REMOTE_ADDR') not in self.allowed_ips:
+            return False
+        return request.headers.get('X-Profile') == '1' or request.GET.get('profile') == '1'
+
+    def __call__(self, request):
+        ident = threading.get_ident()
+        if self.background is not None:
+            self.background.active[ident] = request
+        try:
+            if self.wants_profile(request):
+                return self.profile(request, ident)
+            return self.get_response(request)
+        finally:
+            if self.background is not None:
+                self.background.active.pop(ident, None)
+
+    def profile(self, request, ident):
+        sampler = StackSampler(PER_REQUEST_INTERVAL, settings.PROFILE_DIR)
+        sampler.active[ident] = request
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+            sampler.join()
+
+        # Samples taken before URL resolution are filed under 'unresolved'
+        endpoint = endpoint_name(request)
+        stacks = sum(sampler.samples.values(), Counter())
+        if stacks:
+            filename = f"{endpoint}.request.{os.getpid()}.{time.strftime('%Y%m%d-%H%M%S')}.{ident}.collapsed"
+            write_collapsed(Path(settings.PROFILE_DIR) / filename, stacks)
+            response['X-Profile-File'] = filename
+        return response
@@ -0,0 +1,189 @@
+"""
+In-process publish/subscribe for push endpoints on the ASGI stack.
+
+Connections subscribe to a topic from the event loop that serves them;
+publish() may be called from any thread (sync views, the click buffer) and
+hands each event to the subscribers' loop with one call_soon_threadsafe()
+per loop, not per subscriber. An event is encoded once and the same bytes
+go to every subscriber of the topic, so fan-out costs a dict lookup plus an
+append per subscriber, and an idle subscriber is a small object with an
+empty deque (no thread, no polling).
+
+Each subscriber buffers at most LIVE_QUEUE_SIZE undelivered events. A slow
+client that falls further behind has its backlog dropped and receives
+RESYNC instead, so memory stays bounded whatever the publish rate.
+
+Events stay in the publishing process unless LIVE_REDIS_URL is set (and
+redis installed): publish() then goes through Redis pub/sub, and one
+listener thread per process delivers every `live:*` message to the local
+subscribers, so a signup handled by one worker reaches dashboards
+connected to another.
+
+Settings:
+    LIVE_QUEUE_SIZE        undelivered events per subscriber before RESYNC
+    LIVE_MAX_SUBSCRIBERS   subscriptions per process; more are refused
+    LIVE_REDIS_URL         share events between processes (None: in-process)
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+from .middleware import registry
+from .renderers import dumps
+
+try:
+    import redis
+except ImportError:  # redis is optional; events then stay in this process
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'live:'
+RESYNC = object()  # events were dropped; the client should refetch
+CLOSED = object()  # the connection went away
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    """One connection's queue; get() and the delivery callbacks run on its loop."""
+
+    __slots__ = ('topic', 'loop', 'pending', 'waiter', 'overflowed', 'closed')
+
+    def __init__(self, topic, loop):
+        self.topic = topic
+        self.loop = loop
+        self.pending = deque()
+        self.waiter = None
+        self.overflowed = False
+        self.closed = False
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def deliver(self, message):
+        if len(self.pending) >= settings.LIVE_QUEUE_SIZE:
+            self.pending.clear()
+            if not self.overflowed:
+                registry.incr('live_resyncs', help_text='Live subscribers that fell behind and were told to resync.')
+            self.overflowed = True
+        else:
+            self.pending.append(message)
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    async def get(self, timeout=None):
+        """The next encoded event, RESYNC, CLOSED, or None after `timeout` seconds idle."""
+        if not (self.pending or self.overflowed or self.closed):
+            self.waiter = self.loop.create_future()
+            try:
+                await asyncio.wait_for(self.waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self.waiter = None
+        if self.closed:
+            return CLOSED
+        if self.overflowed:
+            self.overflowed = False
+            return RESYNC
+        return self.pending.popleft()
+
+
+class Broker:
+
+    def __init__(self, redis_url=None):
+        self.topics = defaultdict(set)
+        self.count = 0
+        self.lock = threading.Lock()
+        self.redis = redis.Redis.from_url(redis_url) if redis_url and redis else None
+        self.listener = None
+
+    def subscribe(self, topic):
+        """Subscribe the running event loop's connection to `topic`."""
+        subscription = Subscription(topic, asyncio.get_running_loop())
+        with self.lock:
+            if self.count >= settings.LIVE_MAX_SUBSCRIBERS:
+                raise TooManySubscribers(topic)
+            self.topics[topic].add(subscription)
+            self.count += 1
+            if self.redis is not None and self.listener is None:
+                self.listener = threading.Thread(target=self._listen, name='live-pubsub', daemon=True)
+                self.listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.topics.get(subscription.topic)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self.count -= 1
+                if not subscribers:
+                    del self.topics[subscription.topic]
+
+    def publish(self, topic, event):
+        """Send `event` (a JSON-serializable dict) to every subscriber of `topic`."""
+        if self.redis is not None:
+            try:
+                self.redis.publish(CHANNEL_PREFIX + topic, dumps(event))
+                registry.incr('live_events_published', help_text='Events published to live subscribers.')
+                return
+            except redis.RedisError:
+                logger.warning("Live event not shared through Redis; delivering locally", exc_info=True)
+        if topic in self.topics:  # unlocked peek; skips encoding for nobody
+            self.deliver(topic, dumps(event))
+            registry.incr('live_events_published', help_text='Events published to live subscribers.')
+
+    def deliver(self, topic, message):
+        with self.lock:
+            by_loop = defaultdict(list)
+            for subscription in self.topics.get(topic, ()):
+                by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, subscriptions, message)
+            except RuntimeError:  # the loop has shut down
+                pass
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                for item in pubsub.listen():
+                    self.deliver(item['channel'].decode()[len(CHANNEL_PREFIX):], item['data'])
+            except redis.RedisError:
+                # Events published meanwhile are lost; clients resync on reconnect
+                logger.warning("Live pub/sub listener lost Redis; reconnecting", exc_info=True)
+                time.sleep(1)
+
+
+def _deliver_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide broker, created on first use."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            url = getattr(settings, 'LIVE_REDIS_URL', None)
+            if url and redis is None:
+                logger.warning("LIVE_REDIS_URL is set but redis is not installed; live events stay in-process")
+            _broker = Broker(url)
+    return _broker
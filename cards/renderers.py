@@ -0,0 +1,117 @@
+"""
+High-throughput JSON rendering shared by the `form` and `user` apps.
+
+ORJSONRenderer is a drop-in replacement for DRF's JSONRenderer that encodes
+UUIDs and datetimes natively through orjson, and json_lines_response()
+streams unbounded result sets as JSON Lines so memory stays flat.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+ORJSON_OPTIONS = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+# Stream buffer size for JSON Lines output
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Decimals, lazy strings, querysets etc. go through DRF's encoder
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data):
+    """Encode `data` to compact JSON bytes, matching JSONRenderer output."""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+    # Keep the output a strict javascript subset, as JSONRenderer does
+    if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+        ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return ret
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    orjson-backed JSONRenderer. Pretty-printed, ASCII-only or non-compact
+    output, and anything orjson refuses, is handed to the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONLinesRenderer(ORJSONRenderer):
+    """
+    Advertises application/x-ndjson so content negotiation accepts it; list
+    views that support streaming check wants_json_lines() and return
+    json_lines_response() instead. Anything else (errors, single objects)
+    is rendered as one JSON line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return super().render(data, None, renderer_context) + b'\n'
+
+
+# Per-view opt-in: `renderer_classes = FAST_RENDERER_CLASSES`
+FAST_RENDERER_CLASSES = [ORJSONRenderer, BrowsableAPIRenderer]
+# For views that stream JSON Lines when wants_json_lines(); others answer 406 to it
+STREAMING_RENDERER_CLASSES = [*FAST_RENDERER_CLASSES, JSONLinesRenderer]
+
+
+def iter_json_lines(rows, encode=dumps):
+    """Yield JSON Lines bytes for `rows`, buffered into ~64 KiB chunks."""
+    buffer = []
+    size = 0
+    for row in rows:
+        line = encode(row) + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def json_lines_response(rows, filename=None):
+    """
+    Stream `rows` (any iterable of JSON-serializable objects, typically a
+    queryset.values().iterator()) as application/x-ndjson.
+    """
+    response = StreamingHttpResponse(iter_json_lines(rows), content_type='application/x-ndjson')
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def wants_json_lines(request):
+    """True if the client asked for the streaming JSON Lines mode (?stream=jsonl or Accept)."""
+    if request.query_params.get('stream') == 'jsonl':
+        return True
+    return isinstance(getattr(request, 'accepted_renderer', None), JSONLinesRenderer)
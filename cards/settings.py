@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+
+from corsheaders.defaults import default_headers
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cards.middleware.PerformanceMiddleware',
+    'cards.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -54,8 +58,90 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Performance instrumentation (cards/middleware.py)
+PERF_SAMPLE_RATE = 1.0 if DEBUG else 0.1  # share of requests with DB query capture
+PERF_DUPLICATE_WARN = 10  # log requests that repeat this many queries
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may scrape /metrics
+
+# Stack sampling profiler (cards/profiling.py)
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_SAMPLE_INTERVAL = 0.05  # always-on sampler period in seconds, 0 disables
+PROFILE_FLUSH_SECONDS = 60
+PROFILE_RETENTION_DAYS = 7  # profile files older than this are deleted
+PROFILE_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may trigger X-Profile / ?profile=1
+
+# Idempotency-Key handling for retried POSTs (cards/idempotency.py); records
+# live in the default cache, use a shared backend when running several workers
+IDEMPOTENCY_TTL = 24 * 60 * 60  # keep finished responses for a day
+IDEMPOTENCY_LOCK_SECONDS = 60  # pending claim expiry if a worker dies mid-request
+IDEMPOTENCY_WAIT_SECONDS = 5  # how long a duplicate waits for the first request
+
+REST_FRAMEWORK = {
+    # Trusted reverse proxies in front of the app. Client addresses (and so the
+    # per-IP throttle budgets) come from X-Forwarded-For only this many hops
+    # back; 0 uses REMOTE_ADDR and ignores the header
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
+}
+
+# Token-bucket throttling of the open endpoints (cards/throttling.py). Keys are
+# the URL name, plus ':token' / ':referral_code' / ':user_uuid' for per-link budgets
+THROTTLE_REDIS_URL = os.environ.get('THROTTLE_REDIS_URL')  # unset: per-process buckets
+THROTTLE_MAX_KEYS = 100000  # per-process buckets kept, least recently used dropped first
+THROTTLE_RATES = {
+    'user-by-unique-link': '120/min',
+    'user-by-unique-link:token': '30/min',
+    'referral-registration': '30/min',
+    'referral-registration:referral_code': '60/min',
+    'search-referred-users': '60/min',
+    'search-referred-users:user_uuid': '120/min',
+}
+
+# Unique-link click log (form/clicks.py); run `manage.py rollup_clicks --every 60`
+CLICK_BATCH_SIZE = 100  # buffered clicks per INSERT
+CLICK_FLUSH_SECONDS = 5  # flush a partial batch after this long
+CLICK_HOURLY_RETENTION_DAYS = 14  # daily rollups are kept forever
+
+# Top-referrer leaderboards (form/leaderboard.py)
+LEADERBOARD_REFRESH_SECONDS = 2  # how stale a worker's board may get
+LEADERBOARD_SNAPSHOT_PATH = BASE_DIR / 'leaderboard.json'
+LEADERBOARD_SNAPSHOT_SECONDS = 300
+LEADERBOARD_REBUILD_SECONDS = 3600  # background full recount, for writes that bypass the change log
+
+# Delta sync change log (form/sync.py); run `manage.py compact_changelog` daily
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 2000
+SYNC_SETTLE_SECONDS = 2  # longer than any write transaction
+SYNC_TOMBSTONE_DAYS = 30  # clients idle for longer resync from scratch
+
+# Unique-link expiry (form/links.py); run `manage.py sweep_links --every 60`
+LINK_SWEEP_BATCH_SIZE = 1000  # links deactivated per UPDATE
+LINK_EXPIRY_MAX_USERS = 10000  # users per bulk expiry / rotation request
+LINK_MAX_TTL_SECONDS = 10 * 365 * 24 * 60 * 60  # longest ttl_seconds the bulk expiry API accepts
+# Bulk rotation (`manage.py rotate_links`); larger API rotations wait for `rotate_links --pending`
+LINK_ROTATION_BATCH_SIZE = 1000
+LINK_ROTATION_INLINE_MAX = 500
+
+# Bulk address import (form/imports.py): POST /api/addresses/import/ or `manage.py import_addresses`
+ADDRESS_IMPORT_CHUNK_SIZE = 1000  # rows per upsert
+
+# Transactional outbox (form/outbox.py); run `manage.py relay_outbox --every 5`
+OUTBOX_SINKS = {
+    'file': {'BACKEND': 'form.outbox.FileSink', 'OPTIONS': {'path': BASE_DIR / 'outbox.jsonl'}},
+    # 'stream': {'BACKEND': 'form.outbox.RedisStreamSink', 'OPTIONS': {'url': 'redis://localhost:6379/0'}},
+}
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_SETTLE_SECONDS = 2  # longer than any write transaction
+OUTBOX_RETENTION_DAYS = 7
+
+# Live dashboard push (cards/pubsub.py, form/live.py); served by cards.asgi only
+LIVE_QUEUE_SIZE = 100  # undelivered events per subscriber before it is told to resync
+LIVE_MAX_SUBSCRIBERS = 50000  # per worker process
+LIVE_HEARTBEAT_SECONDS = 25  # SSE keep-alive, below common proxy idle timeouts
+LIVE_REDIS_URL = os.environ.get('LIVE_REDIS_URL')  # unset: events stay in the worker process
+
 ROOT_URLCONF = 'cards.urls'
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 TEMPLATES = [
     {
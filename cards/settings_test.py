@@ -0,0 +1,25 @@
+"""
+Settings for the test suite: cards.settings, with every file the app writes
+(profiles, leaderboard snapshot, outbox file sink, uploads) redirected to a
+scratch directory that is removed at exit. The always-on sampler is off and
+the click flush timer does not fire during a run: it would write from its
+own thread, outside the test transaction.
+"""
+import atexit
+import shutil
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+
+SCRATCH_DIR = Path(tempfile.mkdtemp(prefix='cards-tests-'))
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+
+PROFILE_SAMPLE_INTERVAL = 0
+PROFILE_DIR = SCRATCH_DIR / 'profiles'
+LEADERBOARD_SNAPSHOT_PATH = SCRATCH_DIR / 'leaderboard.json'
+OUTBOX_SINKS = {
+    'file': {'BACKEND': 'form.outbox.FileSink', 'OPTIONS': {'path': SCRATCH_DIR / 'outbox.jsonl'}},
+}
+MEDIA_ROOT = str(SCRATCH_DIR / 'media')
+CLICK_FLUSH_SECONDS = 3600
@@ -0,0 +1,200 @@
+"""
+Token-bucket throttling for the open (AllowAny) endpoints.
+
+Each bucket holds up to N tokens and refills at N per period; a request
+takes one token or is rejected with 429 and a Retry-After of the time until
+the next token. The throttle classes plug into DRF, which checks them before
+the view body runs, so a rejected request costs one bucket update and no
+ORM work.
+
+Budgets are per scope. A view's scope is its `throttle_scope` attribute or,
+for function views, its URL name; each throttle class keys the bucket on
+something different:
+
+    IPThrottle            client address             THROTTLE_RATES['<scope>']
+    TokenThrottle         the `token` URL kwarg      THROTTLE_RATES['<scope>:token']
+    ReferralCodeThrottle  the `referral_code` kwarg  THROTTLE_RATES['<scope>:referral_code']
+    UserUUIDThrottle      the `user_uuid` kwarg      THROTTLE_RATES['<scope>:user_uuid']
+
+Rates look like '60/min' (s, sec, min, hour, day); scopes without a rate are
+not throttled.
+
+IPThrottle keys on DRF's get_ident(): REMOTE_ADDR, or the address
+NUM_PROXIES hops from the end of X-Forwarded-For when the app runs behind
+that many trusted proxies. The header alone is never trusted, so clients
+cannot pick a fresh budget by sending a made-up address.
+
+Buckets live in process memory by default, at most THROTTLE_MAX_KEYS of
+them; the least recently used is dropped first. Set THROTTLE_REDIS_URL (and
+install redis) to share them between workers; the refill-and-take step then
+runs as one Lua script, so it is atomic across processes. If Redis is
+unreachable requests are let through rather than failing.
+"""
+import functools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import redis
+except ImportError:  # redis is optional; buckets stay in process memory
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'60/min' -> (capacity 60, refill 1.0 token/s)."""
+    count, _, period = rate.partition('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip().lower()]
+
+
+class MemoryBucketStore:
+    """Per-process LRU of buckets: key -> (tokens, last update)."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """Take one token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens, stamp = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                # Dropping a bucket refills it early; the oldest is the most likely to be full anyway
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+# KEYS[1] bucket; ARGV capacity, refill rate. Uses the server clock so workers
+# with skewed clocks share one timeline. Returns the wait as a string (Lua
+# numbers are truncated to integers on the way out).
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+
+    def __init__(self, url, prefix='throttle:'):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.1)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+        self.prefix = prefix
+
+    def consume(self, key, capacity, rate):
+        try:
+            return float(self.script(keys=[self.prefix + key], args=[capacity, rate]))
+        except redis.RedisError:
+            logger.warning("Throttle store unavailable, allowing request", exc_info=True)
+            return 0.0
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide bucket store, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            url = getattr(settings, 'THROTTLE_REDIS_URL', None)
+            if url and redis is None:
+                logger.warning("THROTTLE_REDIS_URL is set but redis is not installed; using memory buckets")
+            _store = RedisBucketStore(url) if url and redis else MemoryBucketStore(settings.THROTTLE_MAX_KEYS)
+    return _store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    key_kwarg = None  # URL kwarg to key on; None keys on the client address
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None and request.resolver_match is not None:
+            scope = request.resolver_match.url_name
+        if scope and self.key_kwarg:
+            scope = f"{scope}:{self.key_kwarg}"
+        return scope
+
+    def get_ident_key(self, request, view):
+        if self.key_kwarg is None:
+            return self.get_ident(request)
+        value = view.kwargs.get(self.key_kwarg)
+        return None if value is None else str(value)
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = self.get_scope(request, view)
+        rate = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+        ident = self.get_ident_key(request, view)
+        if rate is None or ident is None:
+            return True
+        capacity, refill = parse_rate(rate)
+        wait = get_store().consume(f"{scope}:{ident}", capacity, refill)
+        if wait:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return math.ceil(self.retry_after) if self.retry_after else None
+
+
+class IPThrottle(TokenBucketThrottle):
+    pass
+
+
+class TokenThrottle(TokenBucketThrottle):
+    key_kwarg = 'token'
+
+
+class ReferralCodeThrottle(TokenBucketThrottle):
+    key_kwarg = 'referral_code'
+
+
+class UserUUIDThrottle(TokenBucketThrottle):
+    key_kwarg = 'user_uuid'
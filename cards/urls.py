@@ -20,12 +20,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from cards.middleware import metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('user.urls')),  # Include user app URLs
     path('api/', include('form.urls')),  # Include form app URLs
+    path('metrics', metrics_view, name='metrics'),  # Prometheus scrape (local only)
 ]
 
 # ✅ Serve media files in development
@@ -0,0 +1,195 @@
+"""
+Unique-link click events and their time-bucketed rollups.
+
+record_click() appends to an in-process buffer that is written with one
+bulk_create per CLICK_BATCH_SIZE events, so a link hit does not pay for its
+own INSERT. A partial batch is written CLICK_FLUSH_SECONDS after the last
+flush by a background timer thread, even if no other click arrives, and
+whatever is left at exit. rollup_clicks() - run by the
+`rollup_clicks` management command - folds the raw LinkClick rows into hourly
+and daily LinkClickRollup buckets per (user, source) and deletes exactly the
+rows it counted (a click committed meanwhile waits for the next run), so the
+raw table only ever holds the last few minutes of clicks; the same run adds
+the daily totals to the users' click UserSeries (form.timeseries). Hourly
+buckets are kept for CLICK_HOURLY_RETENTION_DAYS, daily buckets forever.
+
+Each flush also pushes the per-user click counts to live dashboards
+(form.live). click_stats() reads a user's daily buckets in one query.
+Clicks still in the buffer or not yet rolled up show up after the next
+flush/rollup.
+"""
+import atexit
+import datetime
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .live import publish_clicks
+from .models import LinkClick, LinkClickRollup, UserSeries
+from .timeseries import add_counts
+
+logger = logging.getLogger(__name__)
+
+def click_source(request):
+    """Host of the Referer header, '' for direct hits."""
+    referer = request.META.get('HTTP_REFERER', '')
+    return (urlsplit(referer).hostname or '')[:255]
+
+
+class ClickBuffer:
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.timer = None
+
+    def add(self, user_id, source):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Thread(target=self.flush_when_due, name='click-buffer-flush', daemon=True)
+                self.timer.start()
+            self.events.append(LinkClick(user_id=user_id, source=source, clicked_at=timezone.now()))
+            due = (
+                len(self.events) >= settings.CLICK_BATCH_SIZE
+                or time.monotonic() - self.last_flush >= settings.CLICK_FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            events, self.events = self.events, []
+            self.last_flush = time.monotonic()
+        if events:
+            LinkClick.objects.bulk_create(events, batch_size=500)
+            publish_clicks(Counter(event.user_id for event in events))
+        return len(events)
+
+    def flush_when_due(self):
+        """Timer thread: flush a partial batch once CLICK_FLUSH_SECONDS have passed since the last flush."""
+        while True:
+            with self.lock:
+                wait = self.last_flush + settings.CLICK_FLUSH_SECONDS - time.monotonic()
+                due = bool(self.events) and wait <= 0
+            if due:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Click buffer flush failed")
+                finally:
+                    connection.close()  # the timer thread's own connection
+                continue
+            time.sleep(wait if wait > 0 else settings.CLICK_FLUSH_SECONDS)
+
+
+buffer = ClickBuffer()
+atexit.register(buffer.flush)
+
+
+def record_click(user_id, request):
+    buffer.add(user_id, click_source(request))
+
+
+def _hour(clicked_at):
+    return clicked_at.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _day(bucket):
+    return bucket.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_clicks(now=None, batch_size=5000):
+    """
+    Fold every raw click into hourly and daily rollups, delete the raw rows
+    and prune old hourly buckets. Returns the number of clicks folded.
+    """
+    now = now or timezone.now()
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so a concurrent rollup waits and then skips these rows
+            rows = list(
+                LinkClick.objects.select_for_update().order_by('id')
+                .values_list('id', 'user_id', 'clicked_at', 'source')[:batch_size]
+            )
+            if not rows:
+                break
+            counts = defaultdict(int)
+            daily = defaultdict(lambda: defaultdict(int))
+            for _, user_id, clicked_at, source in rows:
+                hour = _hour(clicked_at)
+                counts[(user_id, LinkClickRollup.HOUR, hour, source)] += 1
+                counts[(user_id, LinkClickRollup.DAY, _day(hour), source)] += 1
+                daily[user_id][hour.date()] += 1
+            _add_to_rollups(counts)
+            add_counts(UserSeries.CLICKS, daily)
+            # Only the rows counted above; a lower id committed meanwhile is left for the next run
+            LinkClick.objects.filter(id__in=[row[0] for row in rows]).delete()
+            folded += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    cutoff = now - datetime.timedelta(days=settings.CLICK_HOURLY_RETENTION_DAYS)
+    LinkClickRollup.objects.filter(granularity=LinkClickRollup.HOUR, bucket__lt=cutoff).delete()
+    return folded
+
+
+def _add_to_rollups(counts):
+    # Read the current totals of the touched buckets, add, and upsert
+    users = {key[0] for key in counts}
+    buckets = {key[2] for key in counts}
+    existing = LinkClickRollup.objects.filter(user_id__in=users, bucket__in=buckets).values_list(
+        'user_id', 'granularity', 'bucket', 'source', 'count',
+    )
+    for user_id, granularity, bucket, source, count in existing:
+        key = (user_id, granularity, bucket, source)
+        if key in counts:
+            counts[key] += count
+    LinkClickRollup.objects.bulk_create(
+        [
+            LinkClickRollup(user_id=user_id, granularity=granularity, bucket=bucket, source=source, count=n)
+            for (user_id, granularity, bucket, source), n in counts.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user', 'granularity', 'bucket', 'source'],
+        update_fields=['count'],
+        batch_size=500,
+    )
+
+
+def click_stats(user, referrals, days=30, today=None):
+    """Total clicks, conversion rate, clicks per day and per source from daily rollups."""
+    today = today or timezone.now().date()
+    first_day = today - datetime.timedelta(days=days - 1)
+    rows = LinkClickRollup.objects.filter(user=user, granularity=LinkClickRollup.DAY).values_list(
+        'bucket', 'source', 'count',
+    )
+
+    total = 0
+    per_day = defaultdict(int)
+    per_source = defaultdict(int)
+    for bucket, source, count in rows:
+        total += count
+        per_source[source] += count
+        if bucket.date() >= first_day:
+            per_day[bucket.date()] += count
+
+    return {
+        "total_clicks": total,
+        "conversion_rate": round(referrals / total, 4) if total else None,
+        "daily": [
+            {"date": day.isoformat(), "clicks": per_day.get(day, 0)}
+            for day in (first_day + datetime.timedelta(days=n) for n in range(days))
+        ],
+        "sources": [
+            {"source": source or "direct", "clicks": count}
+            for source, count in sorted(per_source.items(), key=lambda item: -item[1])
+        ],
+    }
@@ -0,0 +1,276 @@
+"""
+Deterministic large-dataset generator used by the `generate_fixtures` command.
+
+Every row is a pure function of (seed, global row index), so chunks can be
+generated in any order or in parallel processes and always produce the same
+data. Users get explicit primary keys (base_id + index) which lets a chunk
+point referred_by at users another chunk inserts.
+
+Shape of the data:
+* names come from a small pool where several names share a referral-code
+  prefix, so generate_referral_code() sees long prefix scans;
+* referral codes are pre-computed (prefix + per-prefix counter starting
+  at base_id), QR rendering is skipped;
+* referrers are drawn with a power-law skew towards early users, so a few
+  users own most of the referral tree;
+* sellers carry many categories.
+"""
+import gzip
+import json
+import random
+from dataclasses import dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from cards.renderers import dumps
+from user.models import Category, SellerDetailsForm
+from .models import Form, Address
+
+# Names grouped by the referral-code prefix they produce
+NAME_GROUPS = [
+    ['John', 'Johnny', 'Johnson'],
+    ['Maria', 'Marian', 'Mariam'],
+    ['Arjun', 'Arjuna'],
+    ['Anna', 'Annabel', 'Annie'],
+    ['Sam', 'Samuel', 'Samantha'],
+    ['Li'],
+]
+PREFIXES = [(group[0].upper() + 'XXXX')[:4] for group in NAME_GROUPS]
+CITIES = [
+    ('Kochi', 'Kerala'), ('Chennai', 'Tamil Nadu'), ('Mumbai', 'Maharashtra'),
+    ('Pune', 'Maharashtra'), ('Bengaluru', 'Karnataka'), ('Delhi', 'Delhi'),
+]
+INVENTORY = [choice for choice, _ in SellerDetailsForm.INVENTORY_CHOICES]
+
+# Tables in dependency order, as (model, dump file stem)
+FIXTURE_TABLES = [
+    (Form, 'users'),
+    (Address, 'addresses'),
+    (Category, 'categories'),
+    (SellerDetailsForm, 'sellers'),
+    (SellerDetailsForm.categories.through, 'seller_categories'),
+]
+
+
+@dataclass
+class FixtureSpec:
+    users: int
+    seed: int = 42
+    chunk_size: int = 10000
+    base_id: int = 1
+    referral_ratio: float = 0.9
+    skew: float = 3.0            # higher -> referrals concentrate on early users
+    max_addresses: int = 3
+    seller_ratio: float = 0.05
+    categories: int = 200
+    max_seller_categories: int = 40
+    password: str = ''
+
+    @property
+    def chunks(self):
+        return (self.users + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_range(self, chunk):
+        start = chunk * self.chunk_size
+        return range(start, min(start + self.chunk_size, self.users))
+
+    def rng(self, chunk, phase):
+        return random.Random(f"{self.seed}:{phase}:{chunk}")
+
+
+# referral_code is max 10 chars: 4-letter prefix + up to 6 digits per prefix
+MAX_CODE_NUMBER = 10 ** 6 - 1
+
+
+def referral_code(spec, index):
+    """
+    Counters start at base_id. Every code already in the table is numbered
+    below the number of users that existed when it was issued (signups and
+    rotation fill gaps from 0, earlier runs start at their own base_id), so
+    a run appended after max(id) cannot collide with them.
+    """
+    group = index % len(NAME_GROUPS)
+    counter = spec.base_id + index // len(NAME_GROUPS)
+    return f"{PREFIXES[group]}{counter:03d}"
+
+
+def last_code_number(spec):
+    return spec.base_id + (spec.users - 1) // len(NAME_GROUPS)
+
+
+def category_names(spec):
+    return [f"Category {n:04d}" for n in range(spec.categories)]
+
+
+def ensure_categories(spec):
+    """Create the category pool up front; returns category ids."""
+    names = category_names(spec)
+    Category.objects.bulk_create([Category(name=name) for name in names], ignore_conflicts=True)
+    return list(Category.objects.filter(name__in=names).order_by('id').values_list('id', flat=True))
+
+
+def build_users(spec, chunk):
+    rng = spec.rng(chunk, 'users')
+    users = []
+    for index in spec.chunk_range(chunk):
+        group = NAME_GROUPS[index % len(NAME_GROUPS)]
+        code = referral_code(spec, index)
+        user_id = spec.base_id + index
+        # Emails and phones follow the id, so re-running a seed appends
+        users.append(Form(
+            id=user_id,
+            full_name=f"{rng.choice(group)} {index}",
+            last_name='Fixture',
+            email=f"fx{spec.seed}-{user_id}@fixtures.example.com",
+            phone_number=f"{spec.seed % 1000:03d}{user_id:010d}",
+            gender=rng.choice(['Male', 'Female', None]),
+            password=spec.password,
+            referral_code=code,
+            qr_code_image=f"qr_codes/{code}_qr.png",
+        ))
+    return users
+
+
+def build_referrals(spec, chunk):
+    """(user id, referrer id) pairs; referrer index = floor(i * u**skew)."""
+    rng = spec.rng(chunk, 'referrals')
+    pairs = []
+    for index in spec.chunk_range(chunk):
+        if index == 0 or rng.random() >= spec.referral_ratio:
+            continue
+        referrer = int(index * rng.random() ** spec.skew)
+        pairs.append((spec.base_id + index, spec.base_id + referrer))
+    return pairs
+
+
+def build_addresses(spec, chunk):
+    rng = spec.rng(chunk, 'addresses')
+    addresses = []
+    for index in spec.chunk_range(chunk):
+        for n in range(rng.randint(0, spec.max_addresses)):
+            city, state = rng.choice(CITIES)
+            address = Address(
+                user_id=spec.base_id + index, house_name=f"House {index}-{n}",
+                street_name=f"Street {rng.randint(1, 500)}", country='India',
+                state=state, city=city, pin=f"{rng.randint(100000, 999999)}",
+            )
+            address.normalize()  # search and dedupe keys; bulk_create skips save()
+            addresses.append(address)
+    return addresses
+
+
+def build_sellers(spec, chunk, category_ids):
+    """Returns [(seller, [category ids])]."""
+    rng = spec.rng(chunk, 'sellers')
+    sellers = []
+    for index in spec.chunk_range(chunk):
+        if rng.random() >= spec.seller_ratio:
+            continue
+        seller = SellerDetailsForm(
+            user_id=spec.base_id + index, store_name=f"Store {index}",
+            inventory_estimate=rng.choice(INVENTORY),
+        )
+        count = min(len(category_ids), rng.randint(1, spec.max_seller_categories))
+        sellers.append((seller, rng.sample(category_ids, count)))
+    return sellers
+
+
+def insert_chunk(spec, chunk, category_ids, with_referrals=False, batch_size=2000):
+    """
+    Phase 1: users, addresses and sellers of a chunk. Referrers always have
+    a lower index, so when chunks run in order `with_referrals` sets
+    referred_by here and link_chunk() is not needed.
+    """
+    users = build_users(spec, chunk)
+    if with_referrals:
+        referrers = dict(build_referrals(spec, chunk))
+        for user in users:
+            user.referred_by_id = referrers.get(user.id)
+
+    with transaction.atomic():
+        Form.objects.bulk_create(users, batch_size=batch_size)
+        Address.objects.bulk_create(build_addresses(spec, chunk), batch_size=batch_size)
+
+        sellers = build_sellers(spec, chunk, category_ids)
+        SellerDetailsForm.objects.bulk_create([seller for seller, _ in sellers], batch_size=batch_size)
+        through = SellerDetailsForm.categories.through
+        through.objects.bulk_create([
+            through(sellerdetailsform_id=seller.id, category_id=category_id)
+            for seller, categories in sellers
+            for category_id in categories
+        ], batch_size=batch_size)
+    return len(spec.chunk_range(chunk))
+
+
+def link_chunk(spec, chunk, batch_size=2000):
+    """Phase 2: point referred_by at the (now inserted) referrers."""
+    pairs = build_referrals(spec, chunk)
+    with transaction.atomic():
+        Form.objects.bulk_update(
+            [Form(id=user_id, referred_by_id=referrer_id) for user_id, referrer_id in pairs],
+            ['referred_by'], batch_size=batch_size,
+        )
+    return len(pairs)
+
+
+def default_password():
+    return make_password('fixture-password')
+
+
+# ==================== DUMP / LOAD ====================
+# Raw column values as gzipped JSON Lines, one file per table. Loading goes
+# through bulk_create on the concrete columns, skipping save() entirely.
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def dump_fixtures(directory, chunk_size=5000):
+    """Write every fixture table to <directory>/<name>.jsonl.gz; returns row counts."""
+    directory.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    for model, name in FIXTURE_TABLES:
+        columns = _columns(model)
+        count = 0
+        with gzip.open(directory / f"{name}.jsonl.gz", 'wb') as fh:
+            rows = model.objects.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+            for row in rows:
+                fh.write(dumps(dict(zip(columns, row))) + b'\n')
+                count += 1
+        counts[name] = count
+    return counts
+
+
+def load_fixtures(directory, batch_size=5000):
+    """Bulk-load a dump_fixtures() directory; returns row counts."""
+    counts = {}
+    for model, name in FIXTURE_TABLES:
+        path = directory / f"{name}.jsonl.gz"
+        if not path.exists():
+            continue
+        count = 0
+        with gzip.open(path, 'rt') as fh, transaction.atomic():
+            batch = []
+            for line in fh:
+                batch.append(model(**json.loads(line)))
+                if len(batch) >= batch_size:
+                    model.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        counts[name] = count
+    reset_sequences()
+    return counts
+
+
+def reset_sequences():
+    """Move PK sequences past explicitly inserted ids (PostgreSQL etc.)."""
+    models = [model for model, _ in FIXTURE_TABLES]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
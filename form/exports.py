@@ -0,0 +1,140 @@
+"""
+Streaming CSV / JSON Lines exports of users, referrals, addresses and sellers.
+
+Rows are read with values_list().iterator(chunk_size=...) (a server-side
+cursor on PostgreSQL), encoded one chunk at a time and optionally gzipped
+on the fly, so memory stays constant regardless of export size.
+Used by the /api/export/ endpoints and the `export_data` command.
+"""
+import csv
+import datetime
+import zlib
+from itertools import islice
+
+from cards.renderers import iter_json_lines, STREAM_CHUNK_BYTES
+from user.models import SellerDetailsForm
+from .models import Form, Address
+
+CHUNK_SIZE = 2000
+
+EXPORT_DATASETS = ('users', 'referrals', 'addresses', 'sellers')
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+USER_COLUMNS = (
+    'uuid', 'full_name', 'last_name', 'email', 'phone_number', 'gender',
+    'referral_code', 'referred_by__uuid', 'link_click_count', 'is_link_active',
+    'created_at',
+)
+ADDRESS_COLUMNS = (
+    'id', 'user__uuid', 'house_name', 'street_name', 'city', 'state', 'pin',
+    'country', 'created_at',
+)
+SELLER_COLUMNS = (
+    'id', 'user__uuid', 'store_name', 'inventory_estimate', 'specialization',
+    'created_at',
+)
+
+
+def _headers(columns):
+    # 'user__uuid' -> 'user_uuid'
+    return [column.replace('__', '_') for column in columns]
+
+
+def _iter(queryset, columns):
+    return queryset.order_by('id').values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _seller_rows():
+    """Seller rows plus a '|'-joined category list, one M2M query per chunk."""
+    rows = _iter(SellerDetailsForm.objects.all(), SELLER_COLUMNS)
+    through = SellerDetailsForm.categories.through
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        categories = {}
+        for seller_id, name in through.objects.filter(
+            sellerdetailsform_id__in=[row[0] for row in chunk]
+        ).order_by('category__name').values_list('sellerdetailsform_id', 'category__name'):
+            categories.setdefault(seller_id, []).append(name)
+        for row in chunk:
+            yield row + ('|'.join(categories.get(row[0], ())),)
+
+
+def get_export(dataset, user_uuid=None):
+    """
+    Return (headers, rows) for an export dataset.
+    Raises KeyError for an unknown dataset and Form.DoesNotExist when the
+    referral owner is missing.
+    """
+    if dataset == 'users':
+        return _headers(USER_COLUMNS), _iter(Form.objects.all(), USER_COLUMNS)
+    if dataset == 'referrals':
+        referrer = Form.objects.only('id').get(uuid=user_uuid)
+        return _headers(USER_COLUMNS), _iter(Form.objects.filter(referred_by=referrer), USER_COLUMNS)
+    if dataset == 'addresses':
+        return _headers(ADDRESS_COLUMNS), _iter(Address.objects.all(), ADDRESS_COLUMNS)
+    if dataset == 'sellers':
+        return _headers(SELLER_COLUMNS) + ['categories'], _seller_rows()
+    raise KeyError(dataset)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(headers, rows):
+    writer = csv.writer(_Echo())
+    buffer = [writer.writerow(headers)]
+    size = 0
+    for row in rows:
+        line = writer.writerow([_csv_value(value) for value in row])
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield ''.join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def iter_jsonl(headers, rows):
+    return iter_json_lines(dict(zip(headers, row)) for row in rows)
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(dataset, file_format='csv', compress=False, user_uuid=None):
+    """
+    Return (byte chunk iterator, filename, content type) for an export.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{file_format}'")
+
+    headers, rows = get_export(dataset, user_uuid)
+    if file_format == 'csv':
+        chunks, content_type = iter_csv(headers, rows), 'text/csv'
+    else:
+        chunks, content_type = iter_jsonl(headers, rows), 'application/x-ndjson'
+
+    filename = f"{dataset}.{file_format}"
+    if compress:
+        return iter_gzip(chunks), filename + '.gz', 'application/gzip'
+    return chunks, filename, content_type
@@ -0,0 +1,226 @@
+"""
+Bulk address import (CSV or JSON Lines) with upsert on the address key.
+
+Rows are read lazily and processed ADDRESS_IMPORT_CHUNK_SIZE at a time:
+owners are resolved with one uuid__in query per chunk, each row is
+normalized (Address.normalize(), which also computes address_key) and the
+chunk is written with one bulk_create(update_conflicts=True) on the
+(user, address_key) unique constraint. A row that matches an address the
+user already has updates its spelling instead of adding a duplicate; of
+several rows in one chunk with the same key, the last one wins.
+
+bulk_create() skips Address.save(), so the chunk's change-log entries,
+outbox events, region counts (new addresses only; an upsert never moves an address to
+another region) and owner updated_at stamps are written by hand in the same
+transaction. If two imports race on a new address, the region counts can
+drift by one; `manage.py rebuild_address_regions` recounts them.
+
+import_addresses() yields one result per input row:
+    {"row": 1-based row number, "status": created | updated | duplicate | error,
+     "id": address id or null, "errors": {field: message} or null}
+Used by POST /api/addresses/import/ and the `import_addresses` command.
+
+Settings:
+    ADDRESS_IMPORT_CHUNK_SIZE    rows per upsert (and per owner lookup)
+"""
+import codecs
+import csv
+import json
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from cards.middleware import registry
+from .models import Address, AddressRegionCount, ChangeLogEntry, Form, OutboxEvent
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_FIELDS = ('house_name', 'street_name', 'country', 'state', 'pin', 'city')
+REQUIRED_COLUMNS = ('user_uuid', *IMPORT_FIELDS)
+# Extra columns (e.g. id, created_at in an export file) are ignored
+
+CREATED = 'created'
+UPDATED = 'updated'
+DUPLICATE = 'duplicate'
+ERROR = 'error'
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_rows(lines, file_format):
+    """
+    Parse byte lines into dicts. The CSV header is checked before returning,
+    so a file without the required columns fails before anything is written;
+    after that a malformed line (bad UTF-8, broken CSV quoting, not JSON)
+    becomes an {"__error__": ...} row and reading goes on with the next one.
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise ImportFormatError(f"Unknown format {file_format!r}; choose one of: {', '.join(IMPORT_FORMATS)}")
+    # Undecodable bytes become lone surrogates, so one bad line cannot end the stream
+    text = codecs.iterdecode(lines, 'utf-8-sig', errors='surrogateescape')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportFormatError(f"CSV header is missing: {', '.join(missing)}")
+        return _csv_rows(reader)
+    return _json_lines(text)
+
+
+def _is_utf8(text):
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def _csv_rows(reader):
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield {'__error__': str(exc)}  # the reader resumes at the next line
+            continue
+        if all(_is_utf8(value) for value in row.values() if isinstance(value, str)):
+            yield row
+        else:
+            yield {'__error__': 'Not valid UTF-8'}
+
+
+def _json_lines(text):
+    for line in text:
+        if not line.strip():
+            continue
+        if not _is_utf8(line):
+            yield {'__error__': 'Not valid UTF-8'}
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {'__error__': 'Not a JSON object'}
+
+
+def clean_row(row):
+    """(user UUID, {field: value}, None) or (None, None, errors)."""
+    if '__error__' in row:
+        return None, None, {'row': row['__error__']}
+    errors = {}
+    values = {}
+    for name in IMPORT_FIELDS:
+        value = row.get(name)
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = str(value)  # e.g. a numeric pin in JSON
+        if not isinstance(value, str) or not value.strip():
+            errors[name] = 'This field is required.'
+        elif len(value) > Address._meta.get_field(name).max_length:
+            errors[name] = f'Ensure this field has no more than {Address._meta.get_field(name).max_length} characters.'
+        else:
+            values[name] = value.strip()
+    try:
+        user_uuid = uuid.UUID(str(row.get('user_uuid') or ''))
+    except ValueError:
+        user_uuid = None
+        errors['user_uuid'] = 'Must be a valid UUID.'
+    if errors:
+        return None, None, errors
+    return user_uuid, values, None
+
+
+def _result(number, status, address_id=None, errors=None):
+    return {"row": number, "status": status, "id": address_id, "errors": errors}
+
+
+def import_chunk(chunk):
+    """Upsert one chunk of (row number, row dict); returns its results in row order."""
+    results = {}
+    cleaned = []
+    for number, row in chunk:
+        user_uuid, values, errors = clean_row(row)
+        if errors:
+            results[number] = _result(number, ERROR, errors=errors)
+        else:
+            cleaned.append((number, user_uuid, values))
+
+    users = dict(Form.objects.filter(uuid__in={user_uuid for _, user_uuid, _ in cleaned}).values_list('uuid', 'id'))
+    latest = {}  # (user_id, address_key) -> row number, last occurrence wins
+    addresses = {}
+    duplicates = []
+    for number, user_uuid, values in cleaned:
+        if user_uuid not in users:
+            results[number] = _result(number, ERROR, errors={'user_uuid': 'User not found.'})
+            continue
+        address = Address(user_id=users[user_uuid], **values)
+        address.normalize()
+        key = (address.user_id, address.address_key)
+        if key in latest:
+            duplicates.append((latest[key], key))
+        latest[key] = number
+        addresses[key] = address
+
+    if addresses:
+        with transaction.atomic():
+            user_ids = {user_id for user_id, _ in addresses}
+            existing = set(
+                Address.objects.filter(user_id__in=user_ids, address_key__in={key for _, key in addresses})
+                .values_list('user_id', 'address_key')
+            )
+            Address.objects.bulk_create(
+                addresses.values(),
+                update_conflicts=True,
+                unique_fields=['user', 'address_key'],
+                update_fields=[*IMPORT_FIELDS, 'updated_at'],
+            )
+            # Primary keys are not returned for upserts on every backend
+            ids = {
+                (user_id, key): address_id
+                for user_id, key, address_id in Address.objects.filter(
+                    user_id__in=user_ids, address_key__in={key for _, key in addresses},
+                ).values_list('user_id', 'address_key', 'id')
+                if (user_id, key) in addresses
+            }
+            ChangeLogEntry.record_many(ChangeLogEntry.ADDRESS, [(user_id, address_id) for (user_id, _), address_id in ids.items()])
+            rows = Address.objects.in_bulk(ids.values())
+            OutboxEvent.objects.bulk_create([
+                OutboxEvent.build(rows[address_id], OutboxEvent.UPDATED if key in existing else OutboxEvent.CREATED)
+                for key, address_id in ids.items()
+            ])
+            _count_regions([address for key, address in addresses.items() if key not in existing])
+            Form.objects.filter(id__in=user_ids).update(updated_at=timezone.now())
+
+        for key, number in latest.items():
+            results[number] = _result(number, UPDATED if key in existing else CREATED, ids[key])
+        for number, key in duplicates:
+            results[number] = _result(number, DUPLICATE, ids[key])  # id of the row that was kept
+
+    return [results[number] for number, _ in chunk]
+
+
+def _count_regions(created):
+    counts = {}
+    for address in created:
+        region = address.region()
+        counts.setdefault(region[:3], [region, 0])[1] += 1
+    for region, count in counts.values():
+        AddressRegionCount.adjust(region, count)
+
+
+def import_addresses(rows, chunk_size=None):
+    """Import `rows` (dicts, e.g. from read_rows()), yielding one result per row."""
+    chunk_size = chunk_size or settings.ADDRESS_IMPORT_CHUNK_SIZE
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        results = import_chunk(chunk)
+        written = sum(1 for result in results if result['status'] in (CREATED, UPDATED))
+        registry.incr('addresses_imported', written, help_text='Addresses created or updated by bulk imports.')
+        yield from results
@@ -0,0 +1,456 @@
+"""
+Top-referrer leaderboards (all time, last 7 days, last 30 days).
+
+Each board is an indexable skip list of (-score, user id) keys plus a score
+map, so updating a user's score, top-K and "my rank" are O(log n) instead of
+a GROUP BY over the referred_by self-join per request.
+
+The boards are fed by tailing Form: refresh() reads referrals with an id
+above the last one seen, so every worker process converges on the same
+totals without hooks in the registration path. A small id overlap (TAIL_OVERLAP
+rows, deduplicated) catches transactions that commit out of id order. The
+time-bounded boards keep per-day counts for the last 30 days; when the date
+rolls over, the day leaving a window is subtracted from that board.
+
+Deleted and reassigned referrals are taken from the delta-sync change log
+(form.sync): every referral entry since the last refresh marks its owner -
+the old referrer too, for a move - and those referrers are recounted from
+Form. Writes that bypass the log (queryset updates, a deleted referrer's
+referrals set to NULL) are corrected by a full rebuild every
+LEADERBOARD_REBUILD_SECONDS, or as soon as compaction has purged entries
+the board has not read. Those rebuilds run the GROUP BY queries in a
+background thread; requests keep reading (and tailing) the current board
+and the finished one is swapped in under the lock, then tailed forward.
+
+State is snapshotted as JSON to LEADERBOARD_SNAPSHOT_PATH every
+LEADERBOARD_SNAPSHOT_SECONDS, so a restarted worker loads the snapshot and
+tails from there; only a missing or stale snapshot makes the first request
+of a process wait for a full build.
+
+Settings:
+    LEADERBOARD_REFRESH_SECONDS    minimum time between two tails of Form
+    LEADERBOARD_SNAPSHOT_PATH      JSON snapshot file (None disables snapshots)
+    LEADERBOARD_SNAPSHOT_SECONDS   how often a worker writes the snapshot
+    LEADERBOARD_REBUILD_SECONDS    how often a worker recounts from scratch
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncDate
+
+from .models import ChangeLogCompaction, ChangeLogEntry, Form
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = {'total': None, '7d': 7, '30d': 30}
+TAIL_OVERLAP = 200  # ids re-read on every tail to catch late commits
+RECOUNT_BATCH_SIZE = 500  # referrers per recount query
+SNAPSHOT_VERSION = 2
+# Everything build() recounts, swapped in as a whole by adopt()
+STATE = ('boards', 'days', 'today', 'last_id', 'seen', 'last_change_id', 'changes_seen')
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels  # positions to next[level]; the end counts as one past the last key
+
+
+class SkipList:
+    """Sorted unique keys with O(log n) insert, remove, rank and index."""
+
+    MAX_LEVELS = 24
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.head = _Node(None, self.MAX_LEVELS)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and self.rng.random() < 0.5:
+            levels += 1
+        return levels
+
+    def insert(self, key):
+        update = [None] * self.MAX_LEVELS
+        steps = [0] * self.MAX_LEVELS
+        node, pos = self.head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+            update[level], steps[level] = node, pos
+
+        new = _Node(key, self._random_levels())
+        for level in range(len(new.next)):
+            prev = update[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - (pos - steps[level])
+            prev.width[level] = pos + 1 - steps[level]
+        for level in range(len(new.next), self.MAX_LEVELS):
+            update[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * self.MAX_LEVELS
+        node = self.head
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            update[level] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for level in range(self.MAX_LEVELS):
+            prev = update[level]
+            if level < len(target.next) and prev.next[level] is target:
+                prev.width[level] += target.width[level] - 1
+                prev.next[level] = target.next[level]
+            else:
+                prev.width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """0-based position of `key`."""
+        node, pos = self.head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+        if node.next[0] is None or node.next[0].key != key:
+            raise KeyError(key)
+        return pos
+
+    def slice(self, offset, count):
+        """Up to `count` keys starting at 0-based position `offset`."""
+        node, pos = self.head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and pos + node.width[level] <= offset:
+                pos += node.width[level]
+                node = node.next[level]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Board:
+    """Scores per user, ranked highest first (ties: lower user id first)."""
+
+    def __init__(self):
+        self.scores = {}
+        self.ranking = SkipList()
+
+    def add(self, user_id, delta):
+        old = self.scores.get(user_id, 0)
+        new = old + delta
+        if old:
+            self.ranking.remove((-old, user_id))
+        if new > 0:
+            self.scores[user_id] = new
+            self.ranking.insert((-new, user_id))
+        else:
+            self.scores.pop(user_id, None)
+
+    def top(self, limit, offset=0):
+        return [(user_id, -score) for score, user_id in self.ranking.slice(offset, limit)]
+
+    def rank(self, user_id):
+        """(1-based rank, score), or None for users without referrals."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.ranking.rank((-score, user_id)) + 1, score
+
+    def __len__(self):
+        return len(self.ranking)
+
+
+class Leaderboard:
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.last_refresh = 0.0
+        self.last_snapshot = time.monotonic()
+        self.last_rebuild = time.monotonic()
+        self.rebuilding = False
+        self.reset(datetime.date.today())
+
+    def reset(self, today):
+        self.boards = {name: Board() for name in WINDOWS}
+        self.days = defaultdict(Counter)  # date -> referrals per user, last 30 days only
+        self.today = today
+        self.last_id = 0
+        self.seen = set()  # ids in the overlap range already applied
+        self.last_change_id = 0
+        self.changes_seen = set()  # change log ids in the overlap range already recounted
+
+    # -- updates -------------------------------------------------------
+
+    def in_window(self, day, window):
+        return window is None or (self.today - day).days < window
+
+    def apply(self, user_id, day, count=1):
+        for name, window in WINDOWS.items():
+            if self.in_window(day, window):
+                self.boards[name].add(user_id, count)
+        if self.in_window(day, WINDOWS['30d']):
+            self.days[day][user_id] += count
+
+    def advance(self, today):
+        """Move the sliding windows forward to `today`."""
+        while self.today < today:
+            self.today += datetime.timedelta(days=1)
+            for name, window in WINDOWS.items():
+                if window is None:
+                    continue
+                leaving = self.today - datetime.timedelta(days=window)
+                for user_id, count in self.days.get(leaving, {}).items():
+                    self.boards[name].add(user_id, -count)
+            self.days.pop(self.today - datetime.timedelta(days=WINDOWS['30d']), None)
+
+    def build(self):
+        """A new board recounted from Form; this one is left as it is."""
+        fresh = Leaderboard()
+        fresh.count_all()
+        return fresh
+
+    def adopt(self, fresh):
+        for name in STATE:
+            setattr(self, name, getattr(fresh, name))
+
+    def rebuild(self):
+        """Recount from scratch and swap the result in; the lock is only held for the swap."""
+        fresh = self.build()
+        with self.lock:
+            self.adopt(fresh)
+            self.loaded = True
+
+    def schedule_rebuild(self):
+        """Start rebuild() in a background thread, unless one is already running."""
+        self.last_rebuild = time.monotonic()
+        if self.rebuilding:
+            return
+        self.rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name='leaderboard-rebuild', daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Leaderboard rebuild failed")
+        finally:
+            self.rebuilding = False
+            connection.close()  # the thread's own connection
+
+    def count_all(self):
+        """GROUP BY recount of every board from Form."""
+        self.reset(datetime.date.today())
+        since = self.today - datetime.timedelta(days=WINDOWS['30d'] - 1)
+        referrals = Form.objects.filter(referred_by__isnull=False)
+        with transaction.atomic():
+            # Read first: a change committed during the recount is re-read, not missed
+            self.last_change_id = ChangeLogEntry.objects.aggregate(last=Max('id'))['last'] or 0
+            self.last_id = referrals.aggregate(last=Max('id'))['last'] or 0
+            totals = referrals.filter(id__lte=self.last_id).values_list('referred_by_id').annotate(n=Count('id')).order_by()
+            recent = (
+                referrals.filter(id__lte=self.last_id, created_at__gte=since)
+                .annotate(day=TruncDate('created_at'))
+                .values_list('referred_by_id', 'day')
+                .annotate(n=Count('id'))
+                .order_by()
+            )
+            for user_id, count in totals:
+                self.boards['total'].add(user_id, count)
+            for user_id, day, count in recent:
+                for name in ('7d', '30d'):
+                    if self.in_window(day, WINDOWS[name]):
+                        self.boards[name].add(user_id, count)
+                self.days[day][user_id] += count
+        self.seen = set(
+            referrals.filter(id__gt=self.last_id - TAIL_OVERLAP, id__lte=self.last_id).values_list('id', flat=True)
+        )
+
+    def tail(self):
+        """Apply referrals created since the last tail."""
+        rows = (
+            Form.objects.filter(referred_by__isnull=False, id__gt=self.last_id - TAIL_OVERLAP)
+            .order_by('id')
+            .values_list('id', 'referred_by_id', 'created_at')
+        )
+        for form_id, referrer_id, created_at in rows:
+            if form_id in self.seen:
+                continue
+            self.seen.add(form_id)
+            self.apply(referrer_id, created_at.date())
+            self.last_id = max(self.last_id, form_id)
+        floor = self.last_id - TAIL_OVERLAP
+        self.seen = {form_id for form_id in self.seen if form_id > floor}
+
+    def tail_changes(self):
+        """Recount the referrers whose referrals were changed, moved or deleted since the last tail."""
+        if ChangeLogCompaction.objects.filter(purged_through__gt=self.last_change_id).exists():
+            # Tombstones this board never read are gone; only a recount can correct it
+            if not self.rebuilding:
+                self.schedule_rebuild()
+            return
+        rows = ChangeLogEntry.objects.filter(
+            kind=ChangeLogEntry.REFERRAL, id__gt=self.last_change_id - TAIL_OVERLAP,
+        ).values_list('id', 'owner_id')
+        owners = set()
+        for entry_id, owner_id in rows:
+            if entry_id in self.changes_seen:
+                continue
+            self.changes_seen.add(entry_id)
+            owners.add(owner_id)
+            self.last_change_id = max(self.last_change_id, entry_id)
+        floor = self.last_change_id - TAIL_OVERLAP
+        self.changes_seen = {entry_id for entry_id in self.changes_seen if entry_id > floor}
+        owners = sorted(owners)
+        for start in range(0, len(owners), RECOUNT_BATCH_SIZE):
+            self.recount(owners[start:start + RECOUNT_BATCH_SIZE])
+
+    def recount(self, owners):
+        """Replace the scores of `owners` with their current counts in Form."""
+        since = self.today - datetime.timedelta(days=WINDOWS['30d'] - 1)
+        referrals = Form.objects.filter(referred_by_id__in=owners)
+        totals = dict(referrals.values_list('referred_by_id').annotate(n=Count('id')).order_by())
+        recent = (
+            referrals.filter(created_at__gte=since)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('referred_by_id', 'day')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for counts in self.days.values():
+            for user_id in owners:
+                counts.pop(user_id, None)
+        for user_id, day, count in recent:
+            if self.in_window(day, WINDOWS['30d']):
+                self.days[day][user_id] += count
+        for name, window in WINDOWS.items():
+            board = self.boards[name]
+            for user_id in owners:
+                if window is None:
+                    score = totals.get(user_id, 0)
+                else:
+                    score = sum(counts.get(user_id, 0) for day, counts in self.days.items() if self.in_window(day, window))
+                board.add(user_id, score - board.scores.get(user_id, 0))
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not self.loaded:
+                if not self.load_snapshot():
+                    self.adopt(self.build())  # nothing to serve yet
+                self.loaded = True
+            elif not force and now - self.last_refresh < settings.LEADERBOARD_REFRESH_SECONDS:
+                return
+            elif now - self.last_rebuild >= settings.LEADERBOARD_REBUILD_SECONDS:
+                self.schedule_rebuild()
+            self.advance(datetime.date.today())
+            self.tail()
+            self.tail_changes()
+            self.last_refresh = now
+            if self.snapshot_path and now - self.last_snapshot >= settings.LEADERBOARD_SNAPSHOT_SECONDS:
+                self.write_snapshot()
+                self.last_snapshot = now
+
+    # -- reads ---------------------------------------------------------
+
+    def top(self, window, limit, offset=0):
+        self.refresh()
+        with self.lock:
+            board = self.boards[window]
+            return board.top(limit, offset), len(board)
+
+    def ranks(self, user_id):
+        self.refresh()
+        with self.lock:
+            return {name: board.rank(user_id) for name, board in self.boards.items()}
+
+    # -- snapshots -----------------------------------------------------
+
+    def write_snapshot(self):
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'today': self.today.isoformat(),
+            'last_id': self.last_id,
+            'seen': sorted(self.seen),
+            'last_change_id': self.last_change_id,
+            'changes_seen': sorted(self.changes_seen),
+            'totals': self.boards['total'].scores,
+            'days': {day.isoformat(): counts for day, counts in self.days.items()},
+        }
+        tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w') as fh:
+                json.dump(state, fh)
+            os.replace(tmp, self.snapshot_path)
+        except OSError:
+            logger.warning("Could not write leaderboard snapshot to %s", self.snapshot_path, exc_info=True)
+
+    def load_snapshot(self):
+        """Restore from the snapshot; False if there is none or it does not match the database."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable leaderboard snapshot %s", self.snapshot_path, exc_info=True)
+            return False
+        top_id = Form.objects.aggregate(top=Max('id'))['top'] or 0
+        if state.get('version') != SNAPSHOT_VERSION or state['last_id'] > top_id:
+            return False  # older format, or the database was reset since
+
+        self.reset(datetime.date.fromisoformat(state['today']))
+        self.last_id = state['last_id']
+        self.seen = set(state['seen'])
+        self.last_change_id = state['last_change_id']
+        self.changes_seen = set(state['changes_seen'])
+        for user_id, count in state['totals'].items():
+            self.boards['total'].add(int(user_id), count)
+        for day, counts in state['days'].items():
+            day = datetime.date.fromisoformat(day)
+            for user_id, count in counts.items():
+                for name in ('7d', '30d'):
+                    if self.in_window(day, WINDOWS[name]):
+                        self.boards[name].add(int(user_id), count)
+                self.days[day][int(user_id)] += count
+        return True
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard():
+    """The process-wide leaderboard, loaded on first use."""
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard = Leaderboard(getattr(settings, 'LEADERBOARD_SNAPSHOT_PATH', None))
+    return _leaderboard
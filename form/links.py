@@ -0,0 +1,229 @@
+"""
+Unique-link lifecycle jobs.
+
+Expired links are switched off by sweep_expired_links() rather than checked
+on every hit: the `sweep_links` management command (cron, or `--every N` as
+a long-running worker) walks the partial index of active links by expiry
+time and deactivates them with one UPDATE per LINK_SWEEP_BATCH_SIZE rows.
+user_by_unique_link filters on active, unexpired tokens in SQL, so a link is
+unusable from its expiry time even before the sweep reaches it.
+
+set_link_expiry() assigns an expiry to many users at once (bulk TTL API).
+Sweeps, bulk expiry and code rotation write their own OutboxEvents (see
+form.outbox), since queryset updates skip Form.save().
+
+run_rotation() executes a LinkRotationJob: new unique-link tokens (drawn from
+`secrets` a batch at a time, collisions checked with one IN query) and/or
+new referral codes (one prefix query per batch instead of one per user),
+written with bulk_update per LINK_ROTATION_BATCH_SIZE users. Progress is
+saved on the job after every batch, so `rotate_links --job N` resumes where
+it stopped. Replaced codes are kept as RetiredReferralCode rows, which
+neither rotation nor registration hands out again. A new referral code
+invalidates the QR image; rotation clears it, which queues the user for
+render_pending_qr_codes().
+
+Counters (cards.middleware.registry, exported on /metrics when the job runs
+inside a web worker; the command also prints them):
+    cards_link_sweeps_total          sweep runs
+    cards_links_expired_total        links deactivated by the sweeper
+    cards_link_expiry_updates_total  users given an expiry through the bulk API
+    cards_links_rotated_total        users processed by rotation jobs
+    cards_qr_codes_rendered_total    QR images rendered from the queue
+
+Settings:
+    LINK_SWEEP_BATCH_SIZE       links deactivated per UPDATE
+    LINK_EXPIRY_MAX_USERS       users per bulk expiry / rotation request
+    LINK_ROTATION_BATCH_SIZE    users rotated per bulk_update
+    LINK_ROTATION_INLINE_MAX    API rotations up to this size run in the request
+"""
+import bisect
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from cards.middleware import registry
+from .models import Form, LinkRotationJob, OutboxEvent, RetiredReferralCode, generate_tokens, referral_prefix
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500  # ids per IN (...) list
+
+
+def usable_links(now=None):
+    """Active links that have not expired (served by form_active_link_idx)."""
+    now = now or timezone.now()
+    return Form.objects.filter(
+        Q(link_expires_at__isnull=True) | Q(link_expires_at__gt=now), is_link_active=True,
+    )
+
+
+def sweep_expired_links(now=None, batch_size=None):
+    """Deactivate every link that expired by `now`; returns how many."""
+    now = now or timezone.now()
+    batch_size = batch_size or settings.LINK_SWEEP_BATCH_SIZE
+    expired = Form.objects.filter(is_link_active=True, link_expires_at__lte=now)
+    started = time.perf_counter()
+    total = 0
+    while True:
+        ids = list(expired.order_by('link_expires_at').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            total += Form.objects.filter(id__in=ids, is_link_active=True).update(is_link_active=False, updated_at=now)
+            OutboxEvent.emit_for(Form, ids)
+        if len(ids) < batch_size:
+            break
+    registry.incr('link_sweeps', help_text='Expired-link sweep runs.')
+    registry.incr('links_expired', total, help_text='Links deactivated by the expiry sweeper.')
+    logger.info("Deactivated %d expired links in %.3fs", total, time.perf_counter() - started)
+    return total
+
+
+def set_link_expiry(uuids, expires_at):
+    """
+    Set link_expires_at (None clears it) for the given user uuids.
+    Returns the uuids that matched no user.
+    """
+    now = timezone.now()
+    found = set()
+    uuids = list(uuids)
+    for start in range(0, len(uuids), CHUNK_SIZE):
+        rows = list(Form.objects.filter(uuid__in=uuids[start:start + CHUNK_SIZE]).values_list('id', 'uuid'))
+        found.update(uuid for _, uuid in rows)
+        ids = [form_id for form_id, _ in rows]
+        with transaction.atomic():
+            Form.objects.filter(id__in=ids).update(link_expires_at=expires_at, updated_at=now)
+            OutboxEvent.emit_for(Form, ids)
+    registry.incr('link_expiry_updates', len(found), help_text='Users given a link expiry through the bulk API.')
+    return [uuid for uuid in uuids if uuid not in found]
+
+
+# ==================== ROTATION ====================
+
+def fresh_tokens(count):
+    """`count` new link tokens that no user holds."""
+    tokens = []
+    while len(tokens) < count:
+        candidates = set(generate_tokens(count - len(tokens))) - set(tokens)
+        taken = set(Form.objects.filter(unique_link_token__in=candidates).values_list('unique_link_token', flat=True))
+        tokens += candidates - taken
+    return tokens
+
+
+def fresh_referral_codes(names):
+    """
+    A new referral code for each full name: the lowest number its prefix has
+    neither in use nor retired, so a rotated-away code is never reissued.
+    """
+    prefixes = [referral_prefix(name) for name in names]
+    query = Q()
+    retired_query = Q()
+    for prefix in set(prefixes):
+        query |= Q(referral_code__startswith=prefix)
+        retired_query |= Q(code__startswith=prefix)
+    taken = defaultdict(set)
+    codes = Form.objects.filter(query).values_list('referral_code', flat=True)
+    retired = RetiredReferralCode.objects.filter(retired_query).values_list('code', flat=True)
+    for code in [*codes, *retired]:
+        if code[4:].isdigit():
+            taken[code[:4]].add(int(code[4:]))
+
+    codes = []
+    for prefix in prefixes:
+        number = 0
+        while number in taken[prefix]:
+            number += 1
+        taken[prefix].add(number)
+        codes.append(f"{prefix}{number:03d}")
+    return codes
+
+
+def next_batch(job, batch_size):
+    if job.user_ids is None:
+        return list(Form.objects.filter(id__gt=job.last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+    start = bisect.bisect_right(job.user_ids, job.last_id)
+    return job.user_ids[start:start + batch_size]
+
+
+def rotate_batch(job, ids, now):
+    users = list(Form.objects.filter(id__in=ids).only('id', 'full_name', 'referral_code').order_by('id'))
+    fields = ['updated_at']
+    if job.rotate_links:
+        fields += ['unique_link_token', 'link_created_at', 'link_click_count']
+        for user, token in zip(users, fresh_tokens(len(users))):
+            user.unique_link_token, user.link_created_at, user.link_click_count = token, now, 0
+    if job.rotate_codes:
+        fields += ['referral_code', 'qr_code_image']
+        RetiredReferralCode.objects.bulk_create(
+            [RetiredReferralCode(code=user.referral_code, retired_at=now) for user in users if user.referral_code],
+            ignore_conflicts=True,
+        )
+        for user, code in zip(users, fresh_referral_codes([user.full_name for user in users])):
+            user.referral_code, user.qr_code_image = code, None  # queued for a new QR image
+    for user in users:
+        user.updated_at = now
+    Form.objects.bulk_update(users, fields)
+    if job.rotate_codes:
+        OutboxEvent.emit_for(Form, ids)  # the token is not in the event payload; the code is
+
+
+def run_rotation(job, batch_size=None, progress=None):
+    """Process `job` from its last_id to the end; `progress(job)` is called after each batch."""
+    batch_size = batch_size or settings.LINK_ROTATION_BATCH_SIZE
+    if job.status == LinkRotationJob.DONE:
+        return job
+    job.status = LinkRotationJob.RUNNING
+    job.save(update_fields=['status', 'updated_at'])
+    while True:
+        ids = next_batch(job, batch_size)
+        if not ids:
+            break
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    rotate_batch(job, ids, timezone.now())
+                    job.last_id = ids[-1]
+                    job.processed += len(ids)
+                    job.save(update_fields=['last_id', 'processed', 'updated_at'])
+                break
+            except IntegrityError:
+                # A registration took one of the new codes meanwhile; draw again
+                job.refresh_from_db(fields=['last_id', 'processed'])
+                if attempt == 2:
+                    raise
+        registry.incr('links_rotated', len(ids), help_text='Users processed by link rotation jobs.')
+        if progress:
+            progress(job)
+    job.status = LinkRotationJob.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return job
+
+
+def create_rotation(user_ids=None, links=True, codes=False):
+    """A pending job for the given user ids (None: every user)."""
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+    total = len(user_ids) if user_ids is not None else Form.objects.count()
+    return LinkRotationJob.objects.create(rotate_links=links, rotate_codes=codes, user_ids=user_ids, total=total)
+
+
+def render_pending_qr_codes(batch_size=100, limit=None):
+    """Render QR images for users without one (e.g. after a code rotation); returns how many."""
+    pending = Form.objects.filter(Q(qr_code_image='') | Q(qr_code_image__isnull=True), referral_code__isnull=False)
+    rendered, last_id = 0, 0
+    while limit is None or rendered < limit:
+        users = list(pending.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not users:
+            break
+        for user in users:
+            user.generate_qr_code()
+        rendered += len(users)
+        last_id = users[-1].id
+        registry.incr('qr_codes_rendered', len(users), help_text='QR images rendered from the queue.')
+    return rendered
@@ -0,0 +1,165 @@
+"""
+Live referral dashboard: new referrals and link clicks pushed to clients.
+
+A dashboard fetches user_referral_dashboard / referral_analytics once and
+then subscribes by user UUID instead of polling them:
+
+    GET /api/dashboard/<uuid>/live/    Server-Sent Events (text/event-stream)
+    WS  /ws/dashboard/<uuid>/          WebSocket, one JSON text frame per event
+
+Both are served by the ASGI application (cards.asgi) in front of Django, so
+a connection holds no thread and no database connection while idle; under
+WSGI these paths do not exist. Events are compact deltas:
+
+    {"type": "referral", "referral": {uuid, full_name, last_name, email, referred_date}}
+    {"type": "clicks", "count": N}     link clicks since the previous clicks event
+    {"type": "resync"}                 events were dropped; refetch the dashboard
+
+Referrals are published by FormSerializer.create once the signup commits,
+clicks by the click buffer each time it flushes, through cards.pubsub.
+SSE connections get a keep-alive comment every LIVE_HEARTBEAT_SECONDS.
+
+Settings:
+    LIVE_HEARTBEAT_SECONDS    SSE keep-alive interval on idle connections
+    (see cards.pubsub for the broker settings)
+"""
+import asyncio
+import re
+import uuid
+
+from django.conf import settings
+
+from cards.pubsub import CLOSED, RESYNC, TooManySubscribers, get_broker
+from cards.renderers import dumps
+from .models import Form
+
+SSE_PATH = re.compile(r'^/api/dashboard/(?P<uuid>[0-9a-fA-F-]{32,36})/live/$')
+WEBSOCKET_PATH = re.compile(r'^/ws/dashboard/(?P<uuid>[0-9a-fA-F-]{32,36})/$')
+RESYNC_MESSAGE = dumps({"type": "resync"})
+
+
+def topic(user_id):
+    return f'dashboard:{user_id}'
+
+
+# ==================== PUBLISHING ====================
+
+def publish_referral(user):
+    """A new signup, on the referrer's dashboard (call after commit)."""
+    if user.referred_by_id:
+        get_broker().publish(topic(user.referred_by_id), {
+            "type": "referral",
+            "referral": {
+                "uuid": user.uuid,
+                "full_name": user.full_name,
+                "last_name": user.last_name,
+                "email": user.email,
+                "referred_date": user.created_at,
+            },
+        })
+
+
+def publish_clicks(counts):
+    """Clicks per user id from one click-buffer flush."""
+    broker = get_broker()
+    for user_id, count in counts.items():
+        broker.publish(topic(user_id), {"type": "clicks", "count": count})
+
+
+# ==================== ASGI ====================
+
+async def _user_id(raw_uuid):
+    try:
+        value = uuid.UUID(raw_uuid)
+    except ValueError:
+        return None
+    return await Form.objects.filter(uuid=value).values_list('id', flat=True).afirst()
+
+
+async def _watch_disconnect(receive, subscription):
+    while True:
+        message = await receive()
+        if message['type'] in ('http.disconnect', 'websocket.disconnect'):
+            subscription.close()
+            return
+
+
+async def _json_response(send, status, message):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': dumps({"code": status, "message": message})})
+
+
+async def _stream(subscription, receive, emit, heartbeat=None):
+    """Pump events to `emit(message or None)` until the client goes away."""
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, subscription))
+    try:
+        while True:
+            message = await subscription.get(heartbeat)
+            if message is CLOSED:
+                return
+            await emit(RESYNC_MESSAGE if message is RESYNC else message)
+    finally:
+        watcher.cancel()
+        get_broker().unsubscribe(subscription)
+
+
+async def sse(scope, receive, send, raw_uuid):
+    if scope['method'] != 'GET':
+        return await _json_response(send, 405, "Method not allowed")
+    user_id = await _user_id(raw_uuid)
+    if user_id is None:
+        return await _json_response(send, 404, "User not found")
+    try:
+        subscription = get_broker().subscribe(topic(user_id))
+    except TooManySubscribers:
+        return await _json_response(send, 503, "Too many live connections; poll the dashboard instead")
+
+    headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+               (b'x-accel-buffering', b'no')]
+    if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+        headers.append((b'access-control-allow-origin', b'*'))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+    async def emit(message):
+        body = b': keep-alive\n\n' if message is None else b'data: ' + message + b'\n\n'
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    await _stream(subscription, receive, emit, settings.LIVE_HEARTBEAT_SECONDS)
+
+
+async def websocket(scope, receive, send, raw_uuid):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    user_id = await _user_id(raw_uuid)
+    if user_id is None:
+        return await send({'type': 'websocket.close', 'code': 4404})
+    try:
+        subscription = get_broker().subscribe(topic(user_id))
+    except TooManySubscribers:
+        return await send({'type': 'websocket.close', 'code': 1013})  # try again later
+    await send({'type': 'websocket.accept'})
+
+    async def emit(message):
+        await send({'type': 'websocket.send', 'text': message.decode()})
+
+    # The server's WebSocket pings keep idle connections alive
+    await _stream(subscription, receive, emit)
+
+
+def with_live_routes(application):
+    """Wrap the Django ASGI application so the live paths bypass it."""
+    async def router(scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] == 'http':
+            match = SSE_PATH.match(path)
+            if match:
+                return await sse(scope, receive, send, match['uuid'])
+        elif scope['type'] == 'websocket':
+            match = WEBSOCKET_PATH.match(path)
+            if match:
+                return await websocket(scope, receive, send, match['uuid'])
+            return await send({'type': 'websocket.close', 'code': 4404})
+        return await application(scope, receive, send)
+    return router
@@ -0,0 +1,91 @@
+import json
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def read_collapsed(path):
+    stacks = Counter()
+    with open(path) as fh:
+        for line in fh:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def to_speedscope(view, stacks):
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        sample = []
+        for name in stack.split(';'):
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({'name': name})
+            sample.append(index[name])
+        samples.append(sample)
+        weights.append(count)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': view,
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': view,
+            'unit': 'none',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+class Command(BaseCommand):
+    help = "Merge collapsed-stack profiles from PROFILE_DIR per view name"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default=None, help="Profile directory (default: PROFILE_DIR)")
+        parser.add_argument('--output', default=None, help="Output directory (default: <input>/aggregated)")
+        parser.add_argument('--view', help="Only aggregate this URL name")
+        parser.add_argument('--format', dest='out_format', choices=['collapsed', 'speedscope'], default='collapsed')
+        parser.add_argument('--top', type=int, default=10, help="Hottest leaf frames to print per view")
+
+    def handle(self, *args, **options):
+        source = Path(options['input'] or settings.PROFILE_DIR)
+        if not source.is_dir():
+            raise CommandError(f"No profile directory at {source}")
+        target = Path(options['output'] or source / 'aggregated')
+        target.mkdir(parents=True, exist_ok=True)
+
+        per_view = defaultdict(Counter)
+        for path in source.glob('*.collapsed'):
+            view = path.name.split('.', 1)[0]
+            if options['view'] and view != options['view']:
+                continue
+            per_view[view].update(read_collapsed(path))
+
+        if not per_view:
+            self.stdout.write("No profiles found.")
+            return
+
+        for view, stacks in sorted(per_view.items()):
+            if options['out_format'] == 'speedscope':
+                out = target / f"{view}.speedscope.json"
+                out.write_text(json.dumps(to_speedscope(view, stacks)))
+            else:
+                out = target / f"{view}.collapsed"
+                out.write_text(''.join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+            total = sum(stacks.values())
+            leaves = Counter()
+            for stack, count in stacks.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+            self.stdout.write(self.style.SUCCESS(f"{view}: {total} samples -> {out}"))
+            for frame, count in leaves.most_common(options['top']):
+                self.stdout.write(f"  {count * 100 / total:5.1f}%  {frame}")
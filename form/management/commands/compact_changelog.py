@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from form.sync import backfill, compact
+
+
+class Command(BaseCommand):
+    help = "Purge old delta-sync tombstones, optionally logging rows that have no change log entry yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Keep tombstones this many days (default: SYNC_TOMBSTONE_DAYS)")
+        parser.add_argument('--backfill', action='store_true', help="Log existing rows missing from the change log")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f"Logged {backfill()} existing rows")
+        purged = compact(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} tombstones"))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from form.exports import stream_export, EXPORT_DATASETS, EXPORT_FORMATS
+from form.models import Form
+
+
+class Command(BaseCommand):
+    help = "Stream users, referrals, addresses or sellers to a CSV / JSON Lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=EXPORT_DATASETS)
+        parser.add_argument('--format', dest='file_format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output on the fly")
+        parser.add_argument('--user-uuid', help="Referrer UUID (required for 'referrals')")
+        parser.add_argument('--output', '-o', help="Output file (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        if dataset == 'referrals' and not options['user_uuid']:
+            raise CommandError("--user-uuid is required for the referrals export")
+
+        try:
+            chunks, filename, _ = stream_export(
+                dataset, options['file_format'],
+                compress=options['gzip'],
+                user_uuid=options['user_uuid'],
+            )
+        except (Form.DoesNotExist, ValidationError):
+            raise CommandError(f"User {options['user_uuid']} not found")
+
+        output = options['output']
+        out = open(output, 'wb') if output else sys.stdout.buffer
+        try:
+            written = 0
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if output:
+                out.close()
+
+        if output:
+            self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {output}"))
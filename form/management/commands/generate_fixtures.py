@@ -0,0 +1,129 @@
+import multiprocessing
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Max
+
+from form.datagen import (
+    FixtureSpec, MAX_CODE_NUMBER, default_password, ensure_categories, last_code_number,
+    insert_chunk, link_chunk, dump_fixtures, load_fixtures, reset_sequences,
+)
+from form.models import Form
+
+
+def _run(task):
+    # Runs in a worker process; each one opens its own DB connection
+    func, args = task
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic large dataset (users, power-law referral trees, "
+        "addresses, sellers, categories) with bulk inserts, or dump/load it as fixtures"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--workers', type=int, default=1, help="Parallel processes (ignored on SQLite)")
+        parser.add_argument('--chunks', help="Only build these chunks, e.g. '0-9' or '3,7' (for sharding across machines)")
+        parser.add_argument(
+            '--phase', choices=['all', 'users', 'referrals'], default='all',
+            help="When sharding, run 'users' on every shard before any shard runs 'referrals'",
+        )
+        parser.add_argument('--base-id', type=int, help="First user id (default: max existing id + 1)")
+        parser.add_argument('--skew', type=float, default=3.0, help="Power-law skew of the referral tree")
+        parser.add_argument('--categories', type=int, default=200)
+        parser.add_argument('--dump', metavar='DIR', help="Dump fixture tables to DIR after generating")
+        parser.add_argument('--load', metavar='DIR', help="Load a previous --dump instead of generating")
+
+    def handle(self, *args, **options):
+        if options['load']:
+            self.load(Path(options['load']))
+            return
+
+        base_id = options['base_id']
+        if base_id is None:
+            base_id = (Form.objects.aggregate(top=Max('id'))['top'] or 0) + 1
+
+        spec = FixtureSpec(
+            users=options['users'], seed=options['seed'], chunk_size=options['chunk_size'],
+            base_id=base_id, skew=options['skew'], categories=options['categories'],
+            password=default_password(),
+        )
+        if last_code_number(spec) > MAX_CODE_NUMBER:
+            raise CommandError(f"Referral codes would pass {MAX_CODE_NUMBER}; use fewer --users or a lower --base-id")
+        chunks = self.parse_chunks(options['chunks'], spec.chunks)
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and workers > 1:
+            self.stderr.write("SQLite allows a single writer; using --workers 1")
+            workers = 1
+
+        started = time.monotonic()
+        category_ids = ensure_categories(spec)
+
+        # In-order, single-process runs can set referrers during the insert;
+        # parallel or sharded runs link them in a second pass
+        inline = workers == 1 and options['phase'] == 'all' and not options['chunks']
+        if options['phase'] in ('all', 'users'):
+            tasks = [(spec, chunk, category_ids, inline) for chunk in chunks]
+            self.run_phase('users', insert_chunk, tasks, workers)
+        if options['phase'] in ('all', 'referrals') and not inline:
+            self.run_phase('referrals', link_chunk, [(spec, chunk) for chunk in chunks], workers)
+        reset_sequences()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {sum(len(spec.chunk_range(c)) for c in chunks)} users "
+            f"(ids {base_id}..{base_id + spec.users - 1}, seed {spec.seed}) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+        if options['dump']:
+            counts = dump_fixtures(Path(options['dump']))
+            self.stdout.write(f"Dumped {counts} to {options['dump']}")
+
+    def parse_chunks(self, value, total):
+        if not value:
+            return list(range(total))
+        chunks = set()
+        for part in value.split(','):
+            start, _, end = part.partition('-')
+            chunks.update(range(int(start), int(end or start) + 1))
+        invalid = [chunk for chunk in chunks if chunk >= total]
+        if invalid:
+            raise CommandError(f"Chunks {invalid} out of range (0-{total - 1})")
+        return sorted(chunks)
+
+    def run_phase(self, name, func, tasks, workers):
+        started = time.monotonic()
+        done = 0
+        if workers > 1:
+            connections.close_all()  # don't share the parent's connection with forked workers
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for count in pool.imap_unordered(_run, [(func, task) for task in tasks]):
+                    done += count
+                    self.progress(name, done, started)
+        else:
+            for task in tasks:
+                done += func(*task)
+                self.progress(name, done, started)
+        self.stdout.write('')
+
+    def progress(self, name, done, started):
+        rate = done / max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f"\r{name}: {done} rows ({rate:,.0f}/s)", ending='')
+        self.stdout.flush()
+
+    def load(self, directory):
+        if not directory.is_dir():
+            raise CommandError(f"No fixture directory at {directory}")
+        started = time.monotonic()
+        counts = load_fixtures(directory)
+        self.stdout.write(self.style.SUCCESS(f"Loaded {counts} in {time.monotonic() - started:.1f}s"))
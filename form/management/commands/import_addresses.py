@@ -0,0 +1,42 @@
+import json
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from form.imports import IMPORT_FORMATS, ImportFormatError, import_addresses, read_rows
+
+
+class Command(BaseCommand):
+    help = "Upsert addresses from a CSV / JSON Lines file, writing one JSON result line per row"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file ('-' for stdin)")
+        parser.add_argument('--format', dest='file_format', choices=IMPORT_FORMATS,
+                            help="Input format (default: from the file extension)")
+        parser.add_argument('--chunk-size', type=int, help="Rows per upsert (default ADDRESS_IMPORT_CHUNK_SIZE)")
+        parser.add_argument('--output', '-o', help="Result file (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        source = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        output = options['output']
+        out = open(output, 'w') if output else self.stdout
+        statuses = Counter()
+        try:
+            try:
+                rows = read_rows(source, file_format)
+            except ImportFormatError as exc:
+                raise CommandError(str(exc))
+            for result in import_addresses(rows, options['chunk_size']):
+                statuses[result['status']] += 1
+                out.write(json.dumps(result) + '\n')
+        finally:
+            if path != '-':
+                source.close()
+            if output:
+                out.close()
+
+        summary = ', '.join(f"{count} {name}" for name, count in sorted(statuses.items())) or 'no rows'
+        self.stderr.write(self.style.SUCCESS(f"Imported addresses: {summary}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from form.regions import rebuild_regions
+
+
+class Command(BaseCommand):
+    help = "Re-normalize address search keys and recount the per-region address totals"
+
+    def handle(self, *args, **options):
+        count = rebuild_regions()
+        self.stdout.write(self.style.SUCCESS(f"Recounted regions for {count} addresses"))
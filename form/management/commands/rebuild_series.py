@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from form.models import UserSeries
+from form.timeseries import rebuild_series
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user referral/click time series from the source tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--metric', choices=[choice for choice, _ in UserSeries.METRIC_CHOICES],
+            help="Only rebuild this metric (default: all)",
+        )
+
+    def handle(self, *args, **options):
+        metrics = [options['metric']] if options['metric'] else [choice for choice, _ in UserSeries.METRIC_CHOICES]
+        for metric in metrics:
+            count = rebuild_series(metric)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} {metric} series"))
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from form.outbox import pending, publish_snapshot, purge, relay_all
+
+
+class Command(BaseCommand):
+    help = "Publish outbox change events to the configured sinks (at-least-once, in id order)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sink', action='append', dest='sinks', help="Only this sink (repeatable)")
+        parser.add_argument('--every', type=float, metavar='SECONDS', help="Keep running, relaying at this interval")
+        parser.add_argument('--batch-size', type=int, help="Events per publish (default: OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--snapshot', action='store_true', help="First queue every current row, to seed a new consumer")
+        parser.add_argument('--no-purge', action='store_true', help="Keep events every sink has received")
+
+    def handle(self, *args, **options):
+        sinks = options['sinks'] or list(settings.OUTBOX_SINKS)
+        unknown = set(sinks) - set(settings.OUTBOX_SINKS)
+        if unknown:
+            raise CommandError(f"Unknown sink(s): {', '.join(sorted(unknown))}")
+        if options['snapshot']:
+            self.stdout.write(f"Queued {publish_snapshot()} snapshot events")
+
+        while True:
+            published = relay_all(sinks, options['batch_size'])
+            purged = 0 if options['no_purge'] else purge()
+            self.stdout.write(
+                ', '.join(f"{name}: {count} published, {pending(name)} pending" for name, count in published.items())
+                + f" ({purged} purged)"
+            )
+            if not options['every']:
+                break
+            time.sleep(options['every'])
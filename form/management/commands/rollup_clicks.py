@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from form.clicks import rollup_clicks
+
+
+class Command(BaseCommand):
+    help = "Fold raw unique-link clicks into hourly/daily rollups and prune old hourly buckets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS', help="Keep running, compacting at this interval")
+
+    def handle(self, *args, **options):
+        while True:
+            folded = rollup_clicks()
+            self.stdout.write(f"Rolled up {folded} clicks")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from form.links import create_rotation, render_pending_qr_codes, run_rotation
+from form.models import Form, LinkRotationJob
+
+
+class Command(BaseCommand):
+    help = "Rotate unique links and/or referral codes in resumable batches, then render queued QR codes"
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--all', action='store_true', help="Start a new job covering every user")
+        target.add_argument('--uuids-file', help="Start a new job for the user UUIDs listed in this file, one per line")
+        target.add_argument('--job', type=int, help="Resume this job")
+        target.add_argument('--pending', action='store_true', help="Run every queued or interrupted job")
+        target.add_argument('--qr-only', action='store_true', help="Only render queued QR codes")
+        parser.add_argument('--codes', action='store_true', help="Rotate referral codes (new jobs)")
+        parser.add_argument('--no-links', action='store_true', help="Keep unique links (new jobs)")
+        parser.add_argument('--batch-size', type=int, help="Users per batch (default: LINK_ROTATION_BATCH_SIZE)")
+        parser.add_argument('--no-qr', action='store_true', help="Leave QR rendering for a later run")
+
+    def handle(self, *args, **options):
+        links, codes = not options['no_links'], options['codes']
+        if options['all'] or options['uuids_file']:
+            if not (links or codes):
+                raise CommandError("Nothing to rotate: --no-links without --codes")
+            user_ids = None
+            if options['uuids_file']:
+                with open(options['uuids_file']) as fh:
+                    wanted = [line.strip() for line in fh if line.strip()]
+                user_ids = list(Form.objects.filter(uuid__in=wanted).values_list('id', flat=True))
+            jobs = [create_rotation(user_ids, links, codes)]
+        elif options['job']:
+            jobs = list(LinkRotationJob.objects.filter(id=options['job']))
+            if not jobs:
+                raise CommandError(f"No rotation job {options['job']}")
+        elif options['pending']:
+            jobs = list(LinkRotationJob.objects.exclude(status=LinkRotationJob.DONE).order_by('id'))
+        else:
+            jobs = []
+
+        for job in jobs:
+            self.stdout.write(f"Job {job.id}: {job.processed}/{job.total} users done, resuming")
+            run_rotation(job, options['batch_size'], progress=self.report)
+            self.stdout.write(self.style.SUCCESS(f"Job {job.id}: rotated {job.processed} users"))
+
+        if not options['no_qr']:
+            rendered = render_pending_qr_codes()
+            self.stdout.write(f"Rendered {rendered} QR codes")
+
+    def report(self, job):
+        percent = 100 * job.processed / job.total if job.total else 100
+        self.stdout.write(f"Job {job.id}: {job.processed}/{job.total} ({percent:.1f}%)")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards.middleware import registry
+from form.links import sweep_expired_links
+
+
+class Command(BaseCommand):
+    help = "Deactivate unique links whose expiry time has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS', help="Keep running, sweeping at this interval")
+        parser.add_argument('--batch-size', type=int, help="Links per UPDATE (default: LINK_SWEEP_BATCH_SIZE)")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = sweep_expired_links(batch_size=options['batch_size'])
+            totals = registry.counters()
+            self.stdout.write(
+                f"Deactivated {expired} expired links "
+                f"(runs={totals.get('link_sweeps', 0)} total={totals.get('links_expired', 0)})"
+            )
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -1,8 +1,12 @@
 # models.py
+import hashlib
 import uuid
-import random
+import secrets
 import string
-from django.db import models
+import threading
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from datetime import datetime
@@ -11,11 +15,36 @@ import re
 import qrcode
 from io import BytesIO
 from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+TOKEN_ALPHABET = string.ascii_letters + string.digits
+TOKEN_LENGTH = 32
+# bytes.translate table: byte b -> TOKEN_ALPHABET[b % 62]; bytes >= 248 are
+# dropped so every character is equally likely
+_TOKEN_TABLE = bytes(ord(TOKEN_ALPHABET[b % len(TOKEN_ALPHABET)]) for b in range(256))
+_TOKEN_REJECT = bytes(range(256 - 256 % len(TOKEN_ALPHABET), 256))
+
+
+def generate_tokens(count, length=TOKEN_LENGTH):
+    """`count` random [A-Za-z0-9] tokens from the OS CSPRNG, in bulk."""
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        chars += secrets.token_bytes(needed - len(chars) + 64).translate(_TOKEN_TABLE, _TOKEN_REJECT)
+    text = chars[:needed].decode('ascii')
+    return [text[i:i + length] for i in range(0, needed, length)]
 
 
 # Function to generate a unique link token
 def generate_unique_link_token():
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=32))
+    return generate_tokens(1)[0]
+
+
+def referral_prefix(full_name):
+    """First 4 letters of the name, upper-cased and padded with X."""
+    clean_name = re.sub(r'[^a-zA-Z]', '', full_name.upper())
+    return clean_name[:4].ljust(4, 'X')
 
 
 def generate_referral_code(full_name):
@@ -23,24 +52,21 @@ def generate_referral_code(full_name):
     Generate referral code: first 4 letters of name + 3-digit number starting from 000
     Example: John Doe -> JOHN000, JOHN001, JOHN002, etc.
     """
-    # Clean the name and get first 4 letters
-    clean_name = re.sub(r'[^a-zA-Z]', '', full_name.upper())
-    name_prefix = clean_name[:4].ljust(4, 'X')  # Pad with X if less than 4 letters
+    name_prefix = referral_prefix(full_name)
     
     # Find the next available number for this name prefix
     existing_codes = Form.objects.filter(
         referral_code__startswith=name_prefix
     ).values_list('referral_code', flat=True)
+    retired_codes = RetiredReferralCode.objects.filter(
+        code__startswith=name_prefix
+    ).values_list('code', flat=True)
     
-    # Extract numbers from existing codes
-    existing_numbers = []
-    for code in existing_codes:
-        if len(code) == 7:  # Should be 4 letters + 3 digits
-            try:
-                number = int(code[4:])
-                existing_numbers.append(number)
-            except ValueError:
-                continue
+    # Extract numbers from existing and retired codes (4 letters + 3 or more digits)
+    existing_numbers = set()
+    for code in [*existing_codes, *retired_codes]:
+        if code[4:].isdigit():
+            existing_numbers.add(int(code[4:]))
     
     # Find the next available number
     next_number = 0
@@ -51,7 +77,131 @@ def generate_referral_code(full_name):
     return f"{name_prefix}{next_number:03d}"
 
 
-class Form(models.Model):
+class FormQuerySet(models.QuerySet):
+    """
+    Read-optimized projections. None of them load the password hash or
+    the link bookkeeping columns that read endpoints never render.
+    """
+    # Columns rendered by FormSerializer (qr_code_image feeds qr_code_url)
+    LISTING_FIELDS = (
+        'uuid', 'full_name', 'last_name', 'email', 'phone_number', 'gender',
+        'referral_code', 'qr_code_image', 'unique_link_token',
+        'link_click_count', 'is_link_active', 'created_at',
+    )
+    # Columns rendered by UserInfoSerializer
+    USER_INFO_FIELDS = (
+        'full_name', 'last_name', 'email', 'phone_number',
+        'referral_code', 'unique_link_token',
+    )
+    # Row shape used by the dashboard, referral list and search endpoints
+    REFERRAL_ROW_FIELDS = (
+        'uuid', 'full_name', 'last_name', 'email', 'phone_number',
+        'gender', 'created_at',
+    )
+
+    def for_listing(self):
+        return self.only(*self.LISTING_FIELDS)
+
+    def for_user_info(self):
+        return self.only(*self.USER_INFO_FIELDS)
+
+    def referral_rows(self):
+        return self.values(*self.REFERRAL_ROW_FIELDS)
+
+
+class ChangeLogged(models.Model):
+    """
+    Rows that appear in their owner's delta-sync feed (form.sync) and in the
+    change-event outbox (form.outbox). Saves that touch `sync_fields` are
+    written to ChangeLogEntry and saves that touch `outbox_fields` to
+    OutboxEvent, in the same transaction as the row. Deletes go to both
+    through log_deletion(), a post_delete receiver each subclass connects,
+    so rows removed by a cascade or a queryset delete() are covered too.
+    Queryset update() and bulk_create() bypass this, so bulk writers log
+    and publish their own changes.
+    """
+    sync_kind = None    # ChangeLogEntry.kind
+    sync_owner = None   # attname of the owning user's id
+    sync_fields = None  # fields in the synced payload; None means all
+    outbox_topic = None  # OutboxEvent.topic
+    outbox_fields = ()   # fields in the event payload (plus id and updated_at)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._synced_owner = instance.__dict__.get(cls.sync_owner)  # None when deferred
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or self.sync_fields is None or set(update_fields) & set(self.sync_fields):
+                self.log_change()
+            if update_fields is None or set(update_fields) & set(self.outbox_fields):
+                OutboxEvent.emit_many([self], OutboxEvent.CREATED if adding else OutboxEvent.UPDATED)
+
+    def log_change(self):
+        owner = getattr(self, self.sync_owner)
+        previous = getattr(self, '_synced_owner', None)
+        if previous and previous != owner:
+            ChangeLogEntry.record(previous, self.sync_kind, self.pk, deleted=True)  # moved away
+        if owner:
+            ChangeLogEntry.record(owner, self.sync_kind, self.pk)
+        self._synced_owner = owner
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():  # log_deletion() commits with the delete
+            return super().delete(*args, **kwargs)
+
+    def outbox_payload(self):
+        payload = {'id': self.pk}
+        for name in self.outbox_fields:
+            field = self._meta.get_field(name)
+            payload[field.attname] = field.value_from_object(self)
+        payload['updated_at'] = self.updated_at
+        return payload
+
+
+def log_deletion(sender, instance, origin=None, **kwargs):
+    """post_delete receiver for ChangeLogged models: tombstone and outbox event."""
+    owner = getattr(instance, sender.sync_owner)
+    if owner and not _deletes_user(origin, owner):
+        ChangeLogEntry.record(owner, sender.sync_kind, instance.pk, deleted=True)
+    OutboxEvent.objects.create(topic=sender.outbox_topic, aggregate_id=instance.pk, event=OutboxEvent.DELETED)
+
+
+# Users collected by the delete in progress on this thread, keyed by its origin
+_deleting = threading.local()
+
+
+def collect_deleted_user(sender, instance, origin=None, **kwargs):
+    """pre_delete receiver for Form; the collector sends it for every row before deleting any."""
+    if getattr(_deleting, 'origin', None) is not origin:
+        _deleting.origin, _deleting.user_ids = origin, set()
+    _deleting.user_ids.add(instance.pk)
+
+
+def _deletes_user(origin, user_id):
+    # The owner's own feed goes with it (ChangeLogEntry cascades), and an
+    # entry recorded for it now would outlive its owner
+    return getattr(_deleting, 'origin', None) is origin and user_id in _deleting.user_ids
+
+
+class Form(ChangeLogged):
+    sync_kind = 'referral'
+    sync_owner = 'referred_by_id'
+    sync_fields = FormQuerySet.REFERRAL_ROW_FIELDS + ('referred_by',)
+    outbox_topic = 'user'
+    outbox_fields = (
+        'uuid', 'full_name', 'last_name', 'email', 'phone_number', 'gender', 'referral_code',
+        'referred_by', 'is_link_active', 'link_expires_at', 'created_at',
+    )
+
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     full_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
@@ -86,6 +236,34 @@ class Form(models.Model):
     is_link_active = models.BooleanField(default=True)  # Enable/disable link
     
     created_at = models.DateTimeField(default=datetime.now)
+    # ✅ Bumped whenever anything shown on the user's detail changes
+    # (profile, addresses, referrals); drives conditional GETs
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = FormQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Referral dashboards / analytics: WHERE referred_by_id = ? ORDER BY created_at DESC
+            models.Index(fields=['referred_by', '-created_at'], name='form_referred_by_created_idx'),
+            # FormListView: ORDER BY created_at DESC LIMIT n
+            models.Index(fields=['-created_at'], name='form_created_at_idx'),
+            # user_by_unique_link: active, unexpired token lookups
+            models.Index(
+                fields=['unique_link_token', 'link_expires_at'], name='form_active_link_idx',
+                condition=models.Q(is_link_active=True),
+            ),
+            # render_pending_qr_codes: users waiting for a QR image
+            models.Index(
+                fields=['id'], name='form_qr_pending_idx',
+                condition=models.Q(qr_code_image='') | models.Q(qr_code_image__isnull=True),
+            ),
+            # sweep_links: active links in expiry order
+            models.Index(
+                fields=['link_expires_at'], name='form_link_expiry_idx',
+                condition=models.Q(is_link_active=True, link_expires_at__isnull=False),
+            ),
+        ]
     
     def save(self, *args, **kwargs):
         # Generate referral code if not exists
@@ -112,17 +290,18 @@ class Form(models.Model):
         self.unique_link_token = generate_unique_link_token()
         self.link_created_at = timezone.now()
         self.link_click_count = 0
-        self.save()
+        self.save(update_fields=['unique_link_token', 'link_created_at', 'link_click_count', 'updated_at'])
     
     def regenerate_referral_code(self):
         """Regenerate referral code based on current name"""
         self.referral_code = generate_referral_code(self.full_name)
-        self.save()
+        self.qr_code_image = None  # the old QR encodes the old code; save() renders a new one
+        self.save(update_fields=['referral_code', 'qr_code_image', 'updated_at'])
     
     def increment_link_clicks(self):
         """Increment the link click counter"""
         self.link_click_count += 1
-        self.save()
+        self.save(update_fields=['link_click_count', 'updated_at'])
     
     def is_link_expired(self):
         """Check if the link has expired"""
@@ -133,14 +312,37 @@ class Form(models.Model):
     def __str__(self):
         return f"{self.full_name} ({self.email}) - {self.referral_code}"
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, render_qr=True, **kwargs):
         # Generate referral code if not exists
         if not self.referral_code:
             self.referral_code = generate_referral_code(self.full_name)
 
+        adding = self._state.adding
+        previous = getattr(self, '_synced_owner', None)  # referrer as loaded; save() moves it on
         super().save(*args, **kwargs)  # Save first so referral_code exists
 
+        # ✅ The referrer's detail lists this user's name and email
+        update_fields = kwargs.get('update_fields')
+        if self.referred_by_id and (
+            adding or update_fields is None or {'full_name', 'email', 'referred_by'} & set(update_fields)
+        ):
+            touch_user(self.referred_by_id)
+        if previous and previous != self.referred_by_id:
+            touch_user(previous)  # its referral count dropped
+
         # ✅ Generate QR Code if not exists
+        if render_qr:
+            self.generate_qr_code()
+
+    def delete(self, *args, **kwargs):
+        referrer_id = self.referred_by_id
+        result = super().delete(*args, **kwargs)
+        if referrer_id:
+            touch_user(referrer_id)
+        return result
+
+    def generate_qr_code(self):
+        """Render and store the referral QR code if it is missing."""
         if self.referral_code and not self.qr_code_image:
             qr = qrcode.QRCode(version=1, box_size=10, border=5)
             qr.add_data(self.get_referral_link())
@@ -153,9 +355,78 @@ class Form(models.Model):
             file_name = f"{self.referral_code}_qr.png"
 
             self.qr_code_image.save(file_name, ContentFile(buffer.getvalue()), save=False)
-            super().save(update_fields=['qr_code_image'])  # Save QR image only
+            super().save(update_fields=['qr_code_image', 'updated_at'])  # Save QR image only
+
+pre_delete.connect(collect_deleted_user, sender=Form)
+post_delete.connect(log_deletion, sender=Form)
+
+
+def touch_user(user_id):
+    """Mark a user's detail as changed without loading the row."""
+    Form.objects.filter(pk=user_id).update(updated_at=timezone.now())
+
+
+def normalize_place(value):
+    """Search key for a city/state/country: case-folded, single-spaced."""
+    return ' '.join((value or '').split()).casefold()
+
+
+def normalize_pin(value):
+    return re.sub(r'[\s-]', '', value or '').upper()
+
+
+def address_key(house_name, street_name, city_key, state_key, country_key, pin_key):
+    """Dedupe key of an address: hash of its normalized parts."""
+    parts = (normalize_place(house_name), normalize_place(street_name), city_key, state_key, country_key, pin_key)
+    return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+
+def prefix_filter(field, prefix):
+    # A range instead of LIKE 'x%', so the plain B-tree index on the key
+    # column serves it (SQLite's case-insensitive LIKE cannot use it)
+    return models.Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+
+class AddressQuerySet(models.QuerySet):
+    ADDRESS_FIELDS = (
+        'house_name', 'street_name', 'country', 'state', 'pin', 'city', 'image',
+    )
+    # Raw column -> its normalized, indexed search key
+    PLACE_KEYS = {'city': 'city_key', 'state': 'state_key', 'country': 'country_key', 'pin': 'pin_key'}
+    KEYED_FIELDS = ('house_name', 'street_name', 'city', 'state', 'country', 'pin')  # feed address_key
+
+    def for_listing(self):
+        """Addresses with just the owner columns AddressSerializer nests."""
+        user_fields = [f'user__{name}' for name in FormQuerySet.USER_INFO_FIELDS]
+        return self.select_related('user').only(*self.ADDRESS_FIELDS, *user_fields)
+
+    def search(self, term):
+        """Addresses whose city, state, country or PIN starts with `term`."""
+        place, pin = normalize_place(term), normalize_pin(term)
+        query = prefix_filter('city_key', place) | prefix_filter('state_key', place) | prefix_filter('country_key', place)
+        if pin:
+            query |= prefix_filter('pin_key', pin)
+        return self.filter(query) if place else self
+
+    def in_place(self, country=None, state=None, city=None, pin=None):
+        """Exact (normalized) place filters; None skips a filter."""
+        filters = {
+            key: normalize(value)
+            for key, value, normalize in (
+                ('country_key', country, normalize_place), ('state_key', state, normalize_place),
+                ('city_key', city, normalize_place), ('pin_key', pin, normalize_pin),
+            )
+            if value is not None
+        }
+        return self.filter(**filters)
+
+
+class Address(ChangeLogged):
+    sync_kind = 'address'
+    sync_owner = 'user_id'
+    outbox_topic = 'address'
+    outbox_fields = ('user', 'house_name', 'street_name', 'country', 'state', 'pin', 'city', 'created_at')
 
-class Address(models.Model):
     user = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='addresses')
     house_name = models.CharField(max_length=255)
     street_name = models.CharField(max_length=255)
@@ -166,6 +437,359 @@ class Address(models.Model):
     image = models.ImageField(upload_to='address_images/', null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # ✅ Normalized search keys, kept in step with the columns above by save()
+    country_key = models.CharField(max_length=100, default='', editable=False)
+    state_key = models.CharField(max_length=100, default='', editable=False)
+    city_key = models.CharField(max_length=100, default='', editable=False)
+    pin_key = models.CharField(max_length=10, default='', editable=False)
+    address_key = models.CharField(max_length=40, default='', editable=False)  # see address_key()
+
+    objects = AddressQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Per-user address lists: WHERE user_id = ? ORDER BY id DESC
+            models.Index(fields=['user', '-id'], name='address_user_id_idx'),
+            # Place search and filters (country prefix uses the leading column)
+            models.Index(fields=['country_key', 'state_key', 'city_key'], name='address_place_idx'),
+            models.Index(fields=['state_key'], name='address_state_idx'),
+            models.Index(fields=['city_key'], name='address_city_idx'),
+            models.Index(fields=['pin_key'], name='address_pin_idx'),
+        ]
+        constraints = [
+            # One row per distinct address per user; bulk imports upsert on it
+            models.UniqueConstraint(fields=['user', 'address_key'], name='address_user_key_unique'),
+        ]
+
+    REGION_FIELDS = {'country_key', 'state_key', 'city_key', 'country', 'state', 'city'}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # None when deferred; stored_region() then reads it on demand
+        instance._stored_region = instance.region() if cls.REGION_FIELDS <= instance.__dict__.keys() else None
+        return instance
+
+    def normalize(self):
+        self.country_key = normalize_place(self.country)
+        self.state_key = normalize_place(self.state)
+        self.city_key = normalize_place(self.city)
+        self.pin_key = normalize_pin(self.pin)
+        self.address_key = address_key(
+            self.house_name, self.street_name, self.city_key, self.state_key, self.country_key, self.pin_key,
+        )
+
+    def region(self):
+        """(country, state, city) search keys plus display labels, for AddressRegionCount."""
+        return (self.country_key, self.state_key, self.city_key, self.country, self.state, self.city)
+
+    def stored_region(self):
+        if getattr(self, '_stored_region', None) is None:
+            self._stored_region = type(self).objects.filter(pk=self.pk).values_list(
+                'country_key', 'state_key', 'city_key', 'country', 'state', 'city',
+            ).first()
+        return self._stored_region
+
+    def save(self, *args, **kwargs):
+        previous = None if self._state.adding else self.stored_region()
+        previous_owner = getattr(self, '_synced_owner', None)
+        self.normalize()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            keys = AddressQuerySet.PLACE_KEYS
+            update_fields = [*update_fields, *(keys[name] for name in update_fields if name in keys)]
+            if set(update_fields) & set(AddressQuerySet.KEYED_FIELDS):
+                update_fields.append('address_key')
+            kwargs['update_fields'] = update_fields
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = self.region()
+            if previous is None or previous[:3] != current[:3]:
+                if previous is not None:
+                    AddressRegionCount.adjust(previous, -1)
+                AddressRegionCount.adjust(current, 1)
+            self._stored_region = current
+        touch_user(self.user_id)  # addresses are part of the user's detail
+        if previous_owner and previous_owner != self.user_id:
+            touch_user(previous_owner)  # moved away from this user
+
+    def delete(self, *args, **kwargs):
+        user_id = self.user_id
+        self.stored_region()  # read while the row exists, for address_deleted()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+        touch_user(user_id)
+        return result
+
     def __str__(self):
-        return f"Address of {self.user.full_name} - {self.city}"
\ No newline at end of file
+        return f"Address of {self.user.full_name} - {self.city}"
+
+
+post_delete.connect(log_deletion, sender=Address)
+
+
+@receiver(post_delete, sender=Address)
+def address_deleted(sender, instance, **kwargs):
+    # A signal rather than Address.delete(), so rows removed along with their
+    # user (a cascade) or by a queryset delete() are uncounted as well; the
+    # collector loads those in full, so from_db() has set their region
+    region = getattr(instance, '_stored_region', None)
+    if region is not None:
+        AddressRegionCount.adjust(region, -1)
+
+
+class AddressRegionCount(models.Model):
+    """
+    Address counts per country, state and city, adjusted by Address.save()
+    and on every delete (address_deleted(), cascades included);
+    `manage.py rebuild_address_regions` recomputes them.
+    Keys are the normalized Address.*_key values; the labels keep the
+    spelling of the first address seen for display.
+    """
+    COUNTRY = 'country'
+    STATE = 'state'
+    CITY = 'city'
+    LEVEL_CHOICES = [(COUNTRY, 'Country'), (STATE, 'State'), (CITY, 'City')]
+
+    level = models.CharField(max_length=7, choices=LEVEL_CHOICES)
+    country_key = models.CharField(max_length=100)
+    state_key = models.CharField(max_length=100, blank=True)  # '' above state level
+    city_key = models.CharField(max_length=100, blank=True)   # '' above city level
+    country = models.CharField(max_length=100)
+    state = models.CharField(max_length=100, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['level', 'country_key', 'state_key', 'city_key'], name='address_region_unique',
+            ),
+        ]
+
+    @classmethod
+    def rows_for(cls, region):
+        """Lookup and label kwargs of the three rows an address counts towards."""
+        country_key, state_key, city_key, country, state, city = region
+        return [
+            ({'level': cls.COUNTRY, 'country_key': country_key, 'state_key': '', 'city_key': ''},
+             {'country': country}),
+            ({'level': cls.STATE, 'country_key': country_key, 'state_key': state_key, 'city_key': ''},
+             {'country': country, 'state': state}),
+            ({'level': cls.CITY, 'country_key': country_key, 'state_key': state_key, 'city_key': city_key},
+             {'country': country, 'state': state, 'city': city}),
+        ]
+
+    @classmethod
+    def adjust(cls, region, delta):
+        for lookup, labels in cls.rows_for(region):
+            if cls.objects.filter(**lookup).update(count=models.F('count') + delta) or delta < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(**lookup, **labels, count=delta)
+            except IntegrityError:  # created concurrently
+                cls.objects.filter(**lookup).update(count=models.F('count') + delta)
+
+
+# ✅ Unique link click analytics
+class LinkClick(models.Model):
+    """
+    Append-only raw click log, written in batches by form.clicks.
+    rollup_clicks folds these rows into LinkClickRollup and deletes them.
+    """
+    user = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='+')
+    clicked_at = models.DateTimeField(default=timezone.now)
+    source = models.CharField(max_length=255, blank=True)  # Referer host, '' for direct
+
+
+class LinkClickRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITY_CHOICES = [(HOUR, 'Hour'), (DAY, 'Day')]
+
+    user = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='click_rollups')
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # Start of the hour / day, UTC
+    source = models.CharField(max_length=255, blank=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'granularity', 'bucket', 'source'], name='link_click_rollup_unique',
+            ),
+        ]
+
+
+class UserSeries(models.Model):
+    """
+    Dense per-user daily counters for one metric: counts[i] is the count on
+    start + i days, packed as little-endian uint32 (see form.timeseries).
+    """
+    REFERRALS = 'referrals'
+    CLICKS = 'clicks'
+    METRIC_CHOICES = [(REFERRALS, 'Referrals'), (CLICKS, 'Clicks')]
+
+    user = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='series')
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES)
+    start = models.DateField()
+    counts = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'metric'], name='user_series_unique'),
+        ]
+
+
+# ✅ Delta sync change log
+class ChangeLogEntry(models.Model):
+    """
+    One row per (owner, kind, object) holding the object's latest change;
+    record() replaces the previous row, so the id is a monotonic cursor and
+    the table grows with the number of objects, not the number of edits.
+    Delete markers (tombstones) are purged by `compact_changelog`.
+    """
+    REFERRAL = 'referral'
+    ADDRESS = 'address'
+    SELLER = 'seller'
+    KIND_CHOICES = [(REFERRAL, 'Referral'), (ADDRESS, 'Address'), (SELLER, 'Seller')]
+
+    id = models.BigAutoField(primary_key=True)
+    owner = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Sync reads: WHERE owner_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['owner', 'id'], name='changelog_owner_id_idx'),
+            # record(): the object's previous entry
+            models.Index(fields=['owner', 'kind', 'object_id'], name='changelog_object_idx'),
+        ]
+
+    @classmethod
+    def record(cls, owner_id, kind, object_id, deleted=False):
+        with transaction.atomic():
+            cls.objects.filter(owner_id=owner_id, kind=kind, object_id=object_id).delete()
+            cls.objects.create(owner_id=owner_id, kind=kind, object_id=object_id, deleted=deleted)
+
+    @classmethod
+    def record_many(cls, kind, pairs):
+        """record() for many (owner_id, object_id) upserts, in three queries."""
+        if not pairs:
+            return
+        pairs = set(pairs)
+        with transaction.atomic():
+            candidates = cls.objects.filter(
+                kind=kind,
+                owner_id__in={owner_id for owner_id, _ in pairs},
+                object_id__in={object_id for _, object_id in pairs},
+            ).values_list('id', 'owner_id', 'object_id')
+            cls.objects.filter(
+                id__in=[entry_id for entry_id, owner_id, object_id in candidates if (owner_id, object_id) in pairs]
+            ).delete()
+            cls.objects.bulk_create([cls(owner_id=owner_id, kind=kind, object_id=object_id) for owner_id, object_id in pairs])
+
+
+class ChangeLogCompaction(models.Model):
+    """A tombstone purge, across all owners; purged_through is its newest purged id."""
+    purged_through = models.BigIntegerField()
+    purged = models.PositiveIntegerField()
+    ran_at = models.DateTimeField(auto_now_add=True)
+
+
+class ChangeLogHorizon(models.Model):
+    """The owner's newest purged tombstone; that owner's cursors below it must sync from scratch."""
+    owner = models.OneToOneField(Form, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    purged_through = models.BigIntegerField()
+
+
+# ✅ Transactional outbox
+class OutboxEvent(models.Model):
+    """
+    A change to a user, address or seller, written in the same transaction
+    as the change itself; form.outbox relays events in id order to the
+    configured sinks and deletes them once every sink has them.
+    The payload is the row as of the change (None for deletes).
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    SNAPSHOT = 'snapshot'  # published by `relay_outbox --snapshot`
+    EVENT_CHOICES = [(CREATED, 'Created'), (UPDATED, 'Updated'), (DELETED, 'Deleted'), (SNAPSHOT, 'Snapshot')]
+
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=20)  # ChangeLogged.outbox_topic
+    aggregate_id = models.BigIntegerField()
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    payload = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def build(cls, instance, event):
+        return cls(topic=instance.outbox_topic, aggregate_id=instance.pk, event=event, payload=instance.outbox_payload())
+
+    @classmethod
+    def emit_many(cls, instances, event):
+        """Queue `event` for ChangeLogged instances, in one INSERT."""
+        cls.objects.bulk_create([cls.build(instance, event) for instance in instances])
+
+    @classmethod
+    def emit_for(cls, model, ids, event=UPDATED):
+        """emit_many() for rows changed by a queryset update() or bulk_create()."""
+        rows = model.objects.filter(pk__in=ids).order_by('pk')
+        if hasattr(model, 'outbox_prefetch'):
+            rows = rows.prefetch_related(*model.outbox_prefetch)
+        cls.emit_many(rows, event)
+
+    def as_message(self):
+        return {
+            "id": self.id,
+            "topic": self.topic,
+            "key": f"{self.topic}:{self.aggregate_id}",
+            "event": self.event,
+            "payload": self.payload,
+            "created_at": self.created_at,
+        }
+
+
+class OutboxOffset(models.Model):
+    """Last event id a sink has acknowledged; events after it are (re)sent."""
+    sink = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class RetiredReferralCode(models.Model):
+    """A code replaced by rotation; it may have leaked, so it is never handed out again."""
+    code = models.CharField(max_length=10, unique=True)
+    retired_at = models.DateTimeField(default=timezone.now)
+
+
+class LinkRotationJob(models.Model):
+    """
+    A resumable bulk rotation of unique links and/or referral codes
+    (form.links.run_rotation). Users are processed in id order; last_id is
+    committed with every batch so an interrupted job continues from there.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done')]
+
+    rotate_links = models.BooleanField(default=True)
+    rotate_codes = models.BooleanField(default=False)
+    user_ids = models.JSONField(null=True, blank=True)  # sorted ids; None means every user
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    last_id = models.BigIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
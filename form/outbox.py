@@ -0,0 +1,179 @@
+"""
+Transactional outbox relay for downstream consumers (CRM, warehouse).
+
+Every save or delete of a Form, Address or SellerDetailsForm writes an
+OutboxEvent in the same transaction (see ChangeLogged in form.models), so an
+event exists exactly when its change committed. relay() publishes events in
+id order to each configured sink and then advances that sink's OutboxOffset;
+a crash between the two re-sends the batch, so delivery is at-least-once
+and consumers dedupe on the event id (or just apply the latest payload per
+key). Events younger than OUTBOX_SETTLE_SECONDS end a batch, so a
+transaction that took an id early but committed late is not skipped.
+
+A message is {"id", "topic", "key", "event", "payload", "created_at"} where
+topic is user / address / seller, key is "<topic>:<row id>" (use it as the
+partition key) and payload is the row as of the change (null for deletes).
+Deleting a user publishes a delete for each address and seller it takes
+with it.
+
+Sinks are configured like CACHES: a name mapped to a BACKEND class and its
+OPTIONS. FileSink appends JSON Lines to a local file; RedisStreamSink XADDs
+to a Redis stream (a local stand-in for a Kafka topic, needs redis). Any
+class with publish(messages) that raises on failure can be plugged in.
+
+`manage.py relay_outbox --every 5` runs the relay; `--snapshot` publishes
+every current row once, to seed a new consumer. Events every sink has
+received are purged after OUTBOX_RETENTION_DAYS.
+
+Settings:
+    OUTBOX_SINKS             name -> {'BACKEND': dotted path, 'OPTIONS': {...}}
+    OUTBOX_BATCH_SIZE        events per publish() call
+    OUTBOX_SETTLE_SECONDS    minimum age of an event before it is relayed
+    OUTBOX_RETENTION_DAYS    how long relayed events are kept
+"""
+import datetime
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cards.middleware import registry
+from cards.renderers import dumps
+from user.models import SellerDetailsForm
+from .models import Address, Form, OutboxEvent, OutboxOffset
+
+try:
+    import redis
+except ImportError:  # redis is optional; only RedisStreamSink needs it
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== SINKS ====================
+
+class FileSink:
+    """Appends one JSON line per message and fsyncs before acknowledging."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def publish(self, messages):
+        with open(self.path, 'ab') as fh:
+            fh.write(b''.join(dumps(message) + b'\n' for message in messages))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+class RedisStreamSink:
+    """XADDs each message to a Redis stream, keeping about `maxlen` entries."""
+
+    def __init__(self, url, stream='cards-events', maxlen=1000000):
+        if redis is None:
+            raise RuntimeError("RedisStreamSink needs the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def publish(self, messages):
+        pipe = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipe.xadd(self.stream, {'key': message['key'], 'data': dumps(message)},
+                      maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(name):
+    """The process-wide sink `name` from OUTBOX_SINKS, created on first use."""
+    with _sinks_lock:
+        if name not in _sinks:
+            config = settings.OUTBOX_SINKS[name]
+            _sinks[name] = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _sinks[name]
+
+
+# ==================== RELAY ====================
+
+def relay(name, batch_size=None, now=None):
+    """Publish the next batch of events to sink `name`; returns how many."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    settled = (now or timezone.now()) - datetime.timedelta(seconds=settings.OUTBOX_SETTLE_SECONDS)
+    with transaction.atomic():
+        # Row lock: two relays for one sink take turns instead of interleaving
+        offset, _ = OutboxOffset.objects.select_for_update().get_or_create(sink=name)
+        events = []
+        for event in OutboxEvent.objects.filter(id__gt=offset.last_id).order_by('id')[:batch_size]:
+            if event.created_at > settled:
+                break
+            events.append(event)
+        if not events:
+            return 0
+        get_sink(name).publish([event.as_message() for event in events])
+        offset.last_id = events[-1].id
+        offset.save(update_fields=['last_id', 'updated_at'])
+    registry.incr('outbox_events_relayed', len(events), help_text='Outbox events published to sinks.')
+    return len(events)
+
+
+def relay_all(names=None, batch_size=None):
+    """Drain every sink (or `names`); returns {sink: events published}."""
+    published = {}
+    for name in names or settings.OUTBOX_SINKS:
+        published[name] = 0
+        while True:
+            try:
+                count = relay(name, batch_size)
+            except Exception:
+                # The offset did not move; the batch is retried on the next run
+                logger.exception("Outbox sink %s failed", name)
+                registry.incr('outbox_relay_errors', help_text='Failed outbox publish attempts.')
+                break
+            published[name] += count
+            if not count:
+                break
+    return published
+
+
+def pending(name):
+    """Events sink `name` has not acknowledged yet."""
+    last_id = OutboxOffset.objects.filter(sink=name).values_list('last_id', flat=True).first() or 0
+    return OutboxEvent.objects.filter(id__gt=last_id).count()
+
+
+# ==================== MAINTENANCE ====================
+
+def purge(days=None, now=None):
+    """Delete events older than `days` that every configured sink has; returns how many."""
+    days = settings.OUTBOX_RETENTION_DAYS if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    names = list(settings.OUTBOX_SINKS)
+    offsets = OutboxOffset.objects.filter(sink__in=names)
+    if offsets.count() < len(names):
+        return 0  # a sink that never ran has not received anything
+    through = offsets.aggregate(through=Min('last_id'))['through'] or 0
+    deleted, _ = OutboxEvent.objects.filter(id__lte=through, created_at__lt=cutoff).delete()
+    return deleted
+
+
+def publish_snapshot(batch_size=1000):
+    """Queue a snapshot event for every user, address and seller; returns how many."""
+    total = 0
+    for model in (Form, Address, SellerDetailsForm):
+        last_id = 0
+        while True:
+            ids = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            OutboxEvent.emit_for(model, ids, OutboxEvent.SNAPSHOT)
+            total += len(ids)
+            last_id = ids[-1]
+    return total
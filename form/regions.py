@@ -0,0 +1,72 @@
+"""
+Address counts per shipping region (country, state, city).
+
+AddressRegionCount holds one row per country, per (country, state) and per
+(country, state, city), adjusted in the same transaction as each Address
+save or delete, so region dashboards read a handful of precomputed rows
+instead of grouping the address table. Regions are matched on the
+normalized Address.*_key columns, so "Kochi", "kochi " and "KOCHI" count as
+one city.
+
+rebuild_regions() (`manage.py rebuild_address_regions`) re-normalizes every
+address (search and dedupe keys) and recounts from scratch, for rows
+written with bulk_create() or queryset update(), which skip Address.save().
+"""
+from collections import Counter
+
+from django.db import transaction
+
+from .models import Address, AddressRegionCount, normalize_place
+
+LEVELS = [level for level, _ in AddressRegionCount.LEVEL_CHOICES]
+REGION_COLUMNS = ('country_key', 'state_key', 'city_key', 'country', 'state', 'city')
+
+
+def region_counts(level, country=None, state=None, limit=100):
+    """Largest regions at `level`, optionally inside one country / state."""
+    rows = AddressRegionCount.objects.filter(level=level, count__gt=0)
+    if country is not None:
+        rows = rows.filter(country_key=normalize_place(country))
+    if state is not None:
+        rows = rows.filter(state_key=normalize_place(state))
+    labels = {
+        AddressRegionCount.COUNTRY: ('country',),
+        AddressRegionCount.STATE: ('country', 'state'),
+        AddressRegionCount.CITY: ('country', 'state', 'city'),
+    }[level]
+    return [
+        {**dict(zip(labels, values[:-1])), "addresses": values[-1]}
+        for values in rows.order_by('-count', 'country_key', 'state_key', 'city_key').values_list(*labels, 'count')[:limit]
+    ]
+
+
+def rebuild_regions(batch_size=1000):
+    """Re-normalize every address and recount all regions; returns the address count."""
+    counts = Counter()
+    labels = {}
+    changed = []
+    columns = ('id', 'house_name', 'street_name', 'pin', 'pin_key', 'address_key', *REGION_COLUMNS)
+    for address in Address.objects.only(*columns).iterator(chunk_size=batch_size):
+        before = (address.country_key, address.state_key, address.city_key, address.pin_key, address.address_key)
+        address.normalize()
+        if before != (address.country_key, address.state_key, address.city_key, address.pin_key, address.address_key):
+            changed.append(address)
+        for lookup, label in AddressRegionCount.rows_for(address.region()):
+            key = tuple(lookup.values())
+            counts[key] += 1
+            labels.setdefault(key, label)
+
+    with transaction.atomic():
+        Address.objects.bulk_update(
+            changed, ['country_key', 'state_key', 'city_key', 'pin_key', 'address_key'], batch_size=batch_size,
+        )
+        AddressRegionCount.objects.all().delete()
+        AddressRegionCount.objects.bulk_create(
+            [
+                AddressRegionCount(level=level, country_key=country_key, state_key=state_key, city_key=city_key,
+                                   count=count, **labels[(level, country_key, state_key, city_key)])
+                for (level, country_key, state_key, city_key), count in counts.items()
+            ],
+            batch_size=batch_size,
+        )
+    return sum(count for (level, *_), count in counts.items() if level == AddressRegionCount.COUNTRY)
@@ -1,14 +1,176 @@
-from rest_framework import serializers
+import random
+import time
+from operator import attrgetter
+
+from rest_framework import exceptions, serializers
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
-from .models import Form, Address
+from django.db import IntegrityError, OperationalError, connection, transaction
+from .models import Form, Address, AddressQuerySet, generate_referral_code
+from .live import publish_referral
+from .timeseries import record_referral
+
+# Attempts at picking a free referral code when concurrent signups collide
+REFERRAL_CODE_RETRIES = 10
+# How long a registration keeps retrying while SQLite reports "database is locked"
+LOCKED_RETRY_SECONDS = 10
+
+# ==================== SPARSE FIELDSETS ====================
+# ?fields=id,city,user.email keeps only the listed fields (dotted names pick
+# sub-fields of an expandable relation); ?expand=user renders a listed
+# relation as the nested object instead of just its UUID. Without ?fields=
+# the output is unchanged. Unrequested fields are dropped when the serializer
+# is built, so their method fields never run, and the querysets project only
+# the columns the remaining fields read. Unknown names are a 400.
+
+FROM_REQUEST = object()
+
+
+class InvalidFieldset(exceptions.APIException):
+    """A ?fields= name the endpoint does not render; a 400 in the views' response shape."""
+    status_code = 400
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.detail = {"code": 400, "message": message}
+
+
+def check_fieldset(fieldset, names, subfields, prefix=''):
+    """
+    Raise InvalidFieldset unless every key of `fieldset` is in `names` and
+    every sub-fieldset names fields of `subfields[key]` (key -> sub-field names).
+    """
+    for name, sub in fieldset.items():
+        if name not in names:
+            raise InvalidFieldset(
+                f"Unknown field '{prefix}{name}'; choose from: {', '.join(prefix + known for known in names)}"
+            )
+        if sub:
+            if name not in subfields:
+                raise InvalidFieldset(f"'{prefix}{name}' has no sub-fields")
+            check_fieldset(sub, tuple(subfields[name]), {}, f'{prefix}{name}.')
+
+
+def parse_fieldset(fields, expand=''):
+    """
+    'id,user.email' + expand 'user' -> {'id': None, 'user': {'email': None}}.
+    None marks a plain (or collapsed) field, a dict an expanded relation;
+    an empty dict means every sub-field.
+    """
+    fieldset = {}
+    expanded = {name.strip() for name in expand.split(',') if name.strip()}
+    for name in (name.strip() for name in fields.split(',')):
+        if not name:
+            continue
+        head, _, rest = name.partition('.')
+        if rest:
+            sub = fieldset.get(head) or {}
+            sub.update(parse_fieldset(rest))
+            fieldset[head] = sub
+        else:
+            fieldset.setdefault(head, {} if head in expanded else None)
+    return fieldset
+
+
+def requested_fieldset(request):
+    """The fieldset asked for by a read request, or None for every field."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if 'fields' not in params:
+        return None
+    return parse_fieldset(params['fields'], params.get('expand', ''))
+
+
+class SparseFieldsMixin:
+    """
+    Applies a fieldset to a ModelSerializer. `expandable` maps relation
+    fields to the serializer used when expanded; collapsed they render as
+    the related UUID. `sources` lists the model fields a method field reads.
+    """
+    expandable = {}
+    sources = {}
 
-class FormSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, fieldset=FROM_REQUEST, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is FROM_REQUEST:
+            fieldset = requested_fieldset(self.context.get('request'))
+        if fieldset:
+            self.check_fieldset(fieldset)
+            self.apply_fieldset(fieldset)
+
+    @classmethod
+    def readable_names(cls):
+        """Names of the fields the serializer renders (write-only ones excluded)."""
+        if '_readable_names' not in cls.__dict__:
+            fields = cls(fieldset=None).fields
+            cls._readable_names = tuple(name for name, field in fields.items() if not field.write_only)
+        return cls._readable_names
+
+    @classmethod
+    def check_fieldset(cls, fieldset):
+        subfields = {name: serializer_class.readable_names() for name, serializer_class in cls.expandable.items()}
+        check_fieldset(fieldset, cls.readable_names(), subfields)
+
+    def apply_fieldset(self, fieldset):
+        for name in list(self.fields):
+            if name not in fieldset:
+                self.fields.pop(name)
+        for name, serializer_class in self.expandable.items():
+            if name not in self.fields:
+                continue
+            if fieldset[name] is None:
+                self.fields[name] = serializers.UUIDField(source=f'{name}.uuid', read_only=True)
+            else:
+                self.fields[name] = serializer_class(read_only=True, fieldset=fieldset[name])
+
+    @classmethod
+    def projection(cls, fieldset, prefix=''):
+        """(only() paths, select_related() paths) needed to render `fieldset`."""
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        only, related = [], []
+        for name in cls.Meta.fields:
+            if fieldset and name not in fieldset:
+                continue
+            if name in cls.expandable:
+                related.append(prefix + name)
+                sub = fieldset.get(name) if fieldset else {}
+                if sub is None:
+                    only.append(f'{prefix}{name}__uuid')
+                else:
+                    sub_only, sub_related = cls.expandable[name].projection(sub, f'{prefix}{name}__')
+                    only += sub_only
+                    related += sub_related
+            else:
+                only += [prefix + source for source in cls.sources.get(name, (name,)) if source in model_fields]
+        return only, related
+
+    @classmethod
+    def project(cls, queryset, fieldset):
+        """Restrict `queryset` to what `fieldset` renders (no-op without one)."""
+        if not fieldset:
+            return queryset
+        cls.check_fieldset(fieldset)
+        only, related = cls.projection(fieldset)
+        # Drop joins the fieldset no longer needs, keep the ones it does
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*only)
+
+
+class FormSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     reenter_password = serializers.CharField(write_only=True, required=True)
     referral_code = serializers.CharField(read_only=True)
     referred_by_code = serializers.CharField(write_only=True, required=False, allow_blank=True)
     unique_link = serializers.SerializerMethodField()
     referral_link = serializers.SerializerMethodField()
     qr_code_url = serializers.SerializerMethodField()
+    sources = {
+        'unique_link': ('unique_link_token',),
+        'referral_link': ('referral_code',),
+        'qr_code_url': ('qr_code_image',),
+    }
 
     class Meta:
         model = Form
@@ -54,25 +216,79 @@ class FormSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         referred_by_code = validated_data.pop('referred_by_code', None)
         validated_data.pop('reenter_password')
+        # Hash before opening the transaction; PBKDF2 is the slow part
         validated_data['password'] = make_password(validated_data['password'])
 
         user = Form(**validated_data)
 
-        if referred_by_code:
-            try:
-                referrer = Form.objects.get(referral_code=referred_by_code)
-                user.referred_by = referrer
-            except Form.DoesNotExist:
-                raise serializers.ValidationError({'referred_by_code': 'Invalid referral code.'})
+        def register():
+            user.pk = None  # a retried attempt inserts again
+            user._state.adding = True
+            with transaction.atomic():
+                if referred_by_code:
+                    try:
+                        user.referred_by = Form.objects.only('id').get(referral_code=referred_by_code)
+                    except Form.DoesNotExist:
+                        raise serializers.ValidationError({'referred_by_code': 'Invalid referral code.'})
+                self._insert_with_free_referral_code(user)
+                record_referral(user)
+                transaction.on_commit(lambda: publish_referral(user))  # live dashboard of the referrer
 
-        user.save()
+        retry_when_locked(register)
+        # QR rendering is file I/O plus one UPDATE; keep it out of the transaction
+        retry_when_locked(user.generate_qr_code)
         return user
 
+    def _insert_with_free_referral_code(self, user):
+        """
+        INSERT inside a savepoint; if a concurrent signup took the same
+        referral code, roll back to the savepoint and pick the next one.
+        """
+        for _ in range(REFERRAL_CODE_RETRIES):
+            user.referral_code = generate_referral_code(user.full_name)
+            try:
+                with transaction.atomic():
+                    user.save(render_qr=False)
+                return
+            except IntegrityError:
+                if Form.objects.filter(referral_code=user.referral_code).exists():
+                    continue
+                # Lost a race on email / phone_number instead
+                conflicts = {
+                    field: f'form with this {field.replace("_", " ")} already exists.'
+                    for field in ('email', 'phone_number')
+                    if Form.objects.filter(**{field: getattr(user, field)}).exists()
+                }
+                if conflicts:
+                    raise serializers.ValidationError(conflicts)
+                raise
+        raise serializers.ValidationError({'referral_code': 'Could not allocate a referral code, please retry.'})
+
+
+def retry_when_locked(func):
+    """
+    Call `func`, retrying with jittered backoff while SQLite reports lock
+    contention between concurrent writers (PostgreSQL never raises it).
+    Inside an outer transaction the error is re-raised: only the caller can
+    roll that back.
+    """
+    deadline = time.monotonic() + LOCKED_RETRY_SECONDS
+    delay = 0.002
+    while True:
+        try:
+            return func()
+        except OperationalError as exc:
+            if 'locked' not in str(exc) or connection.in_atomic_block or time.monotonic() > deadline:
+                raise
+        time.sleep(random.uniform(0, delay))
+        delay = min(delay * 2, 0.05)
+
 
-class UserInfoSerializer(serializers.ModelSerializer):
+class UserInfoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     referral_code = serializers.CharField(read_only=True)
     unique_link = serializers.SerializerMethodField()
     referral_link = serializers.SerializerMethodField()
+    sources = {'unique_link': ('unique_link_token',), 'referral_link': ('referral_code',)}
 
     class Meta:
         model = Form
@@ -85,9 +301,10 @@ class UserInfoSerializer(serializers.ModelSerializer):
         return obj.get_referral_link()
 
 
-class AddressSerializer(serializers.ModelSerializer):
+class AddressSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserInfoSerializer(read_only=True)
     user_uuid = serializers.UUIDField(write_only=True, required=True)
+    expandable = {'user': UserInfoSerializer}
 
     class Meta:
         model = Address
@@ -96,6 +313,23 @@ class AddressSerializer(serializers.ModelSerializer):
             'country', 'state', 'pin', 'city', 'image',
         ]
 
+    def validate(self, attrs):
+        # The (user, address_key) constraint would otherwise surface as a 500
+        instance = self.instance or Address()
+        if 'user_uuid' in attrs:
+            user_id = Form.objects.filter(uuid=attrs['user_uuid']).values_list('id', flat=True).first()
+        else:
+            user_id = instance.user_id
+        if user_id is not None:
+            candidate = Address(**{name: attrs.get(name, getattr(instance, name)) for name in AddressQuerySet.KEYED_FIELDS})
+            candidate.normalize()
+            duplicate = Address.objects.filter(user_id=user_id, address_key=candidate.address_key)
+            if instance.pk:
+                duplicate = duplicate.exclude(pk=instance.pk)
+            if duplicate.exists():
+                raise serializers.ValidationError('This user already has this address.')
+        return attrs
+
     def create(self, validated_data):
         user_uuid = validated_data.pop('user_uuid')
         try:
@@ -114,3 +348,192 @@ class AddressSerializer(serializers.ModelSerializer):
             except Form.DoesNotExist:
                 raise serializers.ValidationError({'user_uuid': 'User not found.'})
         return super().update(instance, validated_data)
+
+
+# ==================== FAST-PATH READ SERIALIZERS ====================
+# Read-only list serializers for the high-volume endpoints. Rows come from
+# values_list(), field accessors are resolved once per class and per page,
+# and settings/request lookups are hoisted out of the per-row loop.
+# Output is identical to the ModelSerializer counterparts above.
+
+class _Row:
+    __slots__ = ()
+
+    def __init__(self, values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class FastSerializer:
+    columns = ()  # values_list() columns, in order
+    fields = ()   # output keys; get_<key>(row) wins over a same-named column
+    sources = {}  # output key -> columns it reads, when not just (key,)
+    subfields = {}  # output key -> names ?fields=key.name may pick
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._row_classes = {}
+
+    @classmethod
+    def row_class(cls, columns):
+        if columns not in cls._row_classes:
+            cls._row_classes[columns] = type(f'{cls.__name__}Row', (_Row,), {'__slots__': columns})
+        return cls._row_classes[columns]
+
+    @classmethod
+    def columns_for(cls, fieldset):
+        """values_list() columns needed to render `fieldset` (all without one)."""
+        if not fieldset:
+            return cls.columns
+        check_fieldset(fieldset, cls.fields, cls.subfields)
+        columns = []
+        for key in cls.fields:
+            if key in fieldset:
+                columns += [column for column in cls.key_sources(key, fieldset[key]) if column not in columns]
+        return tuple(columns)
+
+    @classmethod
+    def key_sources(cls, key, sub):
+        return cls.sources.get(key, (key,))
+
+    def __init__(self, instance=None, many=False, context=None, fieldset=FROM_REQUEST, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        if fieldset is FROM_REQUEST:
+            fieldset = requested_fieldset(self.context.get('request'))
+        self.fieldset = fieldset or None
+        self.Row = self.row_class(self.columns_for(self.fieldset))
+        self.setup()
+        self._accessors = [
+            (key, getattr(self, f'get_{key}', None) or attrgetter(key))
+            for key in self.fields
+            if self.fieldset is None or key in self.fieldset
+        ]
+
+    def setup(self):
+        """Per-page hook for hoisting lookups out of the row loop."""
+
+    def to_representation(self, values):
+        row = self.Row(values)
+        return {key: get(row) for key, get in self._accessors}
+
+    @property
+    def data(self):
+        if self.many:
+            return [self.to_representation(values) for values in self.instance]
+        return self.to_representation(self.instance)
+
+
+class _LinkMixin:
+    """Mirrors Form.get_unique_link / get_referral_link / FieldFile.url."""
+
+    def setup(self):
+        self.unique_link_base = getattr(settings, 'BASE_URL', 'http://localhost:8000') + '/user/'
+        self.referral_link_base = getattr(settings, 'BASE_URL', 'http://localhost:8000/api') + '/refer/'
+        request = self.context.get('request')
+        self.build_absolute_uri = request.build_absolute_uri if request else None
+
+    def file_url(self, field, name):
+        if not name:
+            return None
+        url = field.storage.url(name)
+        if self.build_absolute_uri:
+            return self.build_absolute_uri(url)
+        return url
+
+
+class FastFormSerializer(_LinkMixin, FastSerializer):
+    columns = (
+        'uuid', 'full_name', 'last_name', 'email', 'phone_number', 'gender',
+        'referral_code', 'qr_code_image', 'unique_link_token',
+        'link_click_count', 'is_link_active',
+    )
+    fields = (
+        'uuid', 'full_name', 'last_name', 'email', 'phone_number',
+        'gender', 'referral_code',
+        'unique_link', 'referral_link', 'qr_code_url',
+        'unique_link_token', 'link_click_count', 'is_link_active',
+    )
+    sources = {
+        'unique_link': ('unique_link_token',),
+        'referral_link': ('referral_code',),
+        'qr_code_url': ('qr_code_image',),
+    }
+    qr_code_field = Form._meta.get_field('qr_code_image')
+
+    def get_uuid(self, row):
+        return str(row.uuid)
+
+    def get_unique_link(self, row):
+        return f"{self.unique_link_base}{row.unique_link_token}/"
+
+    def get_referral_link(self, row):
+        return f"{self.referral_link_base}{row.referral_code}/"
+
+    def get_qr_code_url(self, row):
+        return self.file_url(self.qr_code_field, row.qr_code_image)
+
+
+class FastAddressSerializer(_LinkMixin, FastSerializer):
+    columns = (
+        'id', 'house_name', 'street_name', 'country', 'state', 'pin', 'city', 'image',
+        'user__full_name', 'user__last_name', 'user__email', 'user__phone_number',
+        'user__referral_code', 'user__unique_link_token',
+    )
+    fields = (
+        'id', 'user', 'house_name', 'street_name',
+        'country', 'state', 'pin', 'city', 'image',
+    )
+    user_fields = {
+        'full_name': ('user__full_name',),
+        'last_name': ('user__last_name',),
+        'email': ('user__email',),
+        'phone_number': ('user__phone_number',),
+        'referral_code': ('user__referral_code',),
+        'unique_link': ('user__unique_link_token',),
+        'referral_link': ('user__referral_code',),
+    }
+    subfields = {'user': user_fields}
+    image_field = Address._meta.get_field('image')
+
+    @classmethod
+    def key_sources(cls, key, sub):
+        if key != 'user':
+            return super().key_sources(key, sub)
+        if sub is None:
+            return ('user__uuid',)  # collapsed
+        return tuple(column for name, columns in cls.user_fields.items() if not sub or name in sub for column in columns)
+
+    def setup(self):
+        super().setup()
+        user = self.fieldset.get('user', {}) if self.fieldset else {}
+        self.user_keys = set(user) if user else None
+        if user is None:
+            self.get_user = self.get_user_uuid
+
+    def get_user_uuid(self, row):
+        return str(row.user__uuid)
+
+    def get_user(self, row):
+        if self.user_keys is not None:
+            return {key: self.user_value(row, key) for key in self.user_fields if key in self.user_keys}
+        return {
+            'full_name': row.user__full_name,
+            'last_name': row.user__last_name,
+            'email': row.user__email,
+            'phone_number': row.user__phone_number,
+            'referral_code': row.user__referral_code,
+            'unique_link': f"{self.unique_link_base}{row.user__unique_link_token}/",
+            'referral_link': f"{self.referral_link_base}{row.user__referral_code}/",
+        }
+
+    def user_value(self, row, key):
+        if key == 'unique_link':
+            return f"{self.unique_link_base}{row.user__unique_link_token}/"
+        if key == 'referral_link':
+            return f"{self.referral_link_base}{row.user__referral_code}/"
+        return getattr(row, f'user__{key}')
+
+    def get_image(self, row):
+        return self.file_url(self.image_field, row.image)
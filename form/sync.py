@@ -0,0 +1,204 @@
+"""
+Delta sync of a user's referrals, addresses and seller records.
+
+Saves and deletes of those rows are written to ChangeLogEntry (see
+ChangeLogged in form.models), one row per object holding its latest change.
+A client keeps the cursor from its last sync and asks for the entries after
+it, so a sync costs a page of log rows plus one query per kind for the rows
+that changed, however large the downline is.
+
+    cursor 0        initial sync: every live object, no tombstones
+    cursor N        objects changed or deleted since N
+    expired cursor  410; tombstones of this owner it would need were purged,
+                    sync from 0
+
+Expiry is per owner (ChangeLogHorizon), so purging one user's tombstones
+does not expire anybody else's cursor, and a sync that reaches the end of
+the log returns a cursor at or above the owner's horizon.
+
+Entries younger than SYNC_SETTLE_SECONDS end the page, so a transaction that
+took an id early but committed late is not skipped by a cursor that already
+moved past it (write transactions are assumed to be shorter than that).
+
+`manage.py compact_changelog` purges tombstones older than
+SYNC_TOMBSTONE_DAYS; `--backfill` logs rows written before the change log
+existed or by bulk_create().
+
+Settings:
+    SYNC_PAGE_SIZE         default entries per page
+    SYNC_MAX_PAGE_SIZE     largest ?limit= accepted
+    SYNC_SETTLE_SECONDS    minimum age of an entry before it is served
+    SYNC_TOMBSTONE_DAYS    how long delete markers are kept
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from user.models import SellerDetailsForm
+from user.serializers import SellerDetailsFormSerializer
+from .models import Address, ChangeLogCompaction, ChangeLogEntry, ChangeLogHorizon, Form, FormQuerySet
+from .serializers import FastAddressSerializer, parse_fieldset
+
+# Response section per entry kind
+SECTIONS = {
+    ChangeLogEntry.REFERRAL: 'referrals',
+    ChangeLogEntry.ADDRESS: 'addresses',
+    ChangeLogEntry.SELLER: 'sellers',
+}
+ADDRESS_FIELDSET = parse_fieldset('id,house_name,street_name,country,state,pin,city,image')
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def horizon(owner_id):
+    """Highest purged tombstone id of `owner_id`; its older non-zero cursors have expired."""
+    return ChangeLogHorizon.objects.filter(owner_id=owner_id).values_list('purged_through', flat=True).first() or 0
+
+
+def changes_since(owner_id, cursor, limit, now=None):
+    """
+    (entries, next cursor, has_more) for `owner_id` after `cursor`, where
+    entries maps kind -> {'upserted': [ids], 'deleted': [ids]}.
+    """
+    expires = horizon(owner_id)
+    if cursor and cursor < expires:
+        raise CursorExpired(cursor)
+    settled = (now or timezone.now()) - datetime.timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    log = ChangeLogEntry.objects.filter(owner_id=owner_id, id__gt=cursor)
+    if not cursor:
+        log = log.filter(deleted=False)
+    rows = list(log.order_by('id').values_list('id', 'kind', 'object_id', 'deleted', 'changed_at')[:limit + 1])
+
+    has_more = len(rows) > limit
+    page = []
+    for row in rows[:limit]:
+        if row[4] > settled:
+            has_more = True
+            break
+        page.append(row)
+
+    # Latest entry per object wins (concurrent record() calls can leave two)
+    latest = {}
+    for entry_id, kind, object_id, deleted, _ in page:
+        latest[(kind, object_id)] = deleted
+    entries = {kind: {'upserted': [], 'deleted': []} for kind in SECTIONS}
+    for (kind, object_id), deleted in latest.items():
+        entries[kind]['deleted' if deleted else 'upserted'].append(object_id)
+    next_cursor = page[-1][0] if page else cursor
+    if not has_more:
+        # Nothing left below the horizon, so the next call must not expire;
+        # an initial sync skips tombstones and can otherwise end below it
+        next_cursor = max(next_cursor, expires)
+    return entries, next_cursor, has_more
+
+
+# ==================== PAYLOADS ====================
+
+def load_referrals(owner_id, ids, request):
+    rows = Form.objects.filter(referred_by_id=owner_id, id__in=ids).values('id', *FormQuerySet.REFERRAL_ROW_FIELDS)
+    return {
+        row['id']: {
+            "id": row['id'],
+            "uuid": row['uuid'],
+            "full_name": row['full_name'],
+            "last_name": row['last_name'],
+            "email": row['email'],
+            "phone_number": row['phone_number'],
+            "gender": row['gender'],
+            "referred_date": row['created_at'],
+        }
+        for row in rows
+    }
+
+
+def load_addresses(owner_id, ids, request):
+    columns = FastAddressSerializer.columns_for(ADDRESS_FIELDSET)
+    rows = Address.objects.filter(user_id=owner_id, id__in=ids).values_list(*columns)
+    data = FastAddressSerializer(rows, many=True, context={'request': request}, fieldset=ADDRESS_FIELDSET).data
+    return {item['id']: item for item in data}
+
+
+def load_sellers(owner_id, ids, request):
+    sellers = (
+        SellerDetailsForm.objects.filter(user_id=owner_id, id__in=ids)
+        .select_related('user').prefetch_related('categories')
+    )
+    return {item['id']: item for item in SellerDetailsFormSerializer(sellers, many=True).data}
+
+
+LOADERS = {
+    ChangeLogEntry.REFERRAL: load_referrals,
+    ChangeLogEntry.ADDRESS: load_addresses,
+    ChangeLogEntry.SELLER: load_sellers,
+}
+
+
+def sync_payload(owner_id, cursor, limit, request=None):
+    """The sync response body; raises CursorExpired."""
+    entries, next_cursor, has_more = changes_since(owner_id, cursor, limit)
+    data = {"cursor": next_cursor, "has_more": has_more}
+    for kind, section in SECTIONS.items():
+        changed = entries[kind]
+        rows = LOADERS[kind](owner_id, changed['upserted'], request) if changed['upserted'] else {}
+        # A row deleted (or moved) after its entry was read is reported as deleted
+        missing = [object_id for object_id in changed['upserted'] if object_id not in rows]
+        data[section] = {
+            "upserted": [rows[object_id] for object_id in changed['upserted'] if object_id in rows],
+            "deleted": changed['deleted'] + missing,
+        }
+    return data
+
+
+# ==================== MAINTENANCE ====================
+
+def compact(days=None, now=None):
+    """Purge tombstones older than `days`; returns the number purged."""
+    days = settings.SYNC_TOMBSTONE_DAYS if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    with transaction.atomic():
+        expired = ChangeLogEntry.objects.filter(deleted=True, changed_at__lt=cutoff)
+        through = expired.aggregate(through=Max('id'))['through']
+        if through is None:
+            return 0
+        expired = expired.filter(id__lte=through)
+        horizons = dict(expired.values_list('owner_id').annotate(through=Max('id')).order_by())
+        for owner_id, previous in ChangeLogHorizon.objects.filter(owner_id__in=horizons).values_list(
+            'owner_id', 'purged_through',
+        ):
+            horizons[owner_id] = max(horizons[owner_id], previous)
+        ChangeLogHorizon.objects.bulk_create(
+            [ChangeLogHorizon(owner_id=owner_id, purged_through=newest) for owner_id, newest in horizons.items()],
+            update_conflicts=True, unique_fields=['owner'], update_fields=['purged_through'], batch_size=500,
+        )
+        purged, _ = expired.delete()
+        ChangeLogCompaction.objects.create(purged_through=through, purged=purged)
+    return purged
+
+
+def backfill(batch_size=1000):
+    """Log every synced row that has no entry yet; returns the number added."""
+    sources = {
+        ChangeLogEntry.REFERRAL: Form.objects.filter(referred_by__isnull=False).values_list('referred_by_id', 'id'),
+        ChangeLogEntry.ADDRESS: Address.objects.values_list('user_id', 'id'),
+        ChangeLogEntry.SELLER: SellerDetailsForm.objects.values_list('user_id', 'id'),
+    }
+    logged = defaultdict(set)
+    for kind, owner_id, object_id in ChangeLogEntry.objects.values_list('kind', 'owner_id', 'object_id'):
+        logged[kind].add((owner_id, object_id))
+
+    added = 0
+    for kind, rows in sources.items():
+        missing = [
+            ChangeLogEntry(owner_id=owner_id, kind=kind, object_id=object_id)
+            for owner_id, object_id in rows.iterator(chunk_size=batch_size)
+            if (owner_id, object_id) not in logged[kind]
+        ]
+        ChangeLogEntry.objects.bulk_create(missing, batch_size=batch_size)
+        added += len(missing)
+    return added
@@ -1,3 +1,1749 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from cards.idempotency import cache_key, PENDING
+from cards.middleware import registry
+from cards.profiling import StackSampler
+from cards import pubsub
+from cards.renderers import ORJSONRenderer
+from cards.throttling import MemoryBucketStore, get_store
+from user.models import SellerDetailsForm, Category
+from . import leaderboard, live, outbox
+from .clicks import ClickBuffer, buffer as click_buffer, click_stats, record_click, rollup_clicks
+from .models import (
+    Form, Address, ChangeLogCompaction, ChangeLogEntry, LinkClick, LinkClickRollup, LinkRotationJob, OutboxEvent, OutboxOffset, UserSeries,
+    generate_referral_code, generate_tokens,
+)
+from .imports import import_addresses
+from .links import create_rotation, render_pending_qr_codes, run_rotation, sweep_expired_links, usable_links
+from .regions import rebuild_regions, region_counts
+from .sync import backfill, compact
+from .timeseries import add_counts, buckets, daily_counts, pack, rebuild_series, resample, unpack
+from .views import FormListView
+from .serializers import (
+    parse_fieldset, FormSerializer, AddressSerializer, FastFormSerializer, FastAddressSerializer,
+)
+
+
+def make_user(n, **kwargs):
+    # Pre-set qr_code_image so Form.save() skips QR rendering in tests
+    defaults = {
+        'full_name': f'User{n}',
+        'last_name': 'Test',
+        'email': f'user{n}@example.com',
+        'phone_number': f'9{n:09d}',
+        'password': 'x',
+        'qr_code_image': f'qr_codes/user{n}.png',
+    }
+    defaults.update(kwargs)
+    return Form.objects.create(**defaults)
+
+
+def staff_client():
+    # Bulk and mass-write endpoints are restricted to Django staff accounts
+    client = APIClient()
+    client.force_authenticate(User(username='staff', is_staff=True))
+    return client
+
+
+# A plan line such as "SCAN form_form" (no index) means a full table scan.
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)(?!\w| USING)')
+
+
+class HotQueryIndexTests(TestCase):
+    """
+    EXPLAIN every SELECT issued by the hot per-user endpoints and fail
+    if any of them falls back to a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.referrer = make_user(0)
+        for n in range(1, 30):
+            referred = make_user(n, referred_by=cls.referrer)
+            Address.objects.create(
+                user=referred, house_name='H', street_name='S', country='IN',
+                state='KL', pin='682001', city='Kochi',
+            )
+        Address.objects.create(
+            user=cls.referrer, house_name='H', street_name='S', country='IN',
+            state='KL', pin='682001', city='Kochi',
+        )
+        SellerDetailsForm.objects.create(
+            user=cls.referrer, store_name='Store', inventory_estimate='<1000',
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertNoFullScans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                self.assertIsNone(
+                    FULL_SCAN_RE.search(plan),
+                    f'Full table scan for {url}:\n{sql}\n{plan}',
+                )
+
+    def test_referral_dashboard(self):
+        self.assertNoFullScans(f'/api/dashboard/{self.referrer.uuid}/')
+
+    def test_referral_list(self):
+        self.assertNoFullScans(f'/api/dashboard/{self.referrer.uuid}/referrals/')
+
+    def test_referral_analytics(self):
+        self.assertNoFullScans(f'/api/dashboard/{self.referrer.uuid}/analytics/')
+
+    def test_referral_search(self):
+        self.assertNoFullScans(f'/api/dashboard/{self.referrer.uuid}/search/?q=User1')
+
+    def test_user_full_detail(self):
+        self.assertNoFullScans(f'/api/user/{self.referrer.uuid}/')
+
+    def test_user_list(self):
+        self.assertNoFullScans('/api/users/')
+
+    def test_seller_by_user(self):
+        self.assertNoFullScans(f'/api/seller/{self.referrer.uuid}/')
+
+
+class FastSerializerParityTests(TestCase):
+    """The fast-path serializers must render byte-identical JSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        referrer = make_user(0, gender='Female')
+        no_qr = make_user(1, referred_by=referrer)
+        Form.objects.filter(pk=no_qr.pk).update(qr_code_image='')
+        make_user(2, referred_by=referrer, full_name='Zoë Ñame', qr_code_image='qr_codes/zoë qr.png')
+        for n, user in enumerate(Form.objects.all()):
+            Address.objects.create(
+                user=user, house_name=f'House {n}', street_name='Street', country='IN',
+                state='KL', pin='682001', city='Kochi',
+                image='address_images/a.png' if n % 2 else '',
+            )
+
+    def assertSameJSON(self, slow, fast):
+        render = JSONRenderer().render
+        self.assertEqual(render(slow.data), render(fast.data))
+
+    def test_form_serializer_parity(self):
+        request = APIRequestFactory().get('/api/users/')
+        for context in ({}, {'request': request}):
+            users = Form.objects.order_by('id')
+            self.assertSameJSON(
+                FormSerializer(users, many=True, context=context),
+                FastFormSerializer(users.values_list(*FastFormSerializer.columns), many=True, context=context),
+            )
+
+    def test_address_serializer_parity(self):
+        request = APIRequestFactory().get('/api/addresses/')
+        for context in ({}, {'request': request}):
+            addresses = Address.objects.select_related('user').order_by('id')
+            self.assertSameJSON(
+                AddressSerializer(addresses, many=True, context=context),
+                FastAddressSerializer(addresses.values_list(*FastAddressSerializer.columns), many=True, context=context),
+            )
+
+    def test_list_endpoints(self):
+        client = APIClient()
+        for url in ('/api/users/?limit=100', '/api/addresses/?limit=100'):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['data']), 3)
+
+
+class ORJSONRendererTests(TestCase):
+
+    def test_matches_json_renderer(self):
+        data = {
+            'uuid': uuid.uuid4(),
+            'aware': datetime.datetime(2024, 5, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'naive': datetime.datetime(2024, 5, 1, 10, 30),
+            'date': datetime.date(2024, 5, 1),
+            'amount': decimal.Decimal('1.50'),
+            'text': 'Zoë \u2028 line',
+            'items': [1, None, True, {'nested': 'x'}],
+        }
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+
+    def test_indent_falls_back(self):
+        data = {'a': [1, 2]}
+        self.assertEqual(
+            JSONRenderer().render(data, 'application/json; indent=4'),
+            ORJSONRenderer().render(data, 'application/json; indent=4'),
+        )
+
+    def test_json_lines_stream(self):
+        for n in range(3):
+            make_user(n)
+        response = APIClient().get('/api/users/?stream=jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            [json.loads(line)['email'] for line in lines],
+            list(Form.objects.order_by('-created_at').values_list('email', flat=True)),
+        )
+
+    def test_json_lines_accept_header(self):
+        make_user(0)
+        Category.objects.create(name='Pokemon')
+        for url in ('/api/users/', '/api/categories/'):
+            response = APIClient().get(url, HTTP_ACCEPT='application/x-ndjson')
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+    def test_plain_accept_still_pages(self):
+        response = APIClient().get('/api/users/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_json_lines_only_where_it_streams(self):
+        user = make_user(0)
+        for url in ('/api/addresses/', '/api/sellers/', f'/api/dashboard/{user.uuid}/referrals/'):
+            response = APIClient().get(url, HTTP_ACCEPT='application/x-ndjson')
+            self.assertEqual(response.status_code, 406, url)
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.referrer = make_user(0)
+        for n in range(1, 4):
+            make_user(n, referred_by=cls.referrer)
+        seller = SellerDetailsForm.objects.create(
+            user=cls.referrer, store_name='Store', inventory_estimate='<1000',
+        )
+        seller.categories.set([Category.objects.create(name='Pokemon'), Category.objects.create(name='Baseball')])
+
+    def download(self, url):
+        response = staff_client().get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response, b''.join(response.streaming_content)
+
+    def test_users_csv(self):
+        _, body = self.download('/api/export/users/')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertNotIn('password', rows[0])
+
+    def test_referrals_jsonl_gzip(self):
+        response, body = self.download(f'/api/export/referrals/{self.referrer.uuid}/?type=jsonl&compress=gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="referrals.jsonl.gz"')
+        lines = gzip.decompress(body).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['referred_by_uuid'], str(self.referrer.uuid))
+
+    def test_sellers_include_categories(self):
+        _, body = self.download('/api/export/sellers/')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0]['categories'], 'Baseball|Pokemon')
+
+    def test_unknown_export(self):
+        self.assertEqual(staff_client().get('/api/export/passwords/').status_code, 404)
+        self.assertEqual(staff_client().get('/api/export/users/?type=xml').status_code, 400)
+
+    def test_anonymous_export_refused(self):
+        response = APIClient().get('/api/export/users/')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(response.streaming)
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+
+    def test_records_queries_and_exports_metrics(self):
+        referrer = make_user(0)
+        for n in range(1, 4):
+            make_user(n, referred_by=referrer)
+
+        response = APIClient().get(f'/api/dashboard/{referrer.uuid}/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        stats = registry.snapshot()['user-referral-dashboard']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['queries'], 0)
+        self.assertEqual(stats['response_bytes'], len(response.content))
+
+        metrics = APIClient().get('/metrics', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(metrics.status_code, 200)
+        self.assertIn('cards_db_queries_total{view="user-referral-dashboard"}', metrics.content.decode())
+
+    def test_metrics_are_local_only(self):
+        self.assertEqual(APIClient().get('/metrics', REMOTE_ADDR='10.0.0.8').status_code, 404)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+
+    def test_sampler_collects_and_aggregates(self):
+        sampler = StackSampler(0.01, self.profile_dir.name)
+        request = APIRequestFactory().get('/api/users/')
+        sampler.active[threading.get_ident()] = request
+        sampler.sample()
+        sampler.sample()
+        sampler.flush()
+
+        (path,) = Path(self.profile_dir.name).glob('unresolved.*.collapsed')
+        stack, count = path.read_text().splitlines()[0].rsplit(' ', 1)
+        self.assertEqual(count, '2')
+        self.assertIn('test_sampler_collects_and_aggregates', stack)
+
+        call_command('aggregate_profiles', input=self.profile_dir.name, out_format='speedscope', stdout=io.StringIO())
+        profile = json.loads((Path(self.profile_dir.name) / 'aggregated' / 'unresolved.speedscope.json').read_text())
+        self.assertEqual(profile['profiles'][0]['endValue'], 2)
+
+    def test_profile_request_only_from_allowed_ips(self):
+        make_user(0)
+        with override_settings(PROFILE_DIR=self.profile_dir.name):
+            response = APIClient().get('/api/users/?profile=1', REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+
+    def test_profile_request_writes_its_own_file(self):
+        make_user(0)
+        list_users = FormListView.get_queryset
+
+        def slow_get_queryset(view):
+            time.sleep(0.05)  # long enough for the 1 ms sampler to catch it
+            return list_users(view)
+
+        with override_settings(PROFILE_DIR=self.profile_dir.name), \
+                mock.patch.object(FormListView, 'get_queryset', slow_get_queryset):
+            response = APIClient().get('/api/users/', HTTP_X_PROFILE='1', REMOTE_ADDR='127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        filename = response['X-Profile-File']
+        self.assertTrue(filename.startswith('form-list.request.'))
+        self.assertIn('slow_get_queryset', (Path(self.profile_dir.name) / filename).read_text())
+
+    def test_flush_prunes_old_files(self):
+        directory = Path(self.profile_dir.name)
+        old, recent = directory / 'old.collapsed', directory / 'recent.collapsed'
+        for path in (old, recent):
+            path.write_text('a;b 1\n')
+        week_ago = time.time() - 7 * 24 * 60 * 60
+        os.utime(old, (week_ago, week_ago))
+        StackSampler(0.01, directory, retention_seconds=24 * 60 * 60).flush()
+        self.assertEqual(sorted(path.name for path in directory.iterdir()), ['recent.collapsed'])
+
+
+class GenerateFixturesTests(TestCase):
+
+    def test_generate_dump_and_reload(self):
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_fixtures', users=120, chunk_size=50, categories=10, dump=directory, stdout=out)
+            users = list(Form.objects.order_by('id').values_list('id', 'referral_code', 'referred_by_id'))
+            self.assertEqual(len(users), 120)
+            self.assertGreater(sum(1 for _, _, referrer in users if referrer), 80)
+            self.assertTrue(Form.objects.filter(referral_code='JOHN019').exists())
+
+            Form.objects.all().delete()
+            Category.objects.all().delete()
+            call_command('generate_fixtures', load=directory, stdout=out)
+            self.assertEqual(
+                list(Form.objects.order_by('id').values_list('id', 'referral_code', 'referred_by_id')), users,
+            )
+            self.assertTrue(SellerDetailsForm.categories.through.objects.exists())
+
+    def test_append_to_existing_data(self):
+        make_user(0, full_name='John', referral_code='JOHN000')
+        make_user(1, full_name='John', referral_code='JOHN001')
+        out = io.StringIO()
+        call_command('generate_fixtures', users=30, chunk_size=10, categories=5, stdout=out)
+        call_command('generate_fixtures', users=30, chunk_size=10, categories=5, stdout=out)  # same seed again
+        self.assertEqual(Form.objects.count(), 62)
+        self.assertEqual(Form.objects.filter(referral_code__startswith='JOHN').count(), 12)
+
+
+class RegistrationTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def payload(self, n):
+        return {
+            'full_name': 'Stress Tester', 'last_name': 'Test', 'email': f'new{n}@example.com',
+            'phone_number': f'8{n:09d}', 'password': 'secret-pass', 'reenter_password': 'secret-pass',
+        }
+
+    def test_referral_code_past_999(self):
+        Form.objects.bulk_create([
+            Form(
+                full_name='John', email=f'j{n}@example.com', phone_number=f'5{n:09d}',
+                password='x', referral_code=f'JOHN{n:03d}', qr_code_image='qr_codes/x.png',
+            )
+            for n in range(1000)
+        ])
+        self.assertEqual(generate_referral_code('John Doe'), 'JOHN1000')
+
+    def test_retries_when_code_is_taken(self):
+        make_user(1, referral_code='STRE000')
+        # Simulate a concurrent signup that took STRE000 after our scan
+        with mock.patch('form.serializers.generate_referral_code', side_effect=['STRE000', 'STRE001']):
+            response = APIClient().post('/api/register/', self.payload(2), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        user = Form.objects.get(email='new2@example.com')
+        self.assertEqual(user.referral_code, 'STRE001')
+        self.assertTrue(user.qr_code_image.name.endswith('STRE001_qr.png'))
+
+    def test_duplicate_email_is_a_validation_error(self):
+        make_user(1, email='new2@example.com')
+        response = APIClient().post('/api/register/', self.payload(2), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Form.objects.filter(email='new2@example.com').count(), 1)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RegistrationConcurrencyTests(TransactionTestCase):
+    """Real threads and connections: every signup races for the same code prefix."""
+
+    SIGNUPS = 24
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_concurrent_same_prefix_signups_all_succeed(self):
+        start = threading.Barrier(self.SIGNUPS)
+
+        def register(n):
+            try:
+                start.wait()
+                return APIClient().post('/api/register/', {
+                    'full_name': 'Stress Tester', 'last_name': 'Test', 'email': f'race{n}@example.com',
+                    'phone_number': f'7{n:09d}', 'password': 'secret-pass', 'reenter_password': 'secret-pass',
+                }, format='json')
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(self.SIGNUPS) as pool:
+            responses = list(pool.map(register, range(self.SIGNUPS)))
+
+        self.assertEqual([r.status_code for r in responses], [201] * self.SIGNUPS,
+                         [r.content for r in responses if r.status_code != 201])
+        codes = sorted(r.json()['data']['referral_code'] for r in responses)
+        self.assertEqual(codes, [f'STRE{n:03d}' for n in range(self.SIGNUPS)])
+        self.assertEqual(sorted(Form.objects.values_list('referral_code', flat=True)), codes)
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+
+    def post(self, url, email, key='retry-1'):
+        payload = {
+            'full_name': 'Retry User', 'last_name': 'Test', 'email': email, 'phone_number': '9876543210',
+            'password': 'secret-pass', 'reenter_password': 'secret-pass',
+        }
+        return self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.post('/api/register/', 'retry@example.com')
+        with mock.patch('form.serializers.make_password') as hasher:
+            second = self.post('/api/register/', 'retry@example.com')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        hasher.assert_not_called()
+        self.assertEqual(Form.objects.count(), 1)
+
+    def test_referral_registration_retry(self):
+        referrer = make_user(1)
+        url = f'/api/refer/{referrer.referral_code}/'
+        first = self.post(url, 'retry@example.com')
+        second = self.post(url, 'retry@example.com')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(referrer.referrals.count(), 1)
+
+    @override_settings(THROTTLE_RATES={'referral-registration:referral_code': '1/min'})
+    def test_throttled_response_is_not_replayed(self):
+        get_store().clear()
+        self.addCleanup(get_store().clear)
+        url = f'/api/refer/{make_user(1).referral_code}/'
+        self.assertEqual(self.client.get(url).status_code, 200)  # uses up the code's budget
+        self.assertEqual(self.post(url, 'retry@example.com').status_code, 429)
+        get_store().clear()  # the bucket refills
+        retry = self.post(url, 'retry@example.com')
+        self.assertEqual(retry.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', retry)
+
+    def test_key_reused_with_other_body(self):
+        self.post('/api/register/', 'retry@example.com')
+        response = self.post('/api/register/', 'other@example.com')
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_in_flight_duplicate(self):
+        self.post('/api/register/', 'first@example.com', key='a')
+        # Claim a key as a concurrent request would
+        request = APIRequestFactory().post('/api/register/')
+        cache.set(cache_key(request, 'b'), PENDING)
+        response = self.post('/api/register/', 'second@example.com', key='b')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Form.objects.filter(email='second@example.com').exists())
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        get_store().clear()
+        self.addCleanup(get_store().clear)
+        self.user = make_user(1)
+
+    def test_bucket_refills(self):
+        store = MemoryBucketStore()
+        with mock.patch('cards.throttling.time.monotonic', return_value=100.0):
+            waits = [store.consume('k', 2, 1.0) for _ in range(3)]
+        self.assertEqual(waits, [0.0, 0.0, 1.0])
+        with mock.patch('cards.throttling.time.monotonic', return_value=101.5):
+            self.assertEqual(store.consume('k', 2, 1.0), 0.0)
+
+    def test_evicts_least_recently_used(self):
+        store = MemoryBucketStore(max_keys=2)
+        for key in 'aba':
+            store.consume(key, 1, 0.001)
+        store.consume('c', 1, 0.001)
+        self.assertEqual(list(store.buckets), ['a', 'c'])
+
+    @override_settings(THROTTLE_RATES={'user-by-unique-link:token': '2/min'})
+    def test_unique_link_rejected_before_orm(self):
+        url = f'/api/user/{self.user.unique_link_token}/'
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # Other links keep their own budget
+        other = make_user(2)
+        self.assertEqual(self.client.get(f'/api/user/{other.unique_link_token}/').status_code, 200)
+
+    @override_settings(THROTTLE_RATES={'search-referred-users': '1/min'})
+    def test_search_per_ip(self):
+        url = f'/api/dashboard/{self.user.uuid}/search/?q=a'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(THROTTLE_RATES={'search-referred-users': '1/min'})
+    def test_forwarded_for_is_not_trusted(self):
+        url = f'/api/dashboard/{self.user.uuid}/search/?q=a'
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='1.1.1.1').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_X_FORWARDED_FOR='2.2.2.2').status_code, 429)
+
+
+@override_settings(CLICK_BATCH_SIZE=3, CLICK_FLUSH_SECONDS=3600)
+class ClickAnalyticsTests(TestCase):
+
+    def setUp(self):
+        click_buffer.events = []
+        self.user = make_user(1)
+        make_user(2, referred_by=self.user)
+
+    def click(self, referer=None):
+        extra = {'HTTP_REFERER': referer} if referer else {}
+        return self.client.get(f'/api/user/{self.user.unique_link_token}/', **extra)
+
+    def test_timer_flushes_a_partial_batch(self):
+        buffer = ClickBuffer()
+        flushed = threading.Event()
+
+        def flush(buffer):
+            buffer.events, buffer.last_flush = [], time.monotonic()
+            flushed.set()
+
+        with override_settings(CLICK_FLUSH_SECONDS=0.05), \
+                mock.patch.object(ClickBuffer, 'flush', autospec=True, side_effect=flush):
+            buffer.add(self.user.id, '')  # one click, then none
+            self.assertEqual(len(buffer.events), 1)
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(buffer.events, [])
+        self.assertTrue(buffer.timer.daemon)
+
+    def test_clicks_are_written_in_batches(self):
+        self.click()
+        self.click('https://t.co/abc')
+        self.assertFalse(LinkClick.objects.exists())
+        self.click()
+        self.assertEqual(LinkClick.objects.count(), 3)
+
+    def test_rollup_compacts_and_feeds_analytics(self):
+        for referer in (None, 'https://t.co/x', 'https://t.co/y', None, None, 'https://mail.example.com/'):
+            self.click(referer)
+        self.assertEqual(rollup_clicks(), 6)
+        self.assertFalse(LinkClick.objects.exists())
+        self.assertEqual(LinkClickRollup.objects.filter(granularity='hour').count(), 3)
+
+        for _ in range(3):
+            self.click()
+        rollup_clicks()
+        day = LinkClickRollup.objects.get(granularity='day', source='')
+        self.assertEqual(day.count, 6)
+        series = UserSeries.objects.get(user=self.user, metric=UserSeries.CLICKS)
+        self.assertEqual(sum(unpack(series.counts)), 9)
+
+        with self.assertNumQueries(1):
+            stats = click_stats(self.user, referrals=1)
+        self.assertEqual(stats['total_clicks'], 9)
+        self.assertEqual(stats['conversion_rate'], round(1 / 9, 4))
+        self.assertEqual(stats['daily'][-1]['clicks'], 9)
+        self.assertEqual(len(stats['daily']), 30)
+        self.assertEqual(stats['sources'][:2], [
+            {'source': 'direct', 'clicks': 6}, {'source': 't.co', 'clicks': 2},
+        ])
+
+        response = self.client.get(f'/api/dashboard/{self.user.uuid}/analytics/')
+        self.assertEqual(response.json()['data']['click_stats']['total_clicks'], 9)
+
+    def test_rollup_deletes_only_counted_rows(self):
+        for _ in range(3):
+            self.click()
+        LinkClick.objects.filter(source='').order_by('id')[1:2].get().delete()
+        # A transaction that took a lower id commits between the SELECT and the DELETE
+        late = LinkClick(id=LinkClick.objects.order_by('id').first().id + 1,
+                         user=self.user, source='late.example.com', clicked_at=timezone.now())
+        delete = QuerySet.delete
+
+        def commit_late_then_delete(queryset):
+            if late._state.adding:
+                late.save()
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', commit_late_then_delete):
+            self.assertEqual(rollup_clicks(), 2)
+        self.assertEqual(list(LinkClick.objects.values_list('source', flat=True)), ['late.example.com'])
+        self.assertEqual(rollup_clicks(), 1)
+        days = LinkClickRollup.objects.filter(granularity='day').values_list('count', flat=True)
+        self.assertEqual(sum(days), 3)
+
+
+class TimeSeriesTests(TestCase):
+
+    def setUp(self):
+        self.referrer = make_user(1)
+        self.jan1 = datetime.date(2026, 1, 1)
+        for n, day in enumerate([3, 5, 5, 20, 40], start=2):
+            created_at = datetime.datetime.combine(self.jan1, datetime.time()) + datetime.timedelta(days=day - 1)
+            make_user(n, referred_by=self.referrer, created_at=created_at)
+        rebuild_series(UserSeries.REFERRALS)
+        self.url = f'/api/dashboard/{self.referrer.uuid}/timeseries/'
+
+    def test_incremental_updates_match_rebuild(self):
+        rebuilt = UserSeries.objects.get(user=self.referrer, metric=UserSeries.REFERRALS)
+        UserSeries.objects.all().delete()
+        # Out of order, growing the array at both ends
+        for day in [20, 5, 40, 3, 5]:
+            add_counts(UserSeries.REFERRALS, {self.referrer.id: {self.jan1 + datetime.timedelta(days=day - 1): 1}})
+        incremental = UserSeries.objects.get(user=self.referrer, metric=UserSeries.REFERRALS)
+        self.assertEqual((incremental.start, bytes(incremental.counts)), (rebuilt.start, bytes(rebuilt.counts)))
+
+    def test_concurrent_first_increment_is_not_lost(self):
+        UserSeries.objects.all().delete()
+        # Another worker's first increment commits after our SELECT found no row
+        UserSeries.objects.create(user=self.referrer, metric=UserSeries.REFERRALS, start=self.jan1,
+                                  counts=pack(array('I', [1])))
+        select_for_update = UserSeries.objects.select_for_update
+        stale = [UserSeries.objects.none()]
+
+        def stale_then_current():
+            return stale.pop() if stale else select_for_update()
+
+        with mock.patch.object(UserSeries.objects, 'select_for_update', side_effect=stale_then_current):
+            add_counts(UserSeries.REFERRALS, {self.referrer.id: {self.jan1: 1}})
+        series = UserSeries.objects.get(user=self.referrer, metric=UserSeries.REFERRALS)
+        self.assertEqual(list(unpack(series.counts)), [2])
+
+    def test_registration_bumps_referrer_series(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/refer/{self.referrer.referral_code}/', {
+                'full_name': 'New', 'last_name': 'User', 'email': 'new@example.com', 'phone_number': '8000000001',
+                'password': 'secret-pass', 'reenter_password': 'secret-pass',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        today = datetime.date.today().isoformat()
+        data = self.client.get(f'{self.url}?metric=referrals&start={today}&end={today}').json()['data']
+        self.assertEqual(data['series'], {'referrals': [1]})
+
+    def test_dense_daily_series(self):
+        data = self.client.get(f'{self.url}?start=2026-01-01&end=2026-01-07').json()['data']
+        self.assertEqual(data['labels'][0], '2026-01-01')
+        self.assertEqual(data['series'], {'referrals': [0, 0, 1, 0, 2, 0, 0], 'clicks': [0] * 7})
+
+    def test_weekly_and_monthly_buckets(self):
+        weekly = self.client.get(f'{self.url}?interval=week&metric=referrals&start=2026-01-01&end=2026-01-31').json()
+        self.assertEqual(weekly['data']['labels'], ['2025-12-29', '2026-01-05', '2026-01-12', '2026-01-19', '2026-01-26'])
+        self.assertEqual(weekly['data']['series']['referrals'], [1, 2, 0, 1, 0])
+        monthly = self.client.get(f'{self.url}?interval=month&metric=referrals&start=2026-01-01&end=2026-03-31').json()
+        self.assertEqual(monthly['data']['series']['referrals'], [4, 1, 0])
+
+    def test_resample_without_numpy(self):
+        first, last = datetime.date(2026, 1, 1), datetime.date(2026, 2, 10)
+        _, offsets = buckets(first, last, 'month')
+        daily = daily_counts(UserSeries.objects.get(user=self.referrer), first, last)
+        with mock.patch('form.timeseries.numpy', None):
+            self.assertEqual(resample(daily, offsets), [4, 1])
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get(f'{self.url}?interval=year').status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?start=2026-02-01&end=2026-01-01').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/dashboard/{uuid.uuid4()}/timeseries/').status_code, 404)
+
+
+@override_settings(LEADERBOARD_SNAPSHOT_PATH=None, LEADERBOARD_REFRESH_SECONDS=0)
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(leaderboard, '_leaderboard', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [make_user(n) for n in range(4)]
+        self.next_user = 10
+        # all time: user0 3, user1 2 (both recent), user2 1 (40 days ago)
+        self.refer(self.users[0], 3)
+        self.refer(self.users[1], 2, days_ago=10)
+        self.refer(self.users[2], 1, days_ago=40)
+
+    def refer(self, referrer, count, days_ago=0):
+        for _ in range(count):
+            created_at = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+            make_user(self.next_user, referred_by=referrer, created_at=created_at)
+            self.next_user += 1
+
+    def test_skip_list_matches_sorted_list(self):
+        rng = random.Random(7)
+        skip, reference = leaderboard.SkipList(seed=1), []
+        for _ in range(2000):
+            key = rng.randrange(500)
+            if key in reference:
+                skip.remove(key)
+                reference.remove(key)
+            else:
+                skip.insert(key)
+                reference.append(key)
+                reference.sort()
+        self.assertEqual(len(skip), len(reference))
+        self.assertEqual(skip.slice(0, len(reference)), reference)
+        self.assertEqual(skip.slice(17, 5), reference[17:22])
+        for position, key in enumerate(reference):
+            self.assertEqual(skip.rank(key), position)
+
+    def test_windows_and_ranks(self):
+        board = leaderboard.get_leaderboard()
+        top, size = board.top('total', 10)
+        self.assertEqual((top, size), ([(self.users[0].id, 3), (self.users[1].id, 2), (self.users[2].id, 1)], 3))
+        self.assertEqual(board.top('30d', 10)[0], [(self.users[0].id, 3), (self.users[1].id, 2)])
+        self.assertEqual(board.top('7d', 10)[0], [(self.users[0].id, 3)])
+
+        # New referrals are picked up by the tail
+        self.refer(self.users[1], 2)
+        self.assertEqual(board.ranks(self.users[1].id), {'total': (1, 4), '7d': (2, 2), '30d': (1, 4)})
+        self.assertEqual(board.ranks(self.users[3].id), {'total': None, '7d': None, '30d': None})
+
+        # Ten days on, every referral has left the 7-day board but not the 30-day one
+        board.advance(board.today + datetime.timedelta(days=10))
+        self.assertEqual(board.top('7d', 10)[0], [])
+        self.assertEqual(board.top('30d', 10)[0], [(self.users[1].id, 4), (self.users[0].id, 3)])
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'leaderboard.json'
+            board = leaderboard.Leaderboard(path)
+            board.refresh()
+            board.write_snapshot()
+            self.refer(self.users[3], 1)
+
+            restored = leaderboard.Leaderboard(path)
+            with mock.patch.object(restored, 'build') as build:
+                restored.refresh()
+            build.assert_not_called()  # only the changed referrer is recounted
+            self.assertEqual(restored.top('total', 10)[1], 4)
+            self.assertEqual(restored.ranks(self.users[0].id)['30d'], (1, 3))
+
+    def test_deletes_and_reassignments(self):
+        board = leaderboard.get_leaderboard()
+        board.refresh()
+        referrals = list(Form.objects.filter(referred_by=self.users[0]).order_by('id'))
+        referrals[0].delete()
+        moved = Form.objects.get(pk=referrals[1].pk)
+        moved.referred_by = self.users[3]
+        moved.save()
+        board.refresh(force=True)
+        self.assertEqual(board.ranks(self.users[0].id), {'total': (2, 1), '7d': (1, 1), '30d': (2, 1)})
+        self.assertEqual(board.ranks(self.users[3].id)['total'], (4, 1))
+
+        Form.objects.get(pk=referrals[2].pk).delete()
+        board.refresh(force=True)
+        self.assertEqual(board.ranks(self.users[0].id), {'total': None, '7d': None, '30d': None})
+
+        # The snapshot keeps the corrected totals
+        with tempfile.TemporaryDirectory() as directory:
+            board.snapshot_path = Path(directory) / 'leaderboard.json'
+            board.write_snapshot()
+            restored = leaderboard.Leaderboard(board.snapshot_path)
+            self.assertEqual(restored.top('total', 10), board.top('total', 10))
+
+    def test_compaction_past_the_board_forces_rebuild(self):
+        board = leaderboard.get_leaderboard()
+        board.refresh()
+        Form.objects.filter(referred_by=self.users[0]).first().delete()
+        tombstone = ChangeLogEntry.objects.latest('id')
+        ChangeLogCompaction.objects.create(purged_through=tombstone.id, purged=1)  # before the board read it
+        with mock.patch('form.leaderboard.threading.Thread') as thread, \
+                mock.patch.object(board, 'build', wraps=board.build) as build:
+            board.refresh(force=True)
+            board.refresh(force=True)
+            build.assert_not_called()  # not on the request path
+            thread.assert_called_once()  # and only one rebuild at a time
+            self.assertEqual(board.ranks(self.users[0].id)['total'], (1, 3))  # the current board until then
+
+            thread.call_args.kwargs['target']()  # what the background thread runs
+        self.assertEqual(board.ranks(self.users[0].id)['total'], (1, 2))
+        self.assertFalse(board.rebuilding)
+
+    @override_settings(LEADERBOARD_REBUILD_SECONDS=0)
+    def test_periodic_rebuild_runs_in_the_background(self):
+        board = leaderboard.get_leaderboard()
+        board.refresh()
+        with mock.patch('form.leaderboard.threading.Thread') as thread:
+            board.refresh(force=True)
+        thread.assert_called_once()
+        self.assertTrue(thread.call_args.kwargs['daemon'])
+        thread.return_value.start.assert_called_once()
+
+    def test_endpoints(self):
+        response = self.client.get('/api/leaderboard/?window=30d&limit=1&offset=1')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['total_ranked'], 2)
+        self.assertEqual(body['data'], [{
+            'rank': 2, 'uuid': str(self.users[1].uuid), 'full_name': self.users[1].full_name,
+            'referral_code': self.users[1].referral_code, 'referrals': 2,
+        }])
+        rank = self.client.get(f'/api/leaderboard/{self.users[2].uuid}/').json()['data']
+        self.assertEqual(rank, {'total': {'rank': 3, 'referrals': 1}, '7d': None, '30d': None})
+        self.assertEqual(self.client.get('/api/leaderboard/?window=year').status_code, 400)
+
+
+class BatchUserLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [make_user(n) for n in range(30)]
+        for n, user in enumerate(cls.users[:10]):
+            for k in range(n % 4):
+                Address.objects.create(
+                    user=user, house_name=f'H{k}', street_name='S', country='IN', state='KL', pin='682001', city='Kochi',
+                )
+            for k in range(n):
+                make_user(100 + n * 10 + k, referred_by=user)
+
+    def test_matches_single_lookup_in_constant_queries(self):
+        uuids = [str(user.uuid) for user in self.users]
+        missing = str(uuid.uuid4())
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/users/batch/', {'uuids': uuids + [missing, 'nope']}, content_type='application/json')
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body['found'], 30)
+        self.assertEqual(body['errors'], {missing: 'User not found', 'nope': 'Invalid UUID'})
+        for user in self.users[:10]:
+            single = self.client.get(f'/api/user/{user.uuid}/').json()['data']
+            self.assertEqual(body['data'][str(user.uuid)], single)
+
+    def test_get_and_limits(self):
+        response = self.client.get(f'/api/users/batch/?uuids={self.users[0].uuid},{self.users[1].uuid}')
+        self.assertEqual(set(response.json()['data']), {str(self.users[0].uuid), str(self.users[1].uuid)})
+        self.assertEqual(self.client.get('/api/users/batch/').status_code, 400)
+        too_many = [str(uuid.uuid4()) for _ in range(501)]
+        self.assertEqual(self.client.post('/api/users/batch/', {'uuids': too_many}, content_type='application/json').status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user(1)
+        cls.address = Address.objects.create(
+            user=cls.user, house_name='H', street_name='S', country='IN', state='KL', pin='682001', city='Kochi',
+        )
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), ctx.captured_queries[-1]['sql']
+
+    def test_parse(self):
+        self.assertEqual(
+            parse_fieldset('id, city,user.email,user.full_name,owner', expand='owner'),
+            {'id': None, 'city': None, 'user': {'email': None, 'full_name': None}, 'owner': {}},
+        )
+
+    def test_user_list_projects_requested_columns(self):
+        body, sql = self.get('/api/users/?fields=uuid,referral_link')
+        self.assertEqual(body['data'], [{
+            'uuid': str(self.user.uuid), 'referral_link': f'http://localhost:8000/api/refer/{self.user.referral_code}/',
+        }])
+        self.assertNotIn('qr_code_image', sql)
+        self.assertNotIn('email', sql)
+
+    def test_address_fieldsets_match_between_list_and_detail(self):
+        full = self.client.get(f'/api/addresses/{self.address.id}/').json()
+        cases = {
+            'fields=id,city': {'id': self.address.id, 'city': 'Kochi'},
+            'fields=id,user': {'id': self.address.id, 'user': str(self.user.uuid)},
+            'fields=id,user.email': {'id': self.address.id, 'user': {'email': self.user.email}},
+            'fields=id,user&expand=user': {'id': self.address.id, 'user': full['user']},
+        }
+        for query, expected in cases.items():
+            listed, list_sql = self.get(f'/api/addresses/?{query}')
+            detail, detail_sql = self.get(f'/api/addresses/{self.address.id}/?{query}')
+            self.assertEqual(listed['data'], [expected], query)
+            self.assertEqual(detail, expected, query)
+            for sql in (list_sql, detail_sql):
+                self.assertNotIn('street_name', sql)
+                self.assertNotIn('password', sql)
+
+    def test_unknown_fields_are_refused(self):
+        cases = [
+            ('/api/users/?fields=uuid,bogus', "Unknown field 'bogus'; choose from: uuid, full_name"),
+            (f'/api/user/{self.user.unique_link_token}/?fields=uuid,bogus', "Unknown field 'bogus'"),
+            (f'/api/user/{self.user.unique_link_token}/?fields=password', "Unknown field 'password'"),  # write-only
+            ('/api/users/?fields=email.domain', "'email' has no sub-fields"),
+        ]
+        for url in ('/api/addresses/', f'/api/addresses/{self.address.id}/'):
+            cases += [
+                (f'{url}?fields=id,bogus', "Unknown field 'bogus'; choose from: id, user, house_name"),
+                (f'{url}?fields=id,user.bogus', "Unknown field 'user.bogus'; choose from: user.full_name"),
+                (f'{url}?fields=city.name', "'city' has no sub-fields"),
+            ]
+        for url, message in cases:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json()['code'], 400)
+            self.assertIn(message, response.json()['message'], url)
+        self.assertEqual(Form.objects.get(id=self.user.id).link_click_count, 0)  # refused before counting
+
+    def test_writes_ignore_fields(self):
+        response = self.client.patch(
+            f'/api/addresses/{self.address.id}/?fields=id', {'city': 'Pune'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['city'], 'Pune')
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user(1)
+        cls.address = Address.objects.create(
+            user=cls.user, house_name='H', street_name='S', country='IN', state='KL', pin='682001', city='Kochi',
+        )
+        cls.category = Category.objects.create(name='Cards')
+        cls.seller = SellerDetailsForm.objects.create(user=cls.user, store_name='Store', inventory_estimate='<1000')
+        cls.seller.categories.add(cls.category)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_unchanged_resources_are_not_modified_after_one_query(self):
+        for url in (f'/api/user/{self.user.uuid}/', f'/api/addresses/{self.address.id}/',
+                    f'/api/sellers/{self.seller.id}/', '/api/categories/', f'/api/categories/{self.category.id}/'):
+            etag = self.etag(url)
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+
+    def test_user_detail_changes_with_addresses_and_referrals(self):
+        url = f'/api/user/{self.user.uuid}/'
+        first = self.etag(url)
+        Address.objects.create(
+            user=self.user, house_name='H2', street_name='S', country='IN', state='KL', pin='682001', city='Pune',
+        )
+        second = self.etag(url)
+        self.assertNotEqual(first, second)
+        referred = make_user(2, referred_by=self.user)
+        third = self.etag(url)
+        self.assertNotEqual(second, third)
+        referred.full_name = 'Renamed'
+        referred.save()
+        self.assertNotEqual(third, self.etag(url))
+
+    def test_previous_owner_changes_when_rows_move_away(self):
+        other = make_user(3)
+        referred = make_user(2, referred_by=self.user)
+        url = f'/api/user/{self.user.uuid}/'
+        first = self.etag(url)
+        referred = Form.objects.get(pk=referred.pk)
+        referred.referred_by = other
+        referred.save()
+        second = self.etag(url)
+        self.assertNotEqual(first, second)
+
+        address = Address.objects.get(pk=self.address.pk)
+        address.user = other
+        address.save()
+        self.assertNotEqual(second, self.etag(url))
+        self.assertEqual(self.client.get(url).json()['data']['total_addresses'], 0)
+
+    def test_seller_and_category_changes(self):
+        seller_url = f'/api/sellers/{self.seller.id}/'
+        first = self.etag(seller_url)
+        self.category.name = 'Collectibles'
+        self.category.save()
+        second = self.etag(seller_url)
+        self.assertNotEqual(first, second)
+        self.seller.categories.remove(self.category)
+        self.assertNotEqual(second, self.etag(seller_url))
+
+        list_etag = self.etag('/api/categories/')
+        Category.objects.create(name='Coins')
+        self.assertNotEqual(list_etag, self.etag('/api/categories/'))
+
+    def test_variants_and_if_modified_since(self):
+        url = f'/api/addresses/{self.address.id}/'
+        self.assertNotEqual(self.etag(url), self.etag(url + '?fields=id'))
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200,
+        )
+
+    def test_missing_resource_is_still_404(self):
+        self.assertEqual(self.client.get(f'/api/user/{uuid.uuid4()}/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+        self.assertEqual(self.client.get('/api/sellers/999999/').status_code, 404)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class DeltaSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user(1)
+        cls.category = Category.objects.create(name='Cards')
+
+    def sync(self, cursor=0, **params):
+        response = self.client.get(f'/api/dashboard/{self.user.uuid}/sync/', {'cursor': cursor, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def add_address(self, city='Kochi'):
+        return Address.objects.create(
+            user=self.user, house_name='H', street_name='S', country='IN', state='KL', pin='682001', city=city,
+        )
+
+    def test_initial_then_incremental_sync(self):
+        referred = make_user(2, referred_by=self.user)
+        address = self.add_address()
+        first = self.sync()
+        self.assertEqual([r['uuid'] for r in first['referrals']['upserted']], [str(referred.uuid)])
+        self.assertEqual(first['addresses']['upserted'][0]['city'], 'Kochi')
+        self.assertFalse(first['has_more'])
+
+        self.assertEqual(self.sync(first['cursor'])['cursor'], first['cursor'])  # nothing changed
+
+        address.city = 'Pune'
+        address.save()
+        seller = SellerDetailsForm.objects.create(user=self.user, store_name='Store', inventory_estimate='<1000')
+        referred_id = referred.id
+        referred.delete()
+        with self.assertNumQueries(6):  # owner, horizon, log page, addresses, sellers, categories
+            response = self.client.get(f'/api/dashboard/{self.user.uuid}/sync/', {'cursor': first['cursor']})
+        delta = response.json()['data']
+        self.assertEqual([a['city'] for a in delta['addresses']['upserted']], ['Pune'])
+        self.assertEqual([s['id'] for s in delta['sellers']['upserted']], [seller.id])
+        self.assertEqual(delta['referrals'], {'upserted': [], 'deleted': [referred_id]})
+
+    def test_log_keeps_one_entry_per_object(self):
+        address = self.add_address()
+        for city in ('A', 'B', 'C'):
+            address.city = city
+            address.save()
+        self.assertEqual(ChangeLogEntry.objects.filter(kind=ChangeLogEntry.ADDRESS).count(), 1)
+        # Click bookkeeping does not touch the synced referral row
+        referred = make_user(2, referred_by=self.user)
+        entry = ChangeLogEntry.objects.get(kind=ChangeLogEntry.REFERRAL)
+        referred.increment_link_clicks()
+        self.assertEqual(ChangeLogEntry.objects.get(kind=ChangeLogEntry.REFERRAL).id, entry.id)
+
+    def test_paging_and_category_changes(self):
+        for n in range(5):
+            self.add_address(city=f'C{n}')
+        seller = SellerDetailsForm.objects.create(user=self.user, store_name='Store', inventory_estimate='<1000')
+        seller.categories.add(self.category)
+        page = self.sync(limit=2)
+        self.assertTrue(page['has_more'])
+        seen = [a['city'] for a in page['addresses']['upserted']]
+        while page['has_more']:
+            page = self.sync(page['cursor'], limit=2)
+            seen += [a['city'] for a in page['addresses']['upserted']]
+        self.assertEqual(seen, [f'C{n}' for n in range(5)])
+
+        self.category.name = 'Coins'
+        self.category.save()
+        delta = self.sync(page['cursor'])
+        self.assertEqual(delta['sellers']['upserted'][0]['categories'], [{'id': self.category.id, 'name': 'Coins'}])
+
+    def test_unsettled_entries_end_the_page(self):
+        self.add_address()
+        with override_settings(SYNC_SETTLE_SECONDS=60):
+            page = self.sync()
+        self.assertEqual(page['addresses']['upserted'], [])
+        self.assertTrue(page['has_more'])
+        self.assertEqual(page['cursor'], 0)
+
+    def test_compaction_expires_old_cursors(self):
+        address = self.add_address()
+        cursor = self.sync()['cursor']
+        address.delete()
+        self.add_address()
+        self.assertEqual(compact(days=0, now=timezone.now() + datetime.timedelta(seconds=1)), 1)
+        response = self.client.get(f'/api/dashboard/{self.user.uuid}/sync/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(len(self.sync()['addresses']['upserted']), 1)
+
+    def test_compaction_only_expires_the_owners_cursors(self):
+        self.add_address()
+        other = make_user(2)
+        gone = Address.objects.create(
+            user=other, house_name='H', street_name='S', country='IN', state='KL', pin='682001', city='Kochi',
+        )
+        gone.delete()
+        self.assertEqual(compact(days=0, now=timezone.now() + datetime.timedelta(seconds=1)), 1)
+        # This user's whole log is below the other owner's purged tombstone
+        first = self.sync()
+        self.assertEqual(len(first['addresses']['upserted']), 1)
+        self.assertEqual(self.sync(first['cursor'])['cursor'], first['cursor'])
+        self.add_address(city='Pune')
+        self.assertEqual([a['city'] for a in self.sync(first['cursor'])['addresses']['upserted']], ['Pune'])
+
+    def test_resync_after_expiry_returns_a_live_cursor(self):
+        self.add_address()
+        cursor = self.sync()['cursor']
+        newer = self.add_address(city='Pune')
+        newer.delete()  # the newest entry of this owner, then purged
+        compact(days=0, now=timezone.now() + datetime.timedelta(seconds=1))
+        first = self.sync()
+        self.assertEqual(self.client.get(f'/api/dashboard/{self.user.uuid}/sync/', {'cursor': cursor}).status_code, 410)
+        self.assertEqual(self.sync(first['cursor'])['addresses'], {'upserted': [], 'deleted': []})
+
+    def test_backfill_logs_bulk_created_rows(self):
+        Address.objects.bulk_create([
+            Address(user=self.user, house_name='H', street_name='S', country='IN', state='KL', pin='1', city='X'),
+        ])
+        self.assertEqual(self.sync()['addresses']['upserted'], [])
+        self.assertEqual(backfill(), 1)
+        self.assertEqual(backfill(), 0)
+        self.assertEqual(len(self.sync()['addresses']['upserted']), 1)
+
+    def test_bad_cursor(self):
+        response = self.client.get(f'/api/dashboard/{self.user.uuid}/sync/', {'cursor': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/dashboard/{uuid.uuid4()}/sync/').status_code, 404)
+
+
+class LinkExpiryTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.past = timezone.now() - datetime.timedelta(hours=1)
+        self.users = [make_user(n) for n in range(5)]
+        Form.objects.filter(id__in=[user.id for user in self.users[:3]]).update(link_expires_at=self.past)
+
+    def tearDown(self):
+        click_buffer.events = []  # the users are rolled back; drop their buffered clicks
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def test_expired_links_are_not_served_before_the_sweep(self):
+        self.assertEqual(self.client.get(f'/api/user/{self.users[0].unique_link_token}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/user/{self.users[4].unique_link_token}/').status_code, 200)
+
+    def test_sweep_deactivates_in_batches_and_counts(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(sweep_expired_links(batch_size=2), 3)
+        self.assertEqual(sum('UPDATE' in query['sql'] for query in ctx.captured_queries), 2)
+        self.assertEqual(
+            list(Form.objects.filter(is_link_active=False).order_by('id').values_list('id', flat=True)),
+            [user.id for user in self.users[:3]],
+        )
+        self.assertEqual(sweep_expired_links(), 0)
+        self.assertEqual(registry.counters(), {'link_sweeps': 2, 'links_expired': 3})
+        self.assertIn('cards_links_expired_total 3', registry.to_prometheus())
+
+    def test_queries_use_the_partial_indexes(self):
+        self.assertIn('form_link_expiry_idx', self.plan(
+            Form.objects.filter(is_link_active=True, link_expires_at__lte=timezone.now())
+            .order_by('link_expires_at').values_list('id')[:10]
+        ))
+        self.assertNotRegex(self.plan(usable_links().filter(unique_link_token='x')), FULL_SCAN_RE)
+
+    def test_bulk_ttl_assignment(self):
+        staff = staff_client()
+        unknown = str(uuid.uuid4())
+        response = staff.post('/api/links/expiry/', {
+            'uuids': [str(self.users[3].uuid), str(self.users[4].uuid), unknown], 'ttl_seconds': 3600,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['data']['updated'], 2)
+        self.assertEqual(response.json()['data']['not_found'], [unknown])
+        self.assertEqual(Form.objects.filter(link_expires_at__gt=timezone.now()).count(), 2)
+
+        response = staff.post('/api/links/expiry/', {
+            'uuids': [str(self.users[0].uuid)], 'expires_at': None,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Form.objects.get(id=self.users[0].id).link_expires_at)
+
+        for body in ({'uuids': [unknown]}, {'uuids': ['nope'], 'ttl_seconds': 5},
+                     {'uuids': [unknown], 'expires_at': 'tomorrow'}, {'uuids': [], 'ttl_seconds': 5},
+                     {'uuids': [unknown], 'expires_at': '2026-02-30T00:00:00'},
+                     {'uuids': [unknown], 'ttl_seconds': 10 ** 12},
+                     {'uuids': [unknown], 'expires_at': '9999-12-31T23:00:00-05:00'}):
+            response = staff.post('/api/links/expiry/', body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+@override_settings(LINK_ROTATION_INLINE_MAX=2)
+class LinkRotationTests(TestCase):
+
+    def setUp(self):
+        self.users = [make_user(n, full_name='Anna') for n in range(5)]
+        self.tokens = dict(Form.objects.values_list('id', 'unique_link_token'))
+
+    def test_generate_tokens(self):
+        tokens = generate_tokens(1000)
+        self.assertEqual(len(set(tokens)), 1000)
+        self.assertTrue(all(re.fullmatch(r'[A-Za-z0-9]{32}', token) for token in tokens))
+
+    def test_rotation_is_batched_and_resumable(self):
+        job = create_rotation([user.id for user in self.users[:4]], links=True, codes=True)
+        batches = []
+        with mock.patch('form.links.rotate_batch', side_effect=[None, RuntimeError('crash')]) as rotate:
+            with self.assertRaises(RuntimeError):
+                run_rotation(job, batch_size=2, progress=lambda job: batches.append(job.processed))
+        self.assertEqual(rotate.call_count, 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.last_id), (LinkRotationJob.RUNNING, 2, self.users[1].id))
+
+        with CaptureQueriesContext(connection) as ctx:
+            run_rotation(job, batch_size=2, progress=lambda job: batches.append(job.processed))
+        self.assertEqual(batches, [2, 4])
+        self.assertEqual(job.status, LinkRotationJob.DONE)
+        self.assertEqual(sum('UPDATE "form_form"' in query['sql'] for query in ctx.captured_queries), 1)
+
+        rows = dict(Form.objects.values_list('id', 'unique_link_token'))
+        self.assertEqual(rows[self.users[0].id], self.tokens[self.users[0].id])  # the mocked batch
+        for user in self.users[2:4]:
+            self.assertNotEqual(rows[user.id], self.tokens[user.id])
+        self.assertEqual(rows[self.users[4].id], self.tokens[self.users[4].id])
+        codes = list(Form.objects.filter(id__in=[self.users[2].id, self.users[3].id]).values_list('referral_code', 'qr_code_image'))
+        self.assertEqual(codes, [('ANNA005', ''), ('ANNA006', '')])
+
+    def test_rotated_codes_are_never_reissued(self):
+        users = [make_user(n, full_name='John Doe') for n in range(10, 13)]
+        old = [user.referral_code for user in users]
+        run_rotation(create_rotation([user.id for user in users], links=False, codes=True), batch_size=1)
+        new = list(Form.objects.filter(id__in=[user.id for user in users]).order_by('id')
+                   .values_list('referral_code', flat=True))
+        self.assertEqual(old, ['JOHN000', 'JOHN001', 'JOHN002'])
+        self.assertEqual(new, ['JOHN003', 'JOHN004', 'JOHN005'])
+        self.assertEqual(make_user(13, full_name='John Doe').referral_code, 'JOHN006')
+
+    def test_qr_queue(self):
+        Form.objects.filter(id=self.users[0].id).update(qr_code_image=None)
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            self.assertEqual(render_pending_qr_codes(), 1)
+            self.assertEqual(render_pending_qr_codes(), 0)
+        self.assertTrue(Form.objects.get(id=self.users[0].id).qr_code_image.name.startswith('qr_codes/'))
+
+    def test_api_runs_small_jobs_inline_and_queues_large_ones(self):
+        staff = staff_client()
+        response = staff.post('/api/links/rotate/', {
+            'uuids': [str(self.users[0].uuid), str(uuid.uuid4())],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['data']['status'], 'done')
+        self.assertEqual(len(response.json()['data']['not_found']), 1)
+        self.assertNotEqual(Form.objects.get(id=self.users[0].id).unique_link_token, self.tokens[self.users[0].id])
+
+        response = staff.post('/api/links/rotate/', {'all': True, 'links': False, 'codes': True},
+                              format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['data']['id']
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            call_command('rotate_links', '--pending', stdout=out)
+        self.assertIn('Rendered 5 QR codes', out.getvalue())
+        status_data = staff.get(f'/api/links/rotate/{job_id}/').json()['data']
+        self.assertEqual((status_data['status'], status_data['processed']), ('done', 5))
+        self.assertEqual(staff.post('/api/links/rotate/', {'all': True, 'links': False},
+                                     format='json').status_code, 400)
+
+    def test_anonymous_bulk_writes_refused(self):
+        client = APIClient()
+        for url, body in (('/api/links/rotate/', {'all': True}),
+                          ('/api/links/expiry/', {'uuids': [str(self.users[0].uuid)], 'ttl_seconds': 5})):
+            self.assertIn(client.post(url, body, format='json').status_code, (401, 403), url)
+        self.assertEqual(LinkRotationJob.objects.count(), 0)
+        self.assertEqual(dict(Form.objects.values_list('id', 'unique_link_token')), self.tokens)
+        self.assertFalse(Form.objects.filter(link_expires_at__isnull=False).exists())
+
+
+class AddressRegionTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user(1)
+
+    def add(self, city, state='Kerala', country='India', pin='682 001'):
+        # A distinct house per call: one user cannot hold the same address twice
+        return Address.objects.create(
+            user=self.user, house_name=f'H{Address.objects.count()}', street_name='S',
+            country=country, state=state, pin=pin, city=city,
+        )
+
+    def counts(self, level, **filters):
+        return {
+            tuple(row[name] for name in ('country', 'state', 'city') if name in row): row['addresses']
+            for row in region_counts(level, **filters)
+        }
+
+    def test_counts_follow_create_update_delete(self):
+        kochi = self.add('Kochi')
+        self.add(' KOCHI ')
+        pune = self.add('Pune', state='Maharashtra', pin='411001')
+        self.assertEqual(self.counts('city'), {
+            ('India', 'Kerala', 'Kochi'): 2, ('India', 'Maharashtra', 'Pune'): 1,
+        })
+        self.assertEqual(self.counts('country'), {('India',): 3})
+
+        pune.city, pune.state = 'Kochi', 'kerala'
+        pune.save()
+        kochi.delete()
+        self.assertEqual(self.counts('city'), {('India', 'Kerala', 'Kochi'): 2})
+        self.assertEqual(self.counts('state', country='INDIA'), {('India', 'Kerala'): 2})
+
+        # A deferred instance reads its stored region before changing it
+        Address.objects.for_listing().get(id=pune.id).delete()
+        self.assertEqual(self.counts('country'), {('India',): 1})
+
+        # Deleting the user cascades to its addresses without Address.delete()
+        self.user.delete()
+        self.assertEqual(self.counts('country'), {})
+        self.assertEqual(self.client.get('/api/addresses/regions/').json()['data'], [])
+
+    def test_rebuild_matches_incremental_counts(self):
+        for city in ('Kochi', 'kochi', 'Thrissur'):
+            self.add(city)
+        Address.objects.bulk_create([
+            Address(user=self.user, house_name='H', street_name='S', country='India', state='Kerala', pin='1', city='Kochi'),
+        ])
+        self.assertEqual(rebuild_regions(), 4)
+        self.assertEqual(self.counts('city'), {('India', 'Kerala', 'Kochi'): 3, ('India', 'Kerala', 'Thrissur'): 1})
+        self.assertEqual(Address.objects.in_place(city='KOCHI').count(), 3)
+
+    def test_search_is_a_prefix_match_on_indexes(self):
+        self.add('Kochi')
+        self.add('Kozhikode', pin='673001')
+        self.add('Pune', state='Maharashtra', pin='411001')
+        body = self.client.get('/api/addresses/?search=ko').json()
+        self.assertEqual(sorted(row['city'] for row in body['data']), ['Kochi', 'Kozhikode'])
+        self.assertEqual(self.client.get('/api/addresses/?search=4110').json()['data'][0]['city'], 'Pune')
+        self.assertEqual(self.client.get('/api/addresses/?search=maha').json()['pagination']['total'], 1)
+        self.assertEqual(self.client.get('/api/addresses/?state=MAHARASHTRA&city=pune').json()['pagination']['total'], 1)
+
+        # The paginated page query (LIMIT) walks the key indexes, not the table
+        sql, params = Address.objects.search('ko').order_by('-id')[:10].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertNotRegex(plan, FULL_SCAN_RE)
+
+    def test_regions_endpoint(self):
+        self.add('Kochi')
+        response = self.client.get('/api/addresses/regions/?level=state&country=india')
+        self.assertEqual(response.json()['data'], [{'country': 'India', 'state': 'Kerala', 'addresses': 1}])
+        self.assertEqual(self.client.get('/api/addresses/regions/?level=planet').status_code, 400)
+
+
+class AddressImportTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user(1)
+        self.other = make_user(2)
+
+    def row(self, user=None, **values):
+        return {
+            'user_uuid': str((user or self.owner).uuid), 'house_name': 'Rose Villa', 'street_name': 'MG Road',
+            'country': 'India', 'state': 'Kerala', 'pin': '682001', 'city': 'Kochi', **values,
+        }
+
+    def post(self, body, content_type, query=''):
+        response = staff_client().post(f'/api/addresses/import/{query}', body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_upserts_on_the_normalized_address_key(self):
+        fields = {name: value for name, value in self.row().items() if name != 'user_uuid'}
+        existing = Address.objects.create(user=self.owner, **{**fields, 'city': 'kochi'})
+        rows = [
+            self.row(),                                      # same address, new spelling: update
+            self.row(house_name='Lotus', pin=682002),        # new
+            self.row(house_name=' LOTUS ', pin='682002'),    # same key as the previous row: it wins
+            self.row(user=self.other),                       # other owner: new
+            self.row(user_uuid=str(uuid.uuid4())),
+            self.row(pin=''),
+        ]
+        with self.assertNumQueries(17):  # per chunk, whatever its size
+            results = list(import_addresses(rows))
+
+        self.assertEqual([result['status'] for result in results],
+                         ['updated', 'duplicate', 'created', 'created', 'error', 'error'])
+        self.assertEqual(results[0]['id'], existing.id)
+        self.assertEqual(results[1]['id'], results[2]['id'])
+        self.assertEqual(results[4]['errors'], {'user_uuid': 'User not found.'})
+        self.assertIn('pin', results[5]['errors'])
+        self.assertEqual(Address.objects.get(id=existing.id).city, 'Kochi')
+        self.assertEqual(Address.objects.get(id=results[2]['id']).house_name, 'LOTUS')
+        self.assertEqual(Address.objects.count(), 3)
+
+        # Side effects bulk_create skips: change log and region counts
+        logged = set(ChangeLogEntry.objects.filter(kind='address').values_list('owner_id', 'object_id'))
+        self.assertEqual(logged, set(Address.objects.values_list('user_id', 'id')))
+        self.assertEqual(region_counts('city'), [{'country': 'India', 'state': 'Kerala', 'city': 'kochi', 'addresses': 3}])  # first spelling
+
+    def test_endpoint_streams_results_for_csv_and_json_lines(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=['id', *self.row()])
+        writer.writeheader()
+        writer.writerow({'id': 99, **self.row()})
+        writer.writerow(self.row(city=''))
+        results = self.post(out.getvalue(), 'text/csv')
+        self.assertEqual([(result['row'], result['status']) for result in results], [(1, 'created'), (2, 'error')])
+
+        body = '\n'.join([json.dumps(self.row()), 'not json', json.dumps(self.row(house_name='B'))])
+        results = self.post(body, 'application/x-ndjson', '?type=jsonl')
+        self.assertEqual([result['status'] for result in results], ['updated', 'error', 'created'])
+
+        response = staff_client().post('/api/addresses/import/', 'user_uuid,city\n', content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ADDRESS_IMPORT_CHUNK_SIZE=2)
+    def test_bad_lines_after_the_header_are_row_errors(self):
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=list(self.row()))
+        writer.writeheader()
+        for house in ('A', 'B', 'C', 'D', 'E'):
+            writer.writerow(self.row(house_name=house))
+        lines = out.getvalue().encode().splitlines(keepends=True)
+        lines[3] = lines[3].replace(b'C', b'\xffC')  # invalid UTF-8 in the second chunk
+        lines[4] = lines[4].replace(b'D', b'D\rD')   # a bare CR: csv.Error
+        results = self.post(b''.join(lines), 'text/csv')
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'error', 'error', 'created'])
+        self.assertEqual(results[2]['errors'], {'row': 'Not valid UTF-8'})
+        self.assertEqual(sorted(Address.objects.values_list('house_name', flat=True)), ['A', 'B', 'E'])
+
+        body = b'\n'.join([json.dumps(self.row(house_name='F')).encode(), b'{"house_name": "\xff"}',
+                           json.dumps(self.row(house_name='G')).encode()])
+        results = self.post(body, 'application/x-ndjson', '?type=jsonl')
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created'])
+
+    def test_anonymous_import_refused(self):
+        body = json.dumps(self.row())
+        response = APIClient().post('/api/addresses/import/?type=jsonl', body, content_type='application/x-ndjson')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Address.objects.exists())
+
+    def test_command_and_serializer_reject_duplicates(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as fh:
+            fh.write(json.dumps(self.row()) + '\n')
+        out = io.StringIO()
+        call_command('import_addresses', fh.name, stdout=out, stderr=io.StringIO())
+        self.assertEqual(json.loads(out.getvalue())['status'], 'created')
+
+        response = self.client.post('/api/addresses/', {**self.row(), 'city': 'KOCHI'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FlakySink:
+    """Test sink: collects messages, or fails while `down` is set."""
+
+    def __init__(self):
+        self.messages = []
+        self.down = False
+
+    def publish(self, messages):
+        if self.down:
+            raise ConnectionError('sink unavailable')
+        self.messages += messages
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=0, OUTBOX_SINKS={
+    'crm': {'BACKEND': 'form.tests.FlakySink'},
+    'warehouse': {'BACKEND': 'form.outbox.FileSink'},
+})
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name) / 'events.jsonl'
+        outbox._sinks.clear()
+        self.addCleanup(outbox._sinks.clear)
+        self.crm = outbox.get_sink('crm')
+        outbox._sinks['warehouse'] = outbox.FileSink(self.path)
+
+    def tearDown(self):
+        click_buffer.events = []
+
+    def events(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('topic', 'aggregate_id', 'event'))
+
+    def test_events_commit_with_the_change(self):
+        user = make_user(1)
+        address = Address.objects.create(user=user, house_name='H', street_name='S', country='India',
+                                         state='Kerala', pin='682001', city='Kochi')
+        address.city = 'Ernakulam'
+        address.save()
+        user.increment_link_clicks()  # not in the payload: no event
+        address_id = address.id
+        address.delete()
+        self.assertEqual(self.events(), [
+            ('user', user.id, 'created'), ('address', address_id, 'created'),
+            ('address', address_id, 'updated'), ('address', address_id, 'deleted'),
+        ])
+        event = OutboxEvent.objects.get(event='updated')
+        self.assertEqual((event.payload['city'], event.payload['user_id']), ('Ernakulam', user.id))
+        self.assertEqual(OutboxEvent.objects.get(topic='user').payload['uuid'], str(user.uuid))
+        self.assertNotIn('password', OutboxEvent.objects.get(topic='user').payload)
+
+        # A rolled-back change leaves no event behind
+        with self.assertRaises(ValueError), transaction.atomic():
+            make_user(2)
+            raise ValueError
+        self.assertEqual(len(self.events()), 4)
+
+    def test_user_delete_publishes_its_cascaded_rows(self):
+        referrer = make_user(1)
+        user = make_user(2, referred_by=referrer)
+        address = Address.objects.create(user=user, house_name='H', street_name='S', country='India',
+                                         state='Kerala', pin='682001', city='Kochi')
+        seller = SellerDetailsForm.objects.create(user=user, store_name='Store', inventory_estimate='<1000')
+        other = make_user(3, referred_by=referrer)
+        other_address = Address.objects.create(user=other, house_name='H', street_name='S', country='India',
+                                               state='Kerala', pin='682001', city='Kochi')
+        OutboxEvent.objects.all().delete()
+        expected = [
+            ('address', address.id, 'deleted'), ('seller', seller.id, 'deleted'), ('user', user.id, 'deleted'),
+            ('address', other_address.id, 'deleted'), ('user', other.id, 'deleted'),
+        ]
+        user_ids = (user.id, other.id)
+
+        user.delete()
+        Form.objects.filter(id=other.id).delete()  # a queryset delete cascades the same way
+        self.assertEqual(sorted(self.events()), sorted(expected))
+        # The referrer's feed drops both; the deleted owners' feeds went with them
+        self.assertEqual(set(ChangeLogEntry.objects.values_list('owner_id', 'kind', 'object_id', 'deleted')),
+                         {(referrer.id, 'referral', user_id, True) for user_id in user_ids})
+
+    def test_deleting_a_referrer_with_its_referral(self):
+        referrer = make_user(1)
+        referral = make_user(2, referred_by=referrer)
+        ids = [referrer.id, referral.id]
+        Form.objects.filter(id__in=ids).delete()  # one batch, as the admin's "delete selected" does
+        self.assertFalse(ChangeLogEntry.objects.exists())
+        self.assertEqual(set(OutboxEvent.objects.filter(event='deleted').values_list('aggregate_id', flat=True)),
+                         set(ids))
+
+        referrer = make_user(3)
+        referral = make_user(4, referred_by=referrer)
+        referral.delete()  # alone: the referrer keeps a tombstone
+        self.assertEqual(list(ChangeLogEntry.objects.values_list('owner_id', 'deleted')), [(referrer.id, True)])
+
+    def test_relay_is_at_least_once_per_sink(self):
+        users = [make_user(n) for n in range(3)]
+        self.crm.down = True
+        self.assertEqual(outbox.relay_all(batch_size=2), {'crm': 0, 'warehouse': 3})
+        self.assertEqual(outbox.pending('crm'), 3)
+
+        self.crm.down = False
+        self.assertEqual(outbox.relay_all(batch_size=2), {'crm': 3, 'warehouse': 0})
+        self.assertEqual([message['key'] for message in self.crm.messages], [f'user:{user.id}' for user in users])
+        lines = [json.loads(line) for line in self.path.read_text().splitlines()]
+        self.assertEqual([line['id'] for line in lines], [message['id'] for message in self.crm.messages])
+
+        # Crash after publishing, before the offset moved: the batch is sent again
+        OutboxOffset.objects.filter(sink='crm').update(last_id=0)
+        outbox.relay('crm')
+        self.assertEqual(len(self.crm.messages), 6)
+
+        self.assertEqual(outbox.purge(days=0, now=timezone.now() + datetime.timedelta(seconds=1)), 3)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_bulk_writers_and_snapshot_publish(self):
+        user = make_user(1)
+        Form.objects.filter(id=user.id).update(link_expires_at=timezone.now() - datetime.timedelta(hours=1))
+        sweep_expired_links()
+        self.assertEqual(OutboxEvent.objects.filter(event='updated').get().payload['is_link_active'], False)
+
+        category = Category.objects.create(name='Cards')
+        response = self.client.post('/api/sellers/', {
+            'user_uuid': str(user.uuid), 'store_name': 'Store', 'inventory_estimate': '<1000',
+            'category_ids': [category.id],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        seller_event = OutboxEvent.objects.filter(topic='seller').last()
+        self.assertEqual(seller_event.payload['categories'], [{'id': category.id, 'name': 'Cards'}])
+
+        OutboxEvent.objects.all().delete()
+        out = io.StringIO()
+        call_command('relay_outbox', snapshot=True, no_purge=True, stdout=out)
+        self.assertEqual(sorted(topic for topic, _, _ in self.events()), ['seller', 'user'])
+        self.assertEqual(len(self.crm.messages), 2)
+
+
+class LiveDashboardTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name, LIVE_QUEUE_SIZE=3)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.referrer = make_user(1)
+        self.app = live.with_live_routes(None)  # only the live paths are exercised
+
+    def tearDown(self):
+        click_buffer.events = []
+
+    def signup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(f'/api/refer/{self.referrer.referral_code}/', {
+                'full_name': 'Newcomer', 'last_name': 'Test', 'email': 'new@example.com',
+                'phone_number': '8000000001', 'password': 'secret-pass', 'reenter_password': 'secret-pass',
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def click(self):
+        click_buffer.events = []
+        record_click(self.referrer.id, APIRequestFactory().get('/'))
+        record_click(self.referrer.id, APIRequestFactory().get('/'))
+        click_buffer.flush()
+
+    def connect(self, scope, steps):
+        """Run the app for `scope`; `steps(sent)` drives it, then the client disconnects."""
+        async def scenario():
+            inbox, sent = asyncio.Queue(), asyncio.Queue()
+            if scope['type'] == 'websocket':
+                inbox.put_nowait({'type': 'websocket.connect'})
+            task = asyncio.ensure_future(self.app(scope, inbox.get, sent.put))
+            result = await steps(sent)
+            inbox.put_nowait({'type': 'http.disconnect' if scope['type'] == 'http' else 'websocket.disconnect'})
+            await asyncio.wait_for(task, 1)
+            return result
+        return async_to_sync(scenario)()
+
+    def test_sse_streams_referrals_and_clicks(self):
+        async def steps(sent):
+            start = await asyncio.wait_for(sent.get(), 1)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+            await sent.get()  # retry: hint
+            self.assertEqual(pubsub.get_broker().count, 1)
+            await sync_to_async(self.signup)()
+            await sync_to_async(self.click)()
+            return [await asyncio.wait_for(sent.get(), 1) for _ in range(2)]
+
+        frames = self.connect({'type': 'http', 'method': 'GET', 'path': f'/api/dashboard/{self.referrer.uuid}/live/'}, steps)
+        events = [json.loads(frame['body'].removeprefix(b'data: ')) for frame in frames]
+        self.assertEqual(events[0]['type'], 'referral')
+        self.assertEqual(events[0]['referral']['email'], 'new@example.com')
+        self.assertEqual(events[1], {'type': 'clicks', 'count': 2})
+        self.assertEqual(pubsub.get_broker().count, 0)  # unsubscribed on disconnect
+
+    def test_websocket_and_slow_subscribers(self):
+        async def steps(sent):
+            self.assertEqual((await asyncio.wait_for(sent.get(), 1))['type'], 'websocket.accept')
+            for _ in range(5):  # more than LIVE_QUEUE_SIZE before the client reads
+                pubsub.get_broker().publish(live.topic(self.referrer.id), {'type': 'clicks', 'count': 1})
+            return await asyncio.wait_for(sent.get(), 1)
+
+        frame = self.connect({'type': 'websocket', 'path': f'/ws/dashboard/{self.referrer.uuid}/'}, steps)
+        self.assertEqual(json.loads(frame['text']), {'type': 'resync'})
+
+        async def unknown(sent):
+            return await asyncio.wait_for(sent.get(), 1)
+        frame = self.connect({'type': 'websocket', 'path': f'/ws/dashboard/{uuid.uuid4()}/'}, unknown)
+        self.assertEqual(frame, {'type': 'websocket.close', 'code': 4404})
 
-# Create your tests here.
@@ -0,0 +1,222 @@
+"""
+Dense per-user time series for referral growth charts.
+
+Each (user, metric) has one UserSeries row holding a packed array of daily
+counts from its first active day onwards, so a chart is one indexed row read
+and a slice, with no GROUP BY over referrals. The arrays are kept current
+incrementally:
+
+* referrals: FormSerializer.create() calls record_referral(), which bumps the
+  referrer's series once the registration commits;
+* clicks: rollup_clicks() adds each run's daily click counts.
+
+`manage.py rebuild_series` recomputes both from the source tables (after bulk
+loads, or to repair drift).
+
+Weekly (Monday-based) and monthly buckets are summed from the daily array,
+with numpy.add.reduceat when NumPy is installed and a plain loop otherwise.
+"""
+import datetime
+import sys
+from array import array
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; resampling falls back to pure Python
+    numpy = None
+
+from .models import Form, LinkClickRollup, UserSeries
+
+INTERVALS = ('day', 'week', 'month')
+DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}  # range when no start is given
+MAX_DAYS = 3660
+TYPECODE = 'I'  # uint32
+
+
+def unpack(data):
+    counts = array(TYPECODE)
+    counts.frombytes(bytes(data))
+    if sys.byteorder == 'big':
+        counts.byteswap()
+    return counts
+
+
+def pack(counts):
+    if sys.byteorder == 'big':
+        counts = array(TYPECODE, counts)
+        counts.byteswap()
+    return counts.tobytes()
+
+
+def zeros(size):
+    return array(TYPECODE, [0]) * size
+
+
+def merge(start, counts, days):
+    """Add {date: n} into the array starting at `start`, growing it either way."""
+    first, last = min(days), max(days)
+    if not counts:
+        start = first
+    elif first < start:
+        counts = zeros((start - first).days) + counts
+        start = first
+    size = (last - start).days + 1
+    if size > len(counts):
+        counts.extend(zeros(size - len(counts)))
+    for day, n in days.items():
+        counts[(day - start).days] += n
+    return start, counts
+
+
+def add_counts(metric, increments):
+    """Apply {user_id: {date: n}} to the users' `metric` series."""
+    if not increments:
+        return
+    try:
+        _add_counts(metric, increments)
+    except IntegrityError:
+        # A concurrent first increment created one of the series after our
+        # SELECT; the savepoint rolled back, and now every row exists
+        _add_counts(metric, increments)
+
+
+def _add_counts(metric, increments):
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            series.user_id: series
+            for series in UserSeries.objects.select_for_update().filter(metric=metric, user_id__in=increments)
+        }
+        created, updated = [], []
+        for user_id, days in increments.items():
+            series = existing.get(user_id)
+            if series is None:
+                series = UserSeries(user_id=user_id, metric=metric, start=min(days))
+                created.append(series)
+            else:
+                updated.append(series)
+            series.start, counts = merge(series.start, unpack(series.counts), days)
+            series.counts = pack(counts)
+            series.updated_at = now
+        UserSeries.objects.bulk_create(created)
+        UserSeries.objects.bulk_update(updated, ['start', 'counts', 'updated_at'])
+
+
+def record_referral(user):
+    """Count a new referral for user.referred_by once the registration commits."""
+    if user.referred_by_id is None:
+        return
+    increments = {user.referred_by_id: {user.created_at.date(): 1}}
+    # robust: a failed bump is logged, not raised into the finished request;
+    # rebuild_series repairs it
+    transaction.on_commit(lambda: add_counts(UserSeries.REFERRALS, increments), robust=True)
+
+
+def rebuild_series(metric, batch_size=1000):
+    """Recompute every `metric` series from the source table; returns the row count."""
+    if metric == UserSeries.REFERRALS:
+        rows = (
+            Form.objects.filter(referred_by__isnull=False)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('referred_by_id', 'day')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+    else:
+        rows = (
+            LinkClickRollup.objects.filter(granularity=LinkClickRollup.DAY)
+            .values_list('user_id', 'bucket', 'count')
+        )
+
+    per_user = defaultdict(lambda: defaultdict(int))
+    for user_id, day, n in rows:
+        if isinstance(day, datetime.datetime):
+            day = day.date()
+        per_user[user_id][day] += n
+
+    series = []
+    for user_id, days in per_user.items():
+        start, counts = merge(None, zeros(0), days)
+        series.append(UserSeries(user_id=user_id, metric=metric, start=start, counts=pack(counts)))
+    with transaction.atomic():
+        UserSeries.objects.filter(metric=metric).delete()
+        UserSeries.objects.bulk_create(series, batch_size=batch_size)
+    return len(series)
+
+
+# ==================== READING ====================
+
+def period_start(day, interval):
+    if interval == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(start, interval):
+    if interval == 'week':
+        return start + datetime.timedelta(days=7)
+    if interval == 'month':
+        return (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def default_range(interval, today=None):
+    last = today or timezone.now().date()
+    first = period_start(last, interval)
+    for _ in range(DEFAULT_BUCKETS[interval] - 1):
+        first = period_start(first - datetime.timedelta(days=1), interval)
+    return first, last
+
+
+def buckets(first, last, interval):
+    """Period start labels and their offsets (in days from `first`) covering first..last."""
+    labels, offsets = [], []
+    day = first
+    while day <= last:
+        start = period_start(day, interval)
+        labels.append(start)
+        offsets.append((day - first).days)
+        day = next_period(start, interval)
+    return labels, offsets
+
+
+def daily_counts(series, first, last):
+    """Dense daily counts for first..last from a UserSeries (or None)."""
+    size = (last - first).days + 1
+    out = zeros(size)
+    if series is not None:
+        counts = unpack(series.counts)
+        offset = (first - series.start).days
+        lo, hi = max(0, offset), min(len(counts), offset + size)
+        if lo < hi:
+            out[lo - offset:hi - offset] = counts[lo:hi]
+    return out
+
+
+def resample(counts, offsets):
+    """Sum the daily counts between consecutive bucket offsets."""
+    if len(offsets) == len(counts):
+        return counts.tolist()
+    if numpy is not None:
+        values = numpy.frombuffer(counts, dtype=numpy.uint32).astype(numpy.int64)
+        return numpy.add.reduceat(values, offsets).tolist()
+    bounds = offsets + [len(counts)]
+    return [sum(counts[lo:hi]) for lo, hi in zip(bounds, bounds[1:])]
+
+
+def get_series(user, metrics, interval, first, last):
+    """(bucket labels, {metric: counts}) for first..last, in one query."""
+    rows = {series.metric: series for series in UserSeries.objects.filter(user=user, metric__in=metrics)}
+    labels, offsets = buckets(first, last, interval)
+    return labels, {
+        metric: resample(daily_counts(rows.get(metric), first, last), offsets)
+        for metric in metrics
+    }
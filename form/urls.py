@@ -6,18 +6,35 @@ urlpatterns = [
     path('register/', views.FormRegisterView.as_view(), name='form-register'),
     path('users/', views.FormListView.as_view(), name='form-list'),
     path('addresses/', views.AddressListCreateView.as_view(), name='address-list-create'),
+    path('addresses/regions/', views.address_regions, name='address-regions'),
+    path('addresses/import/', views.AddressImportView.as_view(), name='address-import'),
     path('addresses/<int:pk>/', views.AddressDetailView.as_view(), name='address-detail'),
     # path('user/<uuid:user_uuid>/', views.UserDetailByUUIDView.as_view(), name='user-detail'),  # GET
     path('user/<uuid:user_uuid>/', views.UserFullDetailView.as_view(), name='user-summary'),
+    path('users/batch/', views.UserBatchDetailView.as_view(), name='user-batch-detail'),
 
     # Unique Links
     path('user/<str:token>/', views.user_by_unique_link, name='user-by-unique-link'),
     path('regenerate-link/<uuid:user_uuid>/', views.regenerate_unique_link, name='regenerate-unique-link'),
+    path('links/expiry/', views.bulk_link_expiry, name='bulk-link-expiry'),
+    path('links/rotate/', views.rotate_links, name='rotate-links'),
+    path('links/rotate/<int:job_id>/', views.rotation_status, name='rotation-status'),
     path('refer/<str:referral_code>/', views.referral_registration, name='referral-registration'),
 
     # Referral Dashboard
     path('dashboard/<uuid:user_uuid>/', views.user_referral_dashboard, name='user-referral-dashboard'),
     path('dashboard/<uuid:user_uuid>/referrals/', views.UserReferralListView.as_view(), name='user-referral-list'),
     path('dashboard/<uuid:user_uuid>/analytics/', views.referral_analytics, name='referral-analytics'),
+    path('dashboard/<uuid:user_uuid>/timeseries/', views.referral_timeseries, name='referral-timeseries'),
+    path('dashboard/<uuid:user_uuid>/sync/', views.user_sync, name='user-sync'),
+
     path('dashboard/<uuid:user_uuid>/search/', views.search_referred_users, name='search-referred-users'),
+
+    # Leaderboards
+    path('leaderboard/', views.referral_leaderboard, name='referral-leaderboard'),
+    path('leaderboard/<uuid:user_uuid>/', views.user_leaderboard_rank, name='user-leaderboard-rank'),
+
+    # Exports
+    path('export/referrals/<uuid:user_uuid>/', views.export_data, {'dataset': 'referrals'}, name='export-referrals'),
+    path('export/<str:dataset>/', views.export_data, name='export-data'),
 ]
\ No newline at end of file
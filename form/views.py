@@ -1,14 +1,44 @@
+import csv
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta, timezone as dt_timezone
+from operator import itemgetter
+
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 from django.db import models
-from .models import Form, Address
-from .serializers import FormSerializer, AddressSerializer
+from django.db.models import Count, F, Window
+from django.db.models.functions import Greatest
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from .models import Form, Address, AddressQuerySet, AddressRegionCount, LinkRotationJob, UserSeries
+from .clicks import record_click, click_stats
+from .timeseries import INTERVALS, MAX_DAYS, default_range, get_series
+from .leaderboard import WINDOWS, get_leaderboard
+from .sync import CursorExpired, sync_payload
+from .imports import ImportFormatError, import_addresses, read_rows
+from .regions import LEVELS as REGION_LEVELS, region_counts
+from .links import create_rotation, run_rotation, set_link_expiry, usable_links
+from .exports import stream_export, EXPORT_DATASETS, EXPORT_FORMATS
+from .serializers import (
+    FormSerializer, AddressSerializer, FastFormSerializer, FastAddressSerializer, requested_fieldset, retry_when_locked,
+)
 from rest_framework.views import APIView
+from cards.conditional import conditional
+from cards.idempotency import idempotent
+from cards.throttling import IPThrottle, TokenThrottle, ReferralCodeThrottle, UserUUIDThrottle
+from cards.renderers import (
+    FAST_RENDERER_CLASSES, STREAMING_RENDERER_CLASSES, json_lines_response, wants_json_lines,
+)
 
 
 # ✅ Enhanced Custom Pagination Class
@@ -38,11 +68,56 @@ class CustomPagination(PageNumberPagination):
         })
 
 
+def serialize_referral_row(row, referrer_name):
+    """Referral list entry built from a Form.objects.referral_rows() dict."""
+    return {
+        "uuid": row['uuid'],
+        "full_name": row['full_name'],
+        "last_name": row['last_name'],
+        "email": row['email'],
+        "phone_number": row['phone_number'],
+        "gender": row['gender'],
+        "referred_date": row['created_at'],
+        "referrer_name": referrer_name
+    }
+
+
+# Recent referrals shown on a user's full detail
+RECENT_REFERRALS = 5
+RECENT_REFERRAL_FIELDS = ('uuid', 'full_name', 'email', 'created_at')
+BATCH_LOOKUP_MAX = 500
+
+
+def serialize_user_detail(user, total_referrals, recent_referrals, address_data):
+    """Full user detail payload shared by the single and batch lookups."""
+    return {
+        "uuid": str(user.uuid),
+        "full_name": user.full_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "phone_number": user.phone_number,
+        "gender": user.gender,
+        "created_at": user.created_at,
+        "referral": {
+            "referral_code": user.referral_code,
+            "referral_link": user.get_referral_link(),
+            "unique_link": user.get_unique_link(),
+            "qr_code_url": f"http://127.0.0.1:8000/media/qr_codes/{user.referral_code}_qr.png",
+            "total_referrals": total_referrals,
+            "recent_referrals": recent_referrals
+        },
+        "addresses": address_data,
+        "total_addresses": len(address_data)
+    }
+
+
 # ✅ User Registration with Referral Code Support
+@method_decorator(idempotent, name='dispatch')
 class FormRegisterView(generics.CreateAPIView):
     """
     Register new user with optional referral.
     Accepts: referred_by_code (optional) in the payload.
+    Retries carrying the same Idempotency-Key header get the first response.
     """
     queryset = Form.objects.all()
     serializer_class = FormSerializer
@@ -50,7 +125,8 @@ class FormRegisterView(generics.CreateAPIView):
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
+        # The uniqueness checks read form_form, which concurrent signups lock on SQLite
+        retry_when_locked(lambda: serializer.is_valid(raise_exception=True))
         self.perform_create(serializer)
 
         return Response({
@@ -69,35 +145,43 @@ class FormListView(generics.ListAPIView):
     """
     Paginated list of registered users.
     """
-    queryset = Form.objects.all().order_by('-created_at')
-    serializer_class = FormSerializer
+    serializer_class = FastFormSerializer
     pagination_class = CustomPagination
     permission_classes = [AllowAny]
+    renderer_classes = STREAMING_RENDERER_CLASSES
+
+    def get_queryset(self):
+        # Only the columns the requested ?fields= need
+        columns = FastFormSerializer.columns_for(requested_fieldset(self.request))
+        return Form.objects.order_by('-created_at').values_list(*columns)
+
+    def list(self, request, *args, **kwargs):
+        # ?stream=jsonl streams every user instead of one page
+        if wants_json_lines(request):
+            serializer = self.get_serializer()
+            rows = self.get_queryset().iterator(chunk_size=2000)
+            return json_lines_response(map(serializer.to_representation, rows))
+        return super().list(request, *args, **kwargs)
 
 
 # ✅ Access user via unique link
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@throttle_classes([IPThrottle, TokenThrottle])
 def user_by_unique_link(request, token):
     """
     Access user profile via unique link token.
     Increments click count and returns user data.
     """
     try:
-        user = Form.objects.get(unique_link_token=token, is_link_active=True)
-        
-        # Check if link is expired
-        if user.is_link_expired():
-            return Response({
-                "code": 410,
-                "message": "This link has expired"
-            }, status=status.HTTP_410_GONE)
+        # Expired links are filtered here and switched off by the sweep_links job
+        user = usable_links().get(unique_link_token=token)
+        # Built first: a bad ?fields= is refused before the click counts
+        serializer = FormSerializer(user, fieldset=requested_fieldset(request))
         
         # Increment click count
         user.increment_link_clicks()
-        
-        # Serialize user data
-        serializer = FormSerializer(user)
+        record_click(user.id, request)
         
         return Response({
             "code": 200,
@@ -109,7 +193,7 @@ def user_by_unique_link(request, token):
     except Form.DoesNotExist:
         return Response({
             "code": 404,
-            "message": "Invalid or inactive link"
+            "message": "Invalid, inactive or expired link"
         }, status=status.HTTP_404_NOT_FOUND)
 
 
@@ -142,17 +226,162 @@ def regenerate_unique_link(request, user_uuid):
         }, status=status.HTTP_404_NOT_FOUND)
 
 
+def bulk_uuids(request):
+    """(distinct UUIDs from {"uuids": [...]}, None) or (None, 400 response)."""
+    uuids = request.data.get('uuids') if isinstance(request.data, dict) else None
+    if not isinstance(uuids, list) or not 0 < len(uuids) <= settings.LINK_EXPIRY_MAX_USERS:
+        return None, Response({
+            "code": 400,
+            "message": f"uuids must be a list of 1 to {settings.LINK_EXPIRY_MAX_USERS} UUIDs"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        return list(dict.fromkeys(uuid.UUID(str(value)) for value in uuids)), None
+    except ValueError:
+        return None, Response({
+            "code": 400,
+            "message": "uuids contains an invalid UUID"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+# ✅ Bulk link expiry (TTL) assignment
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_link_expiry(request):
+    """
+    Set the unique-link expiry of many users at once.
+    Body: {"uuids": [...], "expires_at": ISO datetime or null} or {"uuids": [...], "ttl_seconds": N}.
+    """
+    wanted, error = bulk_uuids(request)
+    if error:
+        return error
+
+    if 'ttl_seconds' in request.data:
+        ttl = request.data['ttl_seconds']
+        if not isinstance(ttl, int) or isinstance(ttl, bool) or not 0 < ttl <= settings.LINK_MAX_TTL_SECONDS:
+            return Response({
+                "code": 400,
+                "message": f"ttl_seconds must be a positive integer of at most {settings.LINK_MAX_TTL_SECONDS}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+    elif 'expires_at' in request.data:
+        raw = request.data['expires_at']
+        try:
+            expires_at = parse_datetime(raw) if isinstance(raw, str) else None
+            if expires_at is not None:
+                if timezone.is_naive(expires_at):
+                    expires_at = timezone.make_aware(expires_at)
+                expires_at = expires_at.astimezone(dt_timezone.utc)  # as stored
+        except (ValueError, OverflowError):  # impossible (February 30th) or past year 9999 in UTC
+            expires_at = None
+        if raw is not None and expires_at is None:
+            return Response({
+                "code": 400,
+                "message": "expires_at must be an ISO 8601 datetime or null"
+            }, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        return Response({
+            "code": 400,
+            "message": "Provide expires_at or ttl_seconds"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    missing = set_link_expiry(wanted, expires_at)
+    return Response({
+        "code": 200,
+        "message": "Link expiry updated successfully",
+        "data": {
+            "updated": len(wanted) - len(missing),
+            "expires_at": expires_at,
+            "not_found": [str(value) for value in missing],
+        }
+    })
+
+
+def serialize_rotation_job(job):
+    return {
+        "id": job.id,
+        "status": job.status,
+        "rotate_links": job.rotate_links,
+        "rotate_codes": job.rotate_codes,
+        "total": job.total,
+        "processed": job.processed,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+# ✅ Bulk unique link / referral code rotation
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def rotate_links(request):
+    """
+    Rotate unique links and/or referral codes for many users.
+    Body: {"uuids": [...]} or {"all": true}, plus "links" (default true) and "codes" (default false).
+    Up to LINK_ROTATION_INLINE_MAX users are rotated in the request; larger jobs are
+    queued (202) for `manage.py rotate_links --pending`. QR images are re-rendered by that command.
+    """
+    data = request.data if isinstance(request.data, dict) else {}
+    links, codes = data.get('links', True), data.get('codes', False)
+    if not isinstance(links, bool) or not isinstance(codes, bool) or not (links or codes):
+        return Response({
+            "code": 400,
+            "message": "links and codes must be booleans and at least one must be true"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    missing = []
+    if data.get('all') is True:
+        job = create_rotation(None, links, codes)
+    else:
+        wanted, error = bulk_uuids(request)
+        if error:
+            return error
+        found = dict(Form.objects.filter(uuid__in=wanted).values_list('uuid', 'id'))
+        missing = [str(value) for value in wanted if value not in found]
+        job = create_rotation(list(found.values()), links, codes)
+
+    if job.user_ids is not None and job.total <= settings.LINK_ROTATION_INLINE_MAX:
+        run_rotation(job)
+        return Response({
+            "code": 200,
+            "message": "Links rotated successfully",
+            "data": {**serialize_rotation_job(job), "not_found": missing}
+        })
+    return Response({
+        "code": 202,
+        "message": "Rotation queued",
+        "data": {**serialize_rotation_job(job), "not_found": missing}
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def rotation_status(request, job_id):
+    """Progress of a rotation job."""
+    job = LinkRotationJob.objects.filter(id=job_id).defer('user_ids').first()
+    if job is None:
+        return Response({
+            "code": 404,
+            "message": "Rotation job not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        "code": 200,
+        "message": "Rotation job fetched successfully",
+        "data": serialize_rotation_job(job)
+    })
+
+
 # ✅ Referral registration via link with pagination helper
+@idempotent
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
+@throttle_classes([IPThrottle, ReferralCodeThrottle])
 def referral_registration(request, referral_code):
     """
     Handle referral registration via referral link.
     GET: Show referrer info
-    POST: Register new user with referral
+    POST: Register new user with referral (honours Idempotency-Key)
     """
     try:
-        referrer = Form.objects.get(referral_code=referral_code)
+        referrer = Form.objects.only('full_name', 'referral_code').get(referral_code=referral_code)
         
         if request.method == 'GET':
             return Response({
@@ -171,7 +400,7 @@ def referral_registration(request, referral_code):
             data['referred_by_code'] = referral_code
             
             serializer = FormSerializer(data=data)
-            if serializer.is_valid():
+            if retry_when_locked(serializer.is_valid):
                 serializer.save()
                 return Response({
                     "code": 201,
@@ -201,24 +430,15 @@ def user_referral_dashboard(request, user_uuid):
     Shows User A's referral statistics and recent referrals with pagination link.
     """
     try:
-        user = Form.objects.get(uuid=user_uuid)
+        user = Form.objects.for_listing().get(uuid=user_uuid)
         
         # Get recent referred users (first 5)
-        referred_users = user.referrals.all().order_by('-created_at')[:5]
+        referred_users = user.referrals.referral_rows().order_by('-created_at')[:5]
         
         # Create referral details for recent users
-        recent_referral_details = []
-        for referred_user in referred_users:
-            recent_referral_details.append({
-                "uuid": referred_user.uuid,
-                "full_name": referred_user.full_name,
-                "last_name": referred_user.last_name,
-                "email": referred_user.email,
-                "phone_number": referred_user.phone_number,
-                "gender": referred_user.gender,
-                "referred_date": referred_user.created_at,
-                "referrer_name": user.full_name
-            })
+        recent_referral_details = [
+            serialize_referral_row(row, user.full_name) for row in referred_users
+        ]
         
         # Calculate stats
         from datetime import datetime, timedelta
@@ -269,12 +489,17 @@ class UserReferralListView(generics.ListAPIView):
     """
     pagination_class = CustomPagination
     permission_classes = [AllowAny]
+    renderer_classes = FAST_RENDERER_CLASSES
     
+    def get_referrer(self):
+        if not hasattr(self, '_referrer'):
+            self._referrer = Form.objects.for_listing().get(uuid=self.kwargs.get('user_uuid'))
+        return self._referrer
+
     def get_queryset(self):
-        user_uuid = self.kwargs.get('user_uuid')
         try:
-            user = Form.objects.get(uuid=user_uuid)
-            queryset = user.referrals.all()
+            user = self.get_referrer()
+            queryset = user.referrals.referral_rows()
             
             # Add search functionality
             search_query = self.request.query_params.get('search', None)
@@ -300,36 +525,25 @@ class UserReferralListView(generics.ListAPIView):
     def get_serializer(self, *args, **kwargs):
         # Custom serializer for referral list
         class ReferralListSerializer:
-            def __init__(self, instance, many=False):
+            def __init__(self, instance, many=False, referrer_name=None):
                 self.instance = instance
                 self.many = many
+                self.referrer_name = referrer_name
             
             @property
             def data(self):
                 if self.many:
-                    return [self._serialize_user(user) for user in self.instance]
+                    return [serialize_referral_row(row, self.referrer_name) for row in self.instance]
                 else:
-                    return self._serialize_user(self.instance)
-            
-            def _serialize_user(self, user):
-                return {
-                    "uuid": user.uuid,
-                    "full_name": user.full_name,
-                    "last_name": user.last_name,
-                    "email": user.email,
-                    "phone_number": user.phone_number,
-                    "gender": user.gender,
-                    "referred_date": user.created_at,
-                    "referrer_name": user.referred_by.full_name if user.referred_by else None
-                }
+                    return serialize_referral_row(self.instance, self.referrer_name)
         
+        # Every row is a referral of the same user, so the name is shared
+        kwargs.setdefault('referrer_name', self.get_referrer().full_name)
         return ReferralListSerializer(*args, **kwargs)
     
     def list(self, request, *args, **kwargs):
-        user_uuid = self.kwargs.get('user_uuid')
-        
         try:
-            user = Form.objects.get(uuid=user_uuid)
+            user = self.get_referrer()
         except Form.DoesNotExist:
             return Response({
                 "code": 404,
@@ -385,7 +599,7 @@ def referral_analytics(request, user_uuid):
     Advanced analytics for referral performance with pagination support.
     """
     try:
-        user = Form.objects.get(uuid=user_uuid)
+        user = Form.objects.for_listing().get(uuid=user_uuid)
         
         # Get referral data with time-based analysis
         from datetime import datetime, timedelta
@@ -406,15 +620,15 @@ def referral_analytics(request, user_uuid):
         last_month = today - timedelta(days=30)
         
         # Get recent referrals (limited to 10 for analytics)
-        recent_referrals_queryset = user.referrals.all().order_by('-created_at')[:10]
-        recent_referrals_data = []
-        for referred_user in recent_referrals_queryset:
-            recent_referrals_data.append({
-                "uuid": referred_user.uuid,
-                "full_name": referred_user.full_name,
-                "email": referred_user.email,
-                "referred_date": referred_user.created_at
-            })
+        recent_referrals_queryset = user.referrals.values(
+            'uuid', 'full_name', 'email', 'created_at'
+        ).order_by('-created_at')[:10]
+        recent_referrals_data = [{
+            "uuid": row['uuid'],
+            "full_name": row['full_name'],
+            "email": row['email'],
+            "referred_date": row['created_at']
+        } for row in recent_referrals_queryset]
         
         total_referrals = user.referrals.count()
         
@@ -434,6 +648,7 @@ def referral_analytics(request, user_uuid):
                 "last_7_days": user.referrals.filter(created_at__date__gte=last_week).count(),
                 "last_30_days": user.referrals.filter(created_at__date__gte=last_month).count(),
             },
+            "click_stats": click_stats(user, total_referrals),
             "monthly_breakdown": [
                 {
                     "month": item['month'].strftime('%Y-%m'),
@@ -461,6 +676,165 @@ def referral_analytics(request, user_uuid):
         }, status=status.HTTP_404_NOT_FOUND)
 
 
+# ✅ Dense referral / click time series for growth charts
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def referral_timeseries(request, user_uuid):
+    """
+    Dense referral and click counts per day, week or month.
+    Query params: interval=day|week|month, start/end=YYYY-MM-DD, metric=referrals|clicks (repeatable).
+    Empty periods are included as 0.
+    """
+    interval = request.GET.get('interval', 'day')
+    metrics = request.GET.getlist('metric') or [UserSeries.REFERRALS, UserSeries.CLICKS]
+    valid_metrics = [choice for choice, _ in UserSeries.METRIC_CHOICES]
+    if interval not in INTERVALS or not set(metrics) <= set(valid_metrics):
+        return Response({
+            "code": 400,
+            "message": f"interval must be one of {', '.join(INTERVALS)}; metric one of {', '.join(valid_metrics)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    first, last = default_range(interval)
+    try:
+        if request.GET.get('end'):
+            last = date.fromisoformat(request.GET['end'])
+            first, _ = default_range(interval, today=last)
+        if request.GET.get('start'):
+            first = date.fromisoformat(request.GET['start'])
+    except ValueError:
+        return Response({
+            "code": 400,
+            "message": "start and end must be YYYY-MM-DD dates"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= (last - first).days < MAX_DAYS:
+        return Response({
+            "code": 400,
+            "message": f"start must be on or before end and at most {MAX_DAYS} days apart"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = Form.objects.filter(uuid=user_uuid).values_list('id', flat=True).first()
+    if user_id is None:
+        return Response({
+            "code": 404,
+            "message": "User not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    labels, series = get_series(user_id, metrics, interval, first, last)
+    return Response({
+        "code": 200,
+        "message": "Referral time series fetched successfully",
+        "data": {
+            "interval": interval,
+            "start": first,
+            "end": last,
+            "labels": labels,
+            "series": series,
+        }
+    })
+
+
+# ✅ Delta sync of referrals, addresses and seller records
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def user_sync(request, user_uuid):
+    """
+    Rows created, updated or deleted since ?cursor= (0 or absent: everything).
+    Keep the returned cursor and call again while has_more is true.
+    Query params: cursor, limit (default SYNC_PAGE_SIZE, max SYNC_MAX_PAGE_SIZE).
+    """
+    try:
+        cursor = int(request.GET.get('cursor') or 0)
+        limit = int(request.GET.get('limit') or settings.SYNC_PAGE_SIZE)
+    except ValueError:
+        cursor = limit = -1
+    if cursor < 0 or not 0 < limit <= settings.SYNC_MAX_PAGE_SIZE:
+        return Response({
+            "code": 400,
+            "message": f"cursor must be a non-negative integer and limit between 1 and {settings.SYNC_MAX_PAGE_SIZE}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    user_id = Form.objects.filter(uuid=user_uuid).values_list('id', flat=True).first()
+    if user_id is None:
+        return Response({
+            "code": 404,
+            "message": "User not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        data = sync_payload(user_id, cursor, limit, request)
+    except CursorExpired:
+        return Response({
+            "code": 410,
+            "message": "Cursor has expired; sync again from cursor 0"
+        }, status=status.HTTP_410_GONE)
+    return Response({
+        "code": 200,
+        "message": "Changes fetched successfully",
+        "data": data
+    })
+
+
+# ✅ Top referrer leaderboards
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def referral_leaderboard(request):
+    """
+    Top referrers for window=total|7d|30d, limit (max 100) and offset.
+    """
+    window = request.GET.get('window', 'total')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        limit = offset = None
+    if window not in WINDOWS or limit is None:
+        return Response({
+            "code": 400,
+            "message": f"window must be one of {', '.join(WINDOWS)}; limit and offset must be integers"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    entries, size = get_leaderboard().top(window, limit, offset)
+    users = Form.objects.only('uuid', 'full_name', 'referral_code').in_bulk([user_id for user_id, _ in entries])
+    return Response({
+        "code": 200,
+        "message": "Leaderboard fetched successfully",
+        "data": [
+            {
+                "rank": offset + position,
+                "uuid": users[user_id].uuid,
+                "full_name": users[user_id].full_name,
+                "referral_code": users[user_id].referral_code,
+                "referrals": score,
+            }
+            for position, (user_id, score) in enumerate(entries, start=1)
+            if user_id in users
+        ],
+        "window": window,
+        "total_ranked": size,
+    })
+
+
+# ✅ A user's rank on every leaderboard
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def user_leaderboard_rank(request, user_uuid):
+    user_id = Form.objects.filter(uuid=user_uuid).values_list('id', flat=True).first()
+    if user_id is None:
+        return Response({
+            "code": 404,
+            "message": "User not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        "code": 200,
+        "message": "Leaderboard rank fetched successfully",
+        "data": {
+            window: {"rank": rank[0], "referrals": rank[1]} if rank else None
+            for window, rank in get_leaderboard().ranks(user_id).items()
+        }
+    })
+
+
 # ✅ Search Referred Users with Pagination
 class SearchReferredUsersView(generics.ListAPIView):
     """
@@ -469,14 +843,18 @@ class SearchReferredUsersView(generics.ListAPIView):
     pagination_class = CustomPagination
     permission_classes = [AllowAny]
     
+    def get_referrer(self):
+        if not hasattr(self, '_referrer'):
+            self._referrer = Form.objects.for_listing().get(uuid=self.kwargs.get('user_uuid'))
+        return self._referrer
+
     def get_queryset(self):
-        user_uuid = self.kwargs.get('user_uuid')
         search_query = self.request.query_params.get('q', '')
         
         try:
-            user = Form.objects.get(uuid=user_uuid)
+            user = self.get_referrer()
             if search_query:
-                return user.referrals.filter(
+                return user.referrals.referral_rows().filter(
                     models.Q(full_name__icontains=search_query) |
                     models.Q(last_name__icontains=search_query) |
                     models.Q(email__icontains=search_query)
@@ -489,29 +867,20 @@ class SearchReferredUsersView(generics.ListAPIView):
     def get_serializer(self, *args, **kwargs):
         # Custom serializer for search results
         class SearchResultSerializer:
-            def __init__(self, instance, many=False):
+            def __init__(self, instance, many=False, referrer_name=None):
                 self.instance = instance
                 self.many = many
+                self.referrer_name = referrer_name
             
             @property
             def data(self):
                 if self.many:
-                    return [self._serialize_user(user) for user in self.instance]
+                    return [serialize_referral_row(row, self.referrer_name) for row in self.instance]
                 else:
-                    return self._serialize_user(self.instance)
-            
-            def _serialize_user(self, user):
-                return {
-                    "uuid": user.uuid,
-                    "full_name": user.full_name,
-                    "last_name": user.last_name,
-                    "email": user.email,
-                    "phone_number": user.phone_number,
-                    "gender": user.gender,
-                    "referred_date": user.created_at,
-                    "referrer_name": user.referred_by.full_name if user.referred_by else None
-                }
+                    return serialize_referral_row(self.instance, self.referrer_name)
         
+        # Every row is a referral of the same user, so the name is shared
+        kwargs.setdefault('referrer_name', self.get_referrer().full_name)
         return SearchResultSerializer(*args, **kwargs)
     
     def list(self, request, *args, **kwargs):
@@ -527,7 +896,7 @@ class SearchReferredUsersView(generics.ListAPIView):
         
         # Validate user exists
         try:
-            user = Form.objects.get(uuid=user_uuid)
+            user = self.get_referrer()
         except Form.DoesNotExist:
             return Response({
                 "code": 404,
@@ -566,12 +935,13 @@ class SearchReferredUsersView(generics.ListAPIView):
 # ✅ Function-based search (keeping original function name for URLs)
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@throttle_classes([IPThrottle, UserUUIDThrottle])
 def search_referred_users(request, user_uuid):
     """
     Alternative function-based search with manual pagination.
     """
     try:
-        user = Form.objects.get(uuid=user_uuid)
+        user = Form.objects.for_listing().get(uuid=user_uuid)
         search_query = request.GET.get('q', '')
         
         if not search_query:
@@ -585,7 +955,7 @@ def search_referred_users(request, user_uuid):
         limit = int(request.GET.get('limit', 10))
         
         # Search in referred users
-        referred_users = user.referrals.filter(
+        referred_users = user.referrals.referral_rows().filter(
             models.Q(full_name__icontains=search_query) |
             models.Q(last_name__icontains=search_query) |
             models.Q(email__icontains=search_query)
@@ -598,18 +968,9 @@ def search_referred_users(request, user_uuid):
         paginated_users = referred_users[start_index:end_index]
         
         # Serialize search results
-        search_results = []
-        for referred_user in paginated_users:
-            search_results.append({
-                "uuid": referred_user.uuid,
-                "full_name": referred_user.full_name,
-                "last_name": referred_user.last_name,
-                "email": referred_user.email,
-                "phone_number": referred_user.phone_number,
-                "gender": referred_user.gender,
-                "referred_date": referred_user.created_at,
-                "referrer_name": user.full_name
-            })
+        search_results = [
+            serialize_referral_row(row, user.full_name) for row in paginated_users
+        ]
         
         # Calculate pagination info
         total_pages = (total_count + limit - 1) // limit
@@ -656,10 +1017,11 @@ class AddressListCreateView(generics.ListCreateAPIView):
     """
     Create and list addresses with user details and pagination.
     """
-    queryset = Address.objects.all().select_related('user').order_by('-id')
+    queryset = Address.objects.for_listing().order_by('-id')
     serializer_class = AddressSerializer
     pagination_class = CustomPagination
     permission_classes = [AllowAny]
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -669,22 +1031,89 @@ class AddressListCreateView(generics.ListCreateAPIView):
         if user_uuid:
             queryset = queryset.filter(user__uuid=user_uuid)
         
-        # Add search functionality
-        search_query = self.request.query_params.get('search')
+        # Exact place filters and prefix search, both on the indexed *_key columns
+        params = self.request.query_params
+        queryset = queryset.in_place(
+            country=params.get('country'), state=params.get('state'), city=params.get('city'), pin=params.get('pin'),
+        )
+        search_query = params.get('search')
         if search_query:
-            queryset = queryset.filter(
-                models.Q(address_line1__icontains=search_query) |
-                models.Q(address_line2__icontains=search_query) |
-                models.Q(city__icontains=search_query) |
-                models.Q(state__icontains=search_query) |
-                models.Q(user__full_name__icontains=search_query) |
-                models.Q(user__email__icontains=search_query)
-            )
+            queryset = queryset.search(search_query)
         
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # Read path uses the fast serializer over plain tuples
+        columns = FastAddressSerializer.columns_for(requested_fieldset(request))
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*columns)
+        page = self.paginate_queryset(queryset)
+        context = self.get_serializer_context()
+
+        if page is not None:
+            serializer = FastAddressSerializer(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = FastAddressSerializer(queryset, many=True, context=context)
+        return Response(serializer.data)
+
+
+# ✅ Address counts per country / state / city
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def address_regions(request):
+    """
+    Precomputed address counts for shipping-region dashboards, largest first.
+    Query params: level=country|state|city (default country), country, state, limit (max 1000).
+    """
+    level = request.GET.get('level', AddressRegionCount.COUNTRY)
+    try:
+        limit = int(request.GET.get('limit', 100))
+    except ValueError:
+        limit = 0
+    if level not in REGION_LEVELS or not 0 < limit <= 1000:
+        return Response({
+            "code": 400,
+            "message": f"level must be one of {', '.join(REGION_LEVELS)} and limit between 1 and 1000"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "code": 200,
+        "message": "Address regions fetched successfully",
+        "data": region_counts(level, request.GET.get('country'), request.GET.get('state'), limit)
+    })
+
+
+# ✅ Bulk address import (upsert)
+class AddressImportView(APIView):
+    """
+    Import addresses from a CSV or JSON Lines request body, upserting on the
+    normalized address key. The body is read as a stream and the response is
+    a JSON Lines file with one result per input row (see form.imports).
+    POST /addresses/import/?type=csv|jsonl (default from Content-Type); staff only
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        file_format = request.query_params.get('type')
+        if file_format is None:
+            file_format = 'csv' if 'csv' in request.content_type else 'jsonl'
+        try:
+            # The raw request stream, not request.data: rows are parsed as they are imported
+            rows = read_rows(iter(request._request), file_format)
+        except (ImportFormatError, csv.Error) as exc:
+            return Response({
+                "code": 400,
+                "message": str(exc)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return json_lines_response(import_addresses(rows), filename='address-import-results.jsonl')
+
+
+def address_version(request, pk):
+    # The embedded user info changes with the owner's row
+    return Address.objects.filter(pk=pk).values_list(Greatest('updated_at', 'user__updated_at')).first()
+
 
 # ✅ Address Detail View (Retrieve, Update, Delete)
+@method_decorator(conditional(address_version), name='get')
 class AddressDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update, or delete an address.
@@ -693,6 +1122,9 @@ class AddressDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AddressSerializer
     permission_classes = [AllowAny]
 
+    def get_queryset(self):
+        return AddressSerializer.project(super().get_queryset(), requested_fieldset(self.request))
+
 
 # ✅ User's Addresses List (Paginated)
 class UserAddressListView(generics.ListAPIView):
@@ -706,8 +1138,9 @@ class UserAddressListView(generics.ListAPIView):
     def get_queryset(self):
         user_uuid = self.kwargs.get('user_uuid')
         try:
-            user = Form.objects.get(uuid=user_uuid)
-            return Address.objects.filter(user=user).order_by('-id')
+            user = Form.objects.only('id').get(uuid=user_uuid)
+            queryset = Address.objects.for_listing().filter(user=user).order_by('-id')
+            return AddressSerializer.project(queryset, requested_fieldset(self.request))
         except Form.DoesNotExist:
             return Address.objects.none()
     
@@ -715,7 +1148,7 @@ class UserAddressListView(generics.ListAPIView):
         user_uuid = self.kwargs.get('user_uuid')
         
         try:
-            user = Form.objects.get(uuid=user_uuid)
+            user = Form.objects.for_listing().get(uuid=user_uuid)
         except Form.DoesNotExist:
             return Response({
                 "code": 404,
@@ -821,6 +1254,12 @@ class UserAddressListView(generics.ListAPIView):
 
 
 
+def user_detail_version(request, user_uuid):
+    # Form.updated_at is bumped by address and referral changes as well
+    return Form.objects.filter(uuid=user_uuid).values_list('updated_at').first()
+
+
+@method_decorator(conditional(user_detail_version), name='get')
 class UserFullDetailView(APIView):
     """
     Return full user details by UUID:
@@ -834,51 +1273,25 @@ class UserFullDetailView(APIView):
 
     def get(self, request, user_uuid):
         try:
-            user = Form.objects.get(uuid=user_uuid)
+            user = Form.objects.for_listing().get(uuid=user_uuid)
 
             # 🟢 Referral stats
             total_referrals = user.referrals.count()
-            referral_code = user.referral_code
-            referral_link = user.get_referral_link()
-            unique_link = user.get_unique_link()
-            qr_code_url = f"http://127.0.0.1:8000/media/qr_codes/{referral_code}_qr.png"
 
             # 🟢 Addresses
-            addresses = Address.objects.filter(user=user).order_by('-id')
+            addresses = Address.objects.for_listing().filter(user=user).order_by('-id')
             address_data = AddressSerializer(addresses, many=True).data
 
             # 🟢 Recent referrals (last 5)
-            recent_referrals = user.referrals.all().order_by('-created_at')[:5]
-            recent_referral_data = [{
-                "uuid": r.uuid,
-                "full_name": r.full_name,
-                "email": r.email,
-                "created_at": r.created_at,
-            } for r in recent_referrals]
+            recent_referral_data = list(
+                user.referrals.values(*RECENT_REFERRAL_FIELDS).order_by('-created_at')[:RECENT_REFERRALS]
+            )
 
             # 🟢 Full response
             return Response({
                 "code": 200,
                 "message": "User full details fetched successfully",
-                "data": {
-                    "uuid": str(user.uuid),
-                    "full_name": user.full_name,
-                    "last_name": user.last_name,
-                    "email": user.email,
-                    "phone_number": user.phone_number,
-                    "gender": user.gender,
-                    "created_at": user.created_at,
-                    "referral": {
-                        "referral_code": referral_code,
-                        "referral_link": referral_link,
-                        "unique_link": unique_link,
-                        "qr_code_url": qr_code_url,
-                        "total_referrals": total_referrals,
-                        "recent_referrals": recent_referral_data
-                    },
-                    "addresses": address_data,
-                    "total_addresses": len(address_data)
-                }
+                "data": serialize_user_detail(user, total_referrals, recent_referral_data, address_data)
             })
 
         except Form.DoesNotExist:
@@ -886,3 +1299,125 @@ class UserFullDetailView(APIView):
                 "code": 404,
                 "message": "User not found"
             }, status=status.HTTP_404_NOT_FOUND)
+
+
+# ✅ Batch user lookup
+class UserBatchDetailView(APIView):
+    """
+    Full details for many users in one call, in a fixed number of queries.
+    POST {"uuids": [...]} (or GET ?uuids=a,b,c), at most BATCH_LOOKUP_MAX UUIDs.
+    Returns a map keyed by UUID plus per-UUID errors for invalid or unknown ones.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        raw = request.query_params.get('uuids', '')
+        return self.lookup([value for value in raw.split(',') if value])
+
+    def post(self, request):
+        uuids = request.data.get('uuids') if isinstance(request.data, dict) else None
+        if not isinstance(uuids, list):
+            return Response({
+                "code": 400,
+                "message": "Body must be {\"uuids\": [...]}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        return self.lookup(uuids)
+
+    def lookup(self, values):
+        if not values or len(values) > BATCH_LOOKUP_MAX:
+            return Response({
+                "code": 400,
+                "message": f"Provide between 1 and {BATCH_LOOKUP_MAX} UUIDs"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = {}
+        wanted = {}
+        for value in values:
+            try:
+                wanted[str(uuid.UUID(str(value)))] = None
+            except ValueError:
+                errors[str(value)] = "Invalid UUID"
+
+        users = {str(user.uuid): user for user in Form.objects.for_listing().filter(uuid__in=list(wanted))}
+        by_id = {user.id: user for user in users.values()}
+        ids = list(by_id)
+
+        referral_counts = dict(
+            Form.objects.filter(referred_by__in=ids).values_list('referred_by').annotate(n=Count('id')).order_by()
+        )
+
+        recent = defaultdict(list)
+        recent_rows = (
+            Form.objects.filter(referred_by__in=ids)
+            .annotate(position=Window(RowNumber(), partition_by=F('referred_by'), order_by=F('created_at').desc()))
+            .filter(position__lte=RECENT_REFERRALS)
+            .values('referred_by', 'position', *RECENT_REFERRAL_FIELDS)
+        )
+        for row in sorted(recent_rows, key=itemgetter('position')):
+            referrer_id = row.pop('referred_by')
+            row.pop('position')
+            recent[referrer_id].append(row)
+
+        addresses = defaultdict(list)
+        for address in Address.objects.filter(user__in=ids).only('user', *AddressQuerySet.ADDRESS_FIELDS).order_by('-id'):
+            address.user = by_id[address.user_id]  # owner is already loaded
+            addresses[address.user_id].append(address)
+
+        data = {}
+        for key in wanted:
+            user = users.get(key)
+            if user is None:
+                errors[key] = "User not found"
+                continue
+            address_data = AddressSerializer(addresses[user.id], many=True).data
+            data[key] = serialize_user_detail(
+                user, referral_counts.get(user.id, 0), recent[user.id], address_data,
+            )
+
+        return Response({
+            "code": 200,
+            "message": "Users fetched successfully",
+            "data": data,
+            "errors": errors,
+            "found": len(data),
+            "requested": len(values),
+        })
+
+
+# ✅ Streaming CSV / JSON Lines export
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, dataset, user_uuid=None):
+    """
+    Stream a whole dataset as a file download (staff only: it includes
+    every user's email and phone number).
+    GET /export/<dataset>/?type=csv|jsonl&compress=gzip
+    GET /export/referrals/<user_uuid>/?type=csv|jsonl&compress=gzip
+    """
+    file_format = request.query_params.get('type', 'csv')
+    if dataset not in EXPORT_DATASETS or (dataset == 'referrals') != (user_uuid is not None):
+        return Response({
+            "code": 404,
+            "message": "Unknown export"
+        }, status=status.HTTP_404_NOT_FOUND)
+    if file_format not in EXPORT_FORMATS:
+        return Response({
+            "code": 400,
+            "message": f"Invalid type. Choose one of: {', '.join(EXPORT_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        chunks, filename, content_type = stream_export(
+            dataset, file_format,
+            compress=request.query_params.get('compress') == 'gzip',
+            user_uuid=user_uuid,
+        )
+    except Form.DoesNotExist:
+        return Response({
+            "code": 404,
+            "message": "User not found"
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
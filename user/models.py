@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
 import uuid
-from form.models import Form  # Consider renaming 'form' to 'Form' for clarity
+from form.models import ChangeLogged, ChangeLogEntry, Form, OutboxEvent, log_deletion  # Consider renaming 'form' to 'Form' for clarity
 
 
 
@@ -8,13 +9,32 @@ from form.models import Form  # Consider renaming 'form' to 'Form' for clarity
 # Category model (for multi-select)
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            SellerDetailsForm.log_changes(self.sellers.all())  # sellers embed the category name
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            seller_ids = list(self.sellers.values_list('id', flat=True))
+            result = super().delete(*args, **kwargs)
+            SellerDetailsForm.log_changes(SellerDetailsForm.objects.filter(id__in=seller_ids))
+            return result
 
     def __str__(self):
         return self.name
 
 
 # SellerDetailsForm model with ManyToMany category
-class SellerDetailsForm(models.Model):
+class SellerDetailsForm(ChangeLogged):
+    sync_kind = ChangeLogEntry.SELLER
+    sync_owner = 'user_id'
+    outbox_topic = 'seller'
+    outbox_fields = ('user', 'store_name', 'inventory_estimate', 'specialization', 'created_at')
+    outbox_prefetch = ('categories',)
+
     user = models.ForeignKey(Form, on_delete=models.CASCADE, related_name='seller_details')
     store_name = models.CharField(max_length=255)
 
@@ -28,8 +48,31 @@ class SellerDetailsForm(models.Model):
 
     specialization = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # seller_details_by_user: WHERE user_id = ? ORDER BY created_at DESC
+            models.Index(fields=['user', '-created_at'], name='seller_user_created_idx'),
+            # SellerDetailsListCreateView: ORDER BY created_at DESC LIMIT n
+            models.Index(fields=['-created_at'], name='seller_created_at_idx'),
+        ]
+
+    @classmethod
+    def log_changes(cls, queryset):
+        """Log and publish sellers whose categories changed (bypasses save())."""
+        sellers = list(queryset.prefetch_related(*cls.outbox_prefetch))
+        for seller in sellers:
+            ChangeLogEntry.record(seller.user_id, cls.sync_kind, seller.id)
+        OutboxEvent.emit_many(sellers, OutboxEvent.UPDATED)
+
+    def outbox_payload(self):
+        payload = super().outbox_payload()
+        payload['categories'] = [{'id': category.id, 'name': category.name} for category in self.categories.all()]
+        return payload
 
     def __str__(self):
         return f"{self.store_name} - {self.user.full_name}"
 
 
+post_delete.connect(log_deletion, sender=SellerDetailsForm)
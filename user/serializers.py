@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import SellerDetailsForm, Category
 from form.models import Form
@@ -65,6 +66,8 @@ class SellerDetailsFormSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("One or more category IDs do not exist.")
         return value
 
+    # ✅ Atomic so the sync log entry and outbox event commit together with the categories
+    @transaction.atomic
     def create(self, validated_data):
         category_ids = validated_data.pop('category_ids', [])
         user = validated_data.pop('user_uuid')
@@ -77,9 +80,11 @@ class SellerDetailsFormSerializer(serializers.ModelSerializer):
         if category_ids:
             categories = Category.objects.filter(id__in=category_ids)
             seller.categories.set(categories)
+            SellerDetailsForm.log_changes(SellerDetailsForm.objects.filter(pk=seller.pk))
         
         return seller
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         category_ids = validated_data.pop('category_ids', None)
         user = validated_data.pop('user_uuid', None)
@@ -93,5 +98,6 @@ class SellerDetailsFormSerializer(serializers.ModelSerializer):
         if category_ids is not None:
             categories = Category.objects.filter(id__in=category_ids)
             instance.categories.set(categories)
+            SellerDetailsForm.log_changes(SellerDetailsForm.objects.filter(pk=instance.pk))
 
         return instance
\ No newline at end of file
@@ -13,6 +13,13 @@ from .models import SellerDetailsForm, Form
 from .serializers import SellerDetailsFormSerializer
 from rest_framework.response import Response
 from rest_framework import status
+from django.db.models import Count, Max
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.decorators import method_decorator
+from cards.conditional import conditional
+from cards.renderers import (
+    FAST_RENDERER_CLASSES, STREAMING_RENDERER_CLASSES, json_lines_response, wants_json_lines,
+)
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
@@ -46,6 +53,7 @@ class SellerDetailsListCreateView(generics.ListCreateAPIView):
     queryset = SellerDetailsForm.objects.all().order_by('-created_at')
     serializer_class = SellerDetailsFormSerializer
     pagination_class = CustomPagination
+    renderer_classes = FAST_RENDERER_CLASSES
     
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -57,6 +65,18 @@ class SellerDetailsListCreateView(generics.ListCreateAPIView):
             "data": serializer.data
         }, status=status.HTTP_201_CREATED)
 
+def seller_version(request, id):
+    # Category renames show up through the newest category timestamp,
+    # removals through the count
+    return (
+        SellerDetailsForm.objects.filter(id=id)
+        .annotate(categories_updated=Max('categories__updated_at'), category_count=Count('categories'))
+        .values_list(Greatest('updated_at', Coalesce('categories_updated', 'updated_at')), 'category_count')
+        .first()
+    )
+
+
+@method_decorator(conditional(seller_version), name='get')
 class SellerDetailsDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Retrieve seller details by ID
@@ -98,6 +118,16 @@ class SellerDetailsDetailView(generics.RetrieveUpdateDestroyAPIView):
 
 # ==================== CATEGORY APIs ====================
 
+def category_list_version(request):
+    stats = Category.objects.aggregate(last=Max('updated_at'), count=Count('id'))
+    return stats['last'], stats['count']
+
+
+def category_version(request, id):
+    return Category.objects.filter(id=id).values_list('updated_at').first()
+
+
+@method_decorator(conditional(category_list_version), name='get')
 class CategoryListCreateView(generics.ListCreateAPIView):
     """
     GET: List all categories
@@ -105,9 +135,13 @@ class CategoryListCreateView(generics.ListCreateAPIView):
     """
     queryset = Category.objects.all().order_by('name')
     serializer_class = CategorySerializer
+    renderer_classes = STREAMING_RENDERER_CLASSES
     
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        # ?stream=jsonl streams rows instead of building one big list
+        if wants_json_lines(request):
+            return json_lines_response(queryset.values('id', 'name').iterator(chunk_size=2000))
         serializer = self.get_serializer(queryset, many=True)
         return Response({
             "code": 200,
@@ -125,6 +159,7 @@ class CategoryListCreateView(generics.ListCreateAPIView):
             "data": serializer.data
         }, status=status.HTTP_201_CREATED)
 
+@method_decorator(conditional(category_version), name='get')
 class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET: Retrieve category by ID